@@ -0,0 +1,51 @@
+import threading
+from functools import lru_cache
+
+# Tuned for Lambda: fail fast on connect, keep pooled connections alive
+# between warm invocations, and leave room for parallel tool/batch threads.
+BASE_CONFIG = {
+    "connect_timeout": 2,
+    "read_timeout": 10,
+    "max_pool_connections": 32,
+    "tcp_keepalive": True,
+    "retries": {"mode": "standard", "max_attempts": 3},
+}
+SERVICE_CONFIG = {
+    "bedrock-runtime": {"read_timeout": 60},  # model responses can be slow
+}
+
+
+def config_for(service: str):
+    from botocore.config import Config
+    return Config(**{**BASE_CONFIG, **SERVICE_CONFIG.get(service, {})})
+
+
+@lru_cache(maxsize=None)
+def client(service: str, region_name: str = None):
+    """boto3 client built on first use and reused across warm invocations."""
+    import boto3  # deferred: keeps module import (cold start) cheap
+    return boto3.client(service, region_name=region_name, config=config_for(service))
+
+
+@lru_cache(maxsize=None)
+def resource(service: str, region_name: str = None):
+    import boto3
+    return boto3.resource(service, region_name=region_name, config=config_for(service))
+
+
+class Lazy:
+    """Stands in for a client until its first attribute access, then builds it once."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        obj = self._obj
+        if obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+                obj = self._obj
+        return getattr(obj, name)
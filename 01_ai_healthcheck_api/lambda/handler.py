@@ -1,16 +1,20 @@
 import os
 import json
 import uuid
-import boto3
 
-# Only load dotenv locally
+from clients import Lazy, resource
+
+# Only load dotenv locally (never shipped to Lambda)
 if os.getenv("AWS_EXECUTION_ENV") is None:
-    from dotenv import load_dotenv
-    load_dotenv()
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
 
-dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION", "us-east-1"))
 table_name = os.environ["RESULTS_TABLE"]
-table = dynamodb.Table(table_name)
+# Built on first use, reused across warm invocations
+table = Lazy(lambda: resource("dynamodb", os.getenv("AWS_REGION", "us-east-1")).Table(table_name))
 
 def handler(event, context):
     body = json.loads(event.get("body", "{}"))
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+current_dir = Path(__file__).resolve().parent
+lambda_dir = current_dir.parent / "lambda"
+sys.path.append(str(current_dir.parent.parent))  # repo root, for utils
+
+from utils.importtime import assert_import_budget
+
+
+def test_handler_import_time_within_budget():
+    """Profiles `python -X importtime` as Lambda would run it (no dotenv)."""
+    assert_import_budget("handler", lambda_dir, budget_ms=60,
+                         env={"AWS_EXECUTION_ENV": "AWS_Lambda_python3.11", "RESULTS_TABLE": "AIHealthcheckResults"})
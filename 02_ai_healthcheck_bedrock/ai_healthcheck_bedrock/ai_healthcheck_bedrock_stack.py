@@ -1,11 +1,14 @@
 from aws_cdk import (
     Stack,
     RemovalPolicy,
+    Duration,
     aws_lambda as _lambda,
     aws_apigateway as apigw,
     aws_dynamodb as dynamodb,
     aws_iam as iam,
     aws_logs as logs,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_events,
 )
 from constructs import Construct
 from utils.outputs import standard_outputs
@@ -24,6 +27,15 @@ class AiHealthcheckBedrockStack(Stack):
         )
         
       
+        # Async scoring queue; failed messages land in the DLQ after 3 attempts
+        dlq = sqs.Queue(self, "AIHealthcheckDLQ", removal_policy=RemovalPolicy.DESTROY)
+        queue = sqs.Queue(
+            self, "AIHealthcheckQueue",
+            visibility_timeout=Duration.seconds(360),  # 6x the function timeout
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=dlq),
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
         log_group = logs.LogGroup(
             self, "HealthcheckLogGroup",
             log_group_name="/aws/lambda/ai-healthcheck-lambda-bedrock",
@@ -38,11 +50,14 @@ class AiHealthcheckBedrockStack(Stack):
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="handler.handler",
             code=_lambda.Code.from_asset("lambda"),
+            timeout=Duration.seconds(60),  # room for /analyze/batch
             environment={
                 "RESULTS_TABLE": table.table_name,
                 "MODEL_ID": "amazon.titan-text-lite-v1",
                 "REGION": "us-east-1",
                 "USE_MOCK_BEDROCK": "false",
+                "QUEUE_URL": queue.queue_url,
+                "DLQ_ARN": dlq.queue_arn,
             },
             log_group=log_group,
             
@@ -51,7 +66,20 @@ class AiHealthcheckBedrockStack(Stack):
        
 
         # Permissions
-        table.grant_write_data(fn)
+        table.grant_read_write_data(fn)
+        queue.grant_send_messages(fn)
+
+        # Worker mode: Lambda scales pollers with queue depth, capped to protect Bedrock
+        fn.add_event_source(lambda_events.SqsEventSource(
+            queue,
+            batch_size=10,
+            max_batching_window=Duration.seconds(5),
+            report_batch_item_failures=True,
+            max_concurrency=10,
+        ))
+        # Dead-lettered messages are recorded as failed so GET /analyze/{id} stops returning 202
+        fn.add_event_source(lambda_events.SqsEventSource(dlq, batch_size=10, report_batch_item_failures=True))
+
         fn.add_to_role_policy(
             iam.PolicyStatement(actions=["bedrock:InvokeModel"], resources=["*"])
         )
@@ -67,6 +95,9 @@ class AiHealthcheckBedrockStack(Stack):
         
         analyze = api.root.add_resource("analyze")
         analyze.add_method("POST")
+        analyze.add_resource("batch").add_method("POST")  # POST /analyze/batch
+        analyze.add_resource("async").add_method("POST")  # POST /analyze/async -> 202 + id
+        analyze.add_resource("{id}").add_method("GET")  # GET /analyze/{id}
         
          # ✅ Add a clean, stable output
         standard_outputs(self, api=api, lambda_fn=fn, table=table)
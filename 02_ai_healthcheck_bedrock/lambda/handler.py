@@ -1,32 +1,199 @@
-import os, json, uuid, boto3
+import os, json, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import Lazy, client, resource
+from metrics import metrics
+from resilience import CircuitBreaker, Resilient, TokenBucket, Unavailable
 
 region = os.getenv("REGION", "us-east-1")
 table_name = os.environ["RESULTS_TABLE"]
 model_id = os.getenv("MODEL_ID", "amazon.titan-text-lite-v1")
 use_mock = os.getenv("USE_MOCK_BEDROCK", "false").lower() == "true"
+batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+bedrock_rps = float(os.getenv("BEDROCK_RPS", "10"))  # client-side limit per container; 0 disables
+batch_budget_s = float(os.getenv("BATCH_BUDGET_SECONDS", "25"))  # under API Gateway's 29 s integration limit
+bedrock_call_s = float(os.getenv("BEDROCK_CALL_SECONDS", "1"))  # typical scoring latency
+# Largest batch that scores within the budget at the concurrency and rate limit above
+batch_rate = min(batch_concurrency / bedrock_call_s, bedrock_rps or float("inf"))
+max_batch_size = int(os.getenv("MAX_BATCH_SIZE") or batch_rate * batch_budget_s)
+queue_url = os.getenv("QUEUE_URL")
+dlq_arn = os.getenv("DLQ_ARN")  # messages from here have exhausted their retries
 
-dynamodb = boto3.resource("dynamodb", region_name=region)
-table = dynamodb.Table(table_name)
-bedrock = boto3.client("bedrock-runtime", region_name=region)
+# Built on first use, reused across warm invocations
+table = Lazy(lambda: resource("dynamodb", region).Table(table_name))
+bedrock = Lazy(lambda: client("bedrock-runtime", region))
+# Retries with jittered backoff, rate limit and circuit breaker for Bedrock
+bedrock_guard = Resilient(
+    "bedrock",
+    bucket=TokenBucket(bedrock_rps, 2 * bedrock_rps) if bedrock_rps > 0 else None,
+    breaker=CircuitBreaker(threshold=5, reset_after=10.0),
+)
+sqs = Lazy(lambda: client("sqs", region))
 
-def handler(event, context):
-    body = json.loads(event.get("body", "{}"))
-    text = body.get("text", "")
-    print(f"Text received: {text}")
 
+def analyze(text):
     if use_mock:
-        sentiment = "positive" if "good" in text.lower() else "neutral"
-    else:
-        payload = json.dumps({"inputText": text})
-        response = bedrock.invoke_model(modelId=model_id, body=payload)
+        return "positive" if "good" in text.lower() else "neutral"
+    payload = json.dumps({"inputText": text})
+    with metrics.timer("BedrockLatency", Model=model_id):
+        response = bedrock_guard.call(bedrock.invoke_model, modelId=model_id, body=payload)
         model_output = json.loads(response["body"].read())
-        sentiment = model_output.get("results", [{}])[0].get("outputText", "")
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    tokens_in = headers.get("x-amzn-bedrock-input-token-count") or model_output.get("inputTextTokenCount")
+    tokens_out = headers.get("x-amzn-bedrock-output-token-count") or model_output.get("results", [{}])[0].get("tokenCount")
+    if tokens_in:
+        metrics.put("InputTokens", int(tokens_in), "Count", Model=model_id)
+    if tokens_out:
+        metrics.put("OutputTokens", int(tokens_out), "Count", Model=model_id)
+    return model_output.get("results", [{}])[0].get("outputText", "")
+
 
-    record = {
+def build_record(text, sentiment):
+    return {
         "id": str(uuid.uuid4()),
         "text": text,
         "sentiment": sentiment,
         "model": model_id,
     }
-    table.put_item(Item=record)
+
+
+@metrics.flushed
+def handler(event, context):
+    if event.get("Records"):
+        return worker(event)
+    if event.get("resource") == "/analyze/batch":
+        return batch_handler(event)
+    if event.get("resource") == "/analyze/async":
+        return enqueue_handler(event)
+    if event.get("resource") == "/analyze/{id}":
+        return result_handler(event)
+
+    body = json.loads(event.get("body", "{}"))
+    text = body.get("text", "")
+    print(f"Text received: {text}")
+
+    try:
+        sentiment = analyze(text)
+    except Unavailable as e:
+        return {"statusCode": 503, "headers": {"Retry-After": "10"}, "body": json.dumps({"error": str(e)})}
+    record = build_record(text, sentiment)
+    with metrics.timer("DynamoWriteLatency", Operation="PutItem"):
+        table.put_item(Item=record)
     return {"statusCode": 200, "body": json.dumps(record)}
+
+
+def batch_handler(event):
+    """
+    POST /analyze/batch with {"texts": [...]}.
+    Scores texts with bounded concurrency and writes all records through one
+    batch writer; failures are reported per item instead of failing the call.
+    """
+    body = json.loads(event.get("body") or "{}")
+    texts = body.get("texts")
+    if not isinstance(texts, list) or not texts:
+        return {"statusCode": 400, "body": json.dumps({"error": "'texts' must be a non-empty list"})}
+    if len(texts) > max_batch_size:
+        return {"statusCode": 400, "body": json.dumps({"error": f"At most {max_batch_size} texts per batch"})}
+    if not all(isinstance(t, str) for t in texts):
+        return {"statusCode": 400, "body": json.dumps({"error": "'texts' must contain only strings"})}
+    print(f"Batch received: {len(texts)} texts")
+
+    def score(text):
+        try:
+            return build_record(text, analyze(text)), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=batch_concurrency) as pool:
+        scored = list(pool.map(score, texts))
+
+    results = []
+    with metrics.timer("DynamoWriteLatency", Operation="BatchWriteItem"), table.batch_writer() as writer:
+        for index, (record, error) in enumerate(scored):
+            if error:
+                results.append({"index": index, "status": "error", "error": error})
+                continue
+            writer.put_item(Item=record)
+            results.append({"index": index, "status": "ok", **record})
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"succeeded": len(results) - failed, "failed": failed, "results": results}),
+    }
+
+
+def enqueue_handler(event):
+    """POST /analyze/async: queues the text and returns 202 with the record id to poll."""
+    body = json.loads(event.get("body") or "{}")
+    text = body.get("text", "")
+    record_id = str(uuid.uuid4())
+    # Placeholder first, so polling can tell a queued id from one that was never enqueued
+    table.put_item(Item={"id": record_id, "status": "queued"})
+    sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({"id": record_id, "text": text}))
+    print(f"Queued {record_id}")
+    return {"statusCode": 202, "body": json.dumps({"id": record_id, "status": "queued"})}
+
+
+def result_handler(event):
+    """
+    GET /analyze/{id}: returns the scored record, 202 while it is still queued,
+    the failure record once retries are exhausted, or 404 for unknown ids.
+    """
+    record_id = (event.get("pathParameters") or {}).get("id")
+    item = table.get_item(Key={"id": record_id}).get("Item")
+    if not item:
+        return {"statusCode": 404, "body": json.dumps({"id": record_id, "error": "Unknown id"})}
+    if item.get("status") == "queued":
+        return {"statusCode": 202, "body": json.dumps({"id": record_id, "status": "pending"})}
+    return {"statusCode": 200, "body": json.dumps(item)}
+
+
+def record_failure(record_id):
+    """Marks a dead-lettered id as failed, unless it was scored after all (e.g. a redelivery)."""
+    try:
+        table.put_item(
+            Item={"id": record_id, "status": "failed", "error": "Retries exhausted"},
+            ConditionExpression="attribute_not_exists(#id) OR #s = :queued",
+            ExpressionAttributeNames={"#id": "id", "#s": "status"},
+            ExpressionAttributeValues={":queued": "queued"},
+        )
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        print(f"Dead letter for {record_id} ignored: already scored")
+
+
+def worker(event):
+    """
+    SQS worker: scores every message in the batch and writes the results in bulk.
+    Failed messages are returned as batchItemFailures so only they are retried;
+    messages arriving from the DLQ are recorded as failed so pollers stop waiting.
+    """
+    print(f"Worker received {len(event['Records'])} messages")
+    failures, scored = [], []
+    for message in event["Records"]:
+        try:
+            job = json.loads(message["body"])
+            if dlq_arn and message.get("eventSourceARN") == dlq_arn:
+                record_failure(job["id"])
+                continue
+            record = build_record(job.get("text", ""), analyze(job.get("text", "")))
+            record["id"] = job.get("id") or record["id"]
+            scored.append((message["messageId"], record))
+        except Exception as e:
+            print(f"Message {message['messageId']} failed: {e}")
+            failures.append(message["messageId"])
+
+    try:
+        # Redelivered duplicates in one batch keep the last write instead of failing the batch
+        with metrics.timer("DynamoWriteLatency", Operation="BatchWriteItem"), \
+                table.batch_writer(overwrite_by_pkeys=["id"]) as writer:
+            for _, record in scored:
+                writer.put_item(Item=record)
+    except Exception as e:
+        # Records are keyed by their queued id, so a retry simply overwrites.
+        print(f"Batch write failed: {e}")
+        failures.extend(message_id for message_id, _ in scored)
+
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
@@ -0,0 +1,84 @@
+import functools, json, os, sys, threading, time
+from contextlib import contextmanager
+
+# CloudWatch Embedded Metric Format: values are buffered in memory and written
+# as one JSON log line per dimension set when the invocation flushes.
+# CloudWatch extracts the metrics from those lines; no PutMetricData calls.
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "AwsBlueprints")
+MAX_VALUES = 100  # EMF limit of values per metric in one record
+
+
+class Metrics:
+    """Thread-safe buffer of metric values, keyed by name and dimensions."""
+
+    def __init__(self, namespace: str = NAMESPACE, out=None):
+        self.namespace = namespace
+        self.out = out
+        self._lock = threading.Lock()
+        self._values = {}  # (dimensions, name) -> (unit, [values])
+
+    def put(self, name: str, value, unit: str = "Milliseconds", **dimensions):
+        key = (tuple(sorted(dimensions.items())), name)
+        with self._lock:
+            self._values.setdefault(key, (unit, []))[1].append(value)
+
+    @contextmanager
+    def timer(self, name: str, **dimensions):
+        """Records the block's wall time in milliseconds, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(name, round((time.perf_counter() - start) * 1000, 3), **dimensions)
+
+    def flush(self):
+        """Writes the buffered values as EMF lines and clears the buffer. Returns the records."""
+        with self._lock:
+            values, self._values = self._values, {}
+        if not values:
+            return []
+
+        groups = {}
+        for (dimensions, name), (unit, points) in values.items():
+            groups.setdefault(dimensions, []).append((name, unit, points))
+
+        service = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+        timestamp = int(time.time() * 1000)
+        records = []
+        for dimensions, metrics in groups.items():
+            for offset in range(0, max(len(p) for _, _, p in metrics), MAX_VALUES):
+                chunk = [(n, u, p[offset:offset + MAX_VALUES]) for n, u, p in metrics if p[offset:offset + MAX_VALUES]]
+                record = {
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [{
+                            "Namespace": self.namespace,
+                            "Dimensions": [["Service"] + [k for k, _ in dimensions]],
+                            "Metrics": [{"Name": n, "Unit": u} for n, u, _ in chunk],
+                        }],
+                    },
+                    "Service": service,
+                    **dict(dimensions),
+                    **{n: p if len(p) > 1 else p[0] for n, _, p in chunk},
+                }
+                records.append(record)
+
+        # EMF must be a bare JSON line, so bypass the logging prefix
+        out = self.out or sys.stdout
+        for record in records:
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        out.flush()
+        return records
+
+    def flushed(self, fn):
+        """Decorator for Lambda handlers: flush once per invocation, however it ends."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.flush()
+        return wrapper
+
+
+metrics = Metrics()
@@ -22,7 +22,24 @@ def test_resources_created():
     template.resource_count_is("AWS::Lambda::Function", 1)
     template.resource_count_is("AWS::DynamoDB::Table", 1)
     template.resource_count_is("AWS::ApiGateway::RestApi", 1)
-    
-    
-    
 
+def test_batch_route_created():
+    app = core.App()
+    stack = AiHealthcheckBedrockStack(app, "TestAIHealthcheckBedrockStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "batch"})
+    template.has_resource_properties("AWS::Lambda::Function", {"Timeout": 60})
+
+def test_async_worker_wired_to_queue():
+    app = core.App()
+    stack = AiHealthcheckBedrockStack(app, "TestAIHealthcheckBedrockStack")
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::SQS::Queue", 2)
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 10,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        "ScalingConfig": {"MaximumConcurrency": 10},
+    })
+    # The DLQ is consumed too, to record failed ids for pollers
+    template.resource_count_is("AWS::Lambda::EventSourceMapping", 2)
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "async"})
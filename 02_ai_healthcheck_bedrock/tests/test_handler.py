@@ -0,0 +1,201 @@
+import sys, os, io, json
+from pathlib import Path
+
+# Make the Lambda asset folder importable
+current_dir = Path(__file__).resolve().parent
+lambda_dir = current_dir.parent / "lambda"
+sys.path.append(str(lambda_dir))
+sys.path.append(str(current_dir.parent.parent))  # repo root, for utils
+
+os.environ.setdefault("RESULTS_TABLE", "AIHealthcheckResults")
+
+import handler
+from utils.importtime import assert_import_budget
+
+
+class StubBedrock:
+    """Returns a canned Titan response; texts containing 'throttle' fail."""
+
+    def invoke_model(self, modelId, body):
+        text = json.loads(body)["inputText"]
+        if "throttle" in text:
+            raise RuntimeError("ThrottlingException")
+        output = "positive" if "good" in text else "neutral"
+        return {"body": io.BytesIO(json.dumps({"results": [{"outputText": output}]}).encode())}
+
+
+class StubWriter:
+    """Like boto3's batch writer, rejects repeated keys unless overwrite_by_pkeys is set."""
+
+    def __init__(self, table, overwrite_by_pkeys=None):
+        self.table, self.dedupe, self.buffer = table, bool(overwrite_by_pkeys), []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.dedupe and len({item["id"] for item in self.buffer}) < len(self.buffer):
+            raise RuntimeError("ValidationException: Provided list of item keys contains duplicates")
+        for item in self.buffer:
+            self.table.put_item(Item=item)
+        return False
+
+    def put_item(self, Item):
+        if self.dedupe:
+            self.buffer = [item for item in self.buffer if item["id"] != Item["id"]]
+        self.buffer.append(Item)
+
+
+class StubTable:
+    def __init__(self):
+        self.items = []
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None):
+        current = self.get_item({"id": Item["id"]}).get("Item")
+        # Only the dead-letter condition is modelled: attribute_not_exists(#id) OR #s = :queued
+        if ConditionExpression and current and current.get("status") != "queued":
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+        self.items = [item for item in self.items if item["id"] != Item["id"]] + [Item]
+
+    def get_item(self, Key):
+        found = [item for item in self.items if item["id"] == Key["id"]]
+        return {"Item": found[0]} if found else {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return StubWriter(self, overwrite_by_pkeys)
+
+
+def test_batch_reports_partial_failures(monkeypatch):
+    table = StubTable()
+    monkeypatch.setattr(handler, "bedrock", StubBedrock())
+    monkeypatch.setattr(handler, "table", table)
+
+    event = {"resource": "/analyze/batch", "body": json.dumps({"texts": ["good day", "please throttle", "meh"]})}
+    response = handler.handler(event, None)
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+    assert [r["status"] for r in body["results"]] == ["ok", "error", "ok"]
+    assert body["results"][0]["sentiment"] == "positive"
+    assert [item["text"] for item in table.items] == ["good day", "meh"]
+
+
+def test_batch_rejects_empty_payload():
+    response = handler.handler({"resource": "/analyze/batch", "body": json.dumps({"texts": []})}, None)
+    assert response["statusCode"] == 400
+
+
+def test_batch_rejects_non_string_items_and_oversized_batches():
+    mixed = handler.handler({"resource": "/analyze/batch", "body": json.dumps({"texts": ["ok", None, 3]})}, None)
+    assert mixed["statusCode"] == 400
+    # Default cap: 8 concurrent ~1 s calls, limited to 10 rps, for 25 s, so a full batch answers before the 29 s cutoff
+    assert handler.max_batch_size == 200
+    big = handler.handler({"resource": "/analyze/batch", "body": json.dumps({"texts": ["x"] * 201})}, None)
+    assert big["statusCode"] == 400
+
+
+def test_single_text_retries_throttles_and_sheds_load_when_saturated(monkeypatch):
+    from botocore.exceptions import ClientError
+    from resilience import CircuitBreaker, Resilient
+
+    class ThrottledOnce(StubBedrock):
+        calls = 0
+
+        def invoke_model(self, modelId, body):
+            ThrottledOnce.calls += 1
+            if ThrottledOnce.calls == 1:
+                raise ClientError({"Error": {"Code": "ThrottlingException"}}, "InvokeModel")
+            return super().invoke_model(modelId, body)
+
+    table = StubTable()
+    monkeypatch.setattr(handler, "bedrock", ThrottledOnce())
+    monkeypatch.setattr(handler, "table", table)
+    monkeypatch.setattr(handler, "bedrock_guard", Resilient("bedrock", sleep=lambda s: None))
+    event = {"resource": "/analyze", "body": json.dumps({"text": "good support"})}
+    assert handler.handler(event, None)["statusCode"] == 200
+    assert ThrottledOnce.calls == 2 and handler.bedrock_guard.counters["retries"] == 1
+
+    breaker = CircuitBreaker(threshold=1)
+    breaker.failure()
+    monkeypatch.setattr(handler, "bedrock_guard", Resilient("bedrock", breaker=breaker))
+    assert handler.handler(event, None)["statusCode"] == 503
+    assert ThrottledOnce.calls == 2
+
+
+class StubSqs:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        self.messages.append(MessageBody)
+
+
+def sqs_event(*texts):
+    return {"Records": [
+        {"messageId": f"m-{i}", "eventSource": "aws:sqs", "body": json.dumps({"id": f"id-{i}", "text": text})}
+        for i, text in enumerate(texts)
+    ]}
+
+
+def test_worker_reports_only_failed_messages(monkeypatch):
+    table = StubTable()
+    monkeypatch.setattr(handler, "bedrock", StubBedrock())
+    monkeypatch.setattr(handler, "table", table)
+
+    response = handler.handler(sqs_event("good service", "throttle me", "ok"), None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m-1"}]}
+    assert [item["id"] for item in table.items] == ["id-0", "id-2"]
+
+
+def test_async_api_queues_and_polls(monkeypatch):
+    table, queue = StubTable(), StubSqs()
+    monkeypatch.setattr(handler, "bedrock", StubBedrock())
+    monkeypatch.setattr(handler, "table", table)
+    monkeypatch.setattr(handler, "sqs", queue)
+
+    queued = handler.handler({"resource": "/analyze/async", "body": json.dumps({"text": "good"})}, None)
+    record_id = json.loads(queued["body"])["id"]
+    poll = {"resource": "/analyze/{id}", "pathParameters": {"id": record_id}}
+
+    assert queued["statusCode"] == 202
+    assert handler.handler(poll, None)["statusCode"] == 202
+    unknown = {"resource": "/analyze/{id}", "pathParameters": {"id": "never-queued"}}
+    assert handler.handler(unknown, None)["statusCode"] == 404
+
+    message = json.loads(queue.messages[0])
+    handler.handler({"Records": [{"messageId": "m-0", "body": json.dumps(message)}]}, None)
+
+    done = handler.handler(poll, None)
+    assert done["statusCode"] == 200
+    assert json.loads(done["body"])["sentiment"] == "positive"
+
+
+def test_worker_dedupes_redelivered_ids_and_records_dead_letters(monkeypatch):
+    table = StubTable()
+    monkeypatch.setattr(handler, "bedrock", StubBedrock())
+    monkeypatch.setattr(handler, "table", table)
+    monkeypatch.setattr(handler, "dlq_arn", "arn:aws:sqs:us-east-1:123:dlq")
+
+    repeated = sqs_event("good", "good")
+    repeated["Records"][1]["body"] = repeated["Records"][0]["body"]
+    assert handler.handler(repeated, None) == {"batchItemFailures": []}
+    assert [item["id"] for item in table.items] == ["id-0"]
+
+    # A dead letter never overwrites a record that was scored after all
+    dead = sqs_event("good")
+    dead["Records"][0]["eventSourceARN"] = "arn:aws:sqs:us-east-1:123:dlq"
+    assert handler.handler(dead, None) == {"batchItemFailures": []}
+    poll = lambda record_id: handler.handler({"resource": "/analyze/{id}", "pathParameters": {"id": record_id}}, None)
+    assert json.loads(poll("id-0")["body"])["sentiment"] == "positive"
+
+    table.put_item(Item={"id": "id-0", "status": "queued"})
+    assert handler.handler(dead, None) == {"batchItemFailures": []}
+    assert poll("id-0")["statusCode"] == 200 and json.loads(poll("id-0")["body"])["status"] == "failed"
+
+
+def test_handler_import_time_within_budget():
+    """Profiles `python -X importtime`; boto3 must stay out of module import."""
+    assert_import_budget("handler", lambda_dir, budget_ms=80, env={"RESULTS_TABLE": "AIHealthcheckResults"})
@@ -68,6 +68,7 @@ class BedrockContainerStack(Stack):
         
         analyze = api.root.add_resource("analyze")
         analyze.add_method("POST")
+        analyze.add_resource("batch").add_method("POST")  # POST /analyze/batch
         
          # ✅ Add a clean, stable output
         standard_outputs(self, api=api, lambda_fn=fn, table=table)
@@ -1,33 +1,114 @@
-import os, json, uuid, boto3
-import numpy as np  # 👈 simulate a heavy dependency
+import os, json, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import Lazy, client, resource
+from metrics import metrics
+from resilience import CircuitBreaker, Resilient, TokenBucket, Unavailable
 
 region = os.getenv("REGION", "us-east-1")
 table_name = os.environ["RESULTS_TABLE"]
 model_id = os.getenv("MODEL_ID", "amazon.titan-text-lite-v1")
 use_mock = os.getenv("USE_MOCK_BEDROCK", "false").lower() == "true"
+batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+bedrock_rps = float(os.getenv("BEDROCK_RPS", "10"))  # client-side limit per container; 0 disables
+batch_budget_s = float(os.getenv("BATCH_BUDGET_SECONDS", "25"))  # under API Gateway's 29 s integration limit
+bedrock_call_s = float(os.getenv("BEDROCK_CALL_SECONDS", "1"))  # typical scoring latency
+# Largest batch that scores within the budget at the concurrency and rate limit above
+batch_rate = min(batch_concurrency / bedrock_call_s, bedrock_rps or float("inf"))
+max_batch_size = int(os.getenv("MAX_BATCH_SIZE") or batch_rate * batch_budget_s)
 
-dynamodb = boto3.resource("dynamodb", region_name=region)
-table = dynamodb.Table(table_name)
-bedrock = boto3.client("bedrock-runtime", region_name=region)
+# Built on first use, reused across warm invocations
+table = Lazy(lambda: resource("dynamodb", region).Table(table_name))
+bedrock = Lazy(lambda: client("bedrock-runtime", region))
+# Retries with jittered backoff, rate limit and circuit breaker for Bedrock
+bedrock_guard = Resilient(
+    "bedrock",
+    bucket=TokenBucket(bedrock_rps, 2 * bedrock_rps) if bedrock_rps > 0 else None,
+    breaker=CircuitBreaker(threshold=5, reset_after=10.0),
+)
 
-def handler(event, context):
-    body = json.loads(event.get("body", "{}"))
-    text = body.get("text", "")
-    print(f"Text received: {text}")
 
+def analyze(text):
     if use_mock:
-        sentiment = "positive" if "good" in text.lower() else "neutral"
-    else:
-        payload = json.dumps({"inputText": text})
-        response = bedrock.invoke_model(modelId=model_id, body=payload)
+        return "positive" if "good" in text.lower() else "neutral"
+    payload = json.dumps({"inputText": text})
+    with metrics.timer("BedrockLatency", Model=model_id):
+        response = bedrock_guard.call(bedrock.invoke_model, modelId=model_id, body=payload)
         model_output = json.loads(response["body"].read())
-        sentiment = model_output.get("results", [{}])[0].get("outputText", "")
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    tokens_in = headers.get("x-amzn-bedrock-input-token-count") or model_output.get("inputTextTokenCount")
+    tokens_out = headers.get("x-amzn-bedrock-output-token-count") or model_output.get("results", [{}])[0].get("tokenCount")
+    if tokens_in:
+        metrics.put("InputTokens", int(tokens_in), "Count", Model=model_id)
+    if tokens_out:
+        metrics.put("OutputTokens", int(tokens_out), "Count", Model=model_id)
+    return model_output.get("results", [{}])[0].get("outputText", "")
+
 
-    record = {
+def build_record(text, sentiment):
+    return {
         "id": str(uuid.uuid4()),
         "text": text,
         "sentiment": sentiment,
         "model": model_id,
     }
-    table.put_item(Item=record)
+
+
+@metrics.flushed
+def handler(event, context):
+    if event.get("resource") == "/analyze/batch":
+        return batch_handler(event)
+
+    body = json.loads(event.get("body", "{}"))
+    text = body.get("text", "")
+    print(f"Text received: {text}")
+
+    try:
+        sentiment = analyze(text)
+    except Unavailable as e:
+        return {"statusCode": 503, "headers": {"Retry-After": "10"}, "body": json.dumps({"error": str(e)})}
+    record = build_record(text, sentiment)
+    with metrics.timer("DynamoWriteLatency", Operation="PutItem"):
+        table.put_item(Item=record)
     return {"statusCode": 200, "body": json.dumps(record)}
+
+
+def batch_handler(event):
+    """
+    POST /analyze/batch with {"texts": [...]}.
+    Scores texts with bounded concurrency and writes all records through one
+    batch writer; failures are reported per item instead of failing the call.
+    """
+    body = json.loads(event.get("body") or "{}")
+    texts = body.get("texts")
+    if not isinstance(texts, list) or not texts:
+        return {"statusCode": 400, "body": json.dumps({"error": "'texts' must be a non-empty list"})}
+    if len(texts) > max_batch_size:
+        return {"statusCode": 400, "body": json.dumps({"error": f"At most {max_batch_size} texts per batch"})}
+    if not all(isinstance(t, str) for t in texts):
+        return {"statusCode": 400, "body": json.dumps({"error": "'texts' must contain only strings"})}
+    print(f"Batch received: {len(texts)} texts")
+
+    def score(text):
+        try:
+            return build_record(text, analyze(text)), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=batch_concurrency) as pool:
+        scored = list(pool.map(score, texts))
+
+    results = []
+    with metrics.timer("DynamoWriteLatency", Operation="BatchWriteItem"), table.batch_writer() as writer:
+        for index, (record, error) in enumerate(scored):
+            if error:
+                results.append({"index": index, "status": "error", "error": error})
+                continue
+            writer.put_item(Item=record)
+            results.append({"index": index, "status": "ok", **record})
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"succeeded": len(results) - failed, "failed": failed, "results": results}),
+    }
@@ -0,0 +1,181 @@
+import logging, random, threading, time
+
+from metrics import metrics
+
+logger = logging.getLogger()
+
+# Error codes that mean "saturated, try again later"; safe to retry because
+# the request was rejected before doing any work.
+THROTTLE_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+}
+# The request may or may not have run; only retried for calls without side effects
+TIMEOUT_ERRORS = {"ReadTimeoutError", "ConnectTimeoutError", "EndpointConnectionError", "ConnectionClosedError"}
+
+
+class Unavailable(Exception):
+    """The dependency is saturated: the call was rejected, or it kept throttling until retries ran out."""
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class RateLimited(Unavailable):
+    pass
+
+
+def is_throttle(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+    return code in THROTTLE_CODES
+
+
+def is_timeout(error: Exception) -> bool:
+    return type(error).__name__ in TIMEOUT_ERRORS
+
+
+class TokenBucket:
+    """Client-side rate limit: `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long to wait before using it (0 = now)."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive saturation failures and rejects calls
+    for `reset_after` seconds. Then one probe call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 10.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probing = 0, None, False
+
+    def failure(self) -> bool:
+        """Records a saturation failure; True if this one tripped the circuit."""
+        with self._lock:
+            self.failures += 1
+            tripped = self._probing or (self.opened_at is None and self.failures >= self.threshold)
+            if tripped:
+                self.opened_at = self.clock()
+            self._probing = False
+            return tripped
+
+
+class Resilient:
+    """
+    Wraps calls to one dependency with rate limiting, a circuit breaker and
+    retries with full-jitter exponential backoff. Throttles are always retried;
+    timeouts only when `retry_timeouts` (calls without side effects).
+    """
+
+    def __init__(self, name: str, retries: int = 3, base_delay: float = 0.2, max_delay: float = 5.0,
+                 bucket: TokenBucket = None, breaker: CircuitBreaker = None, max_wait: float = 2.0,
+                 retry_timeouts: bool = True, sleep=time.sleep):
+        self.name = name
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = bucket
+        self.breaker = breaker or CircuitBreaker()
+        self.max_wait = max_wait
+        self.retry_timeouts = retry_timeouts
+        self.sleep = sleep
+        self.counters = {"calls": 0, "retries": 0, "trips": 0, "rejected": 0, "rate_limited": 0}
+        self._lock = threading.Lock()  # one guard is shared by pool threads, hedges and batch fan-out
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            self._admit()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_throttle(e) or (self.retry_timeouts and is_timeout(e))
+                if not retryable:
+                    self.breaker.success()  # the dependency answered; it is not saturated
+                    raise
+                if self.breaker.failure():
+                    self._count("trips", "CircuitTrips")
+                    logger.warning("Circuit for %s opened after %s", self.name, type(e).__name__)
+                if attempt == self.retries or self.breaker.state == "open":
+                    if is_throttle(e):
+                        raise Unavailable(f"{self.name} is throttling after {attempt + 1} attempts") from e
+                    raise
+                self._count("retries", "Retries")
+                self.sleep(self.backoff(attempt))
+                continue
+            self.breaker.success()
+            return result
+
+    def _admit(self):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected", "CircuitRejected")
+            raise CircuitOpen(f"{self.name} circuit is open")
+        if self.bucket:
+            wait = self.bucket.reserve()
+            if wait > self.max_wait:
+                self.bucket.refund()
+                self._count("rate_limited", "RateLimited")
+                raise RateLimited(f"{self.name} rate limit: would wait {wait:.1f}s")
+            if wait:
+                self.sleep(wait)
+
+    def _count(self, counter: str, metric: str = None):
+        with self._lock:
+            self.counters[counter] += 1
+        if metric:
+            metrics.put(metric, 1, "Count", Dependency=self.name)
@@ -0,0 +1,71 @@
+import sys, os, io, json
+from pathlib import Path
+
+# Make the Lambda asset folder importable
+current_dir = Path(__file__).resolve().parent
+lambda_dir = current_dir.parent / "lambda"
+sys.path.append(str(lambda_dir))
+sys.path.append(str(current_dir.parent.parent))  # repo root, for utils
+
+os.environ.setdefault("RESULTS_TABLE", "AIHealthcheckResults")
+
+import handler
+from utils.importtime import assert_import_budget, import_time_us
+
+
+class StubBedrock:
+    """Returns a canned Titan response; texts containing 'throttle' fail."""
+
+    def invoke_model(self, modelId, body):
+        text = json.loads(body)["inputText"]
+        if "throttle" in text:
+            raise RuntimeError("ThrottlingException")
+        output = "positive" if "good" in text else "neutral"
+        return {"body": io.BytesIO(json.dumps({"results": [{"outputText": output}]}).encode())}
+
+
+class StubTable:
+    def __init__(self):
+        self.items = []
+
+    def batch_writer(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+def test_batch_reports_partial_failures(monkeypatch):
+    table = StubTable()
+    monkeypatch.setattr(handler, "bedrock", StubBedrock())
+    monkeypatch.setattr(handler, "table", table)
+
+    event = {"resource": "/analyze/batch", "body": json.dumps({"texts": ["good day", "please throttle", "meh"]})}
+    body = json.loads(handler.handler(event, None)["body"])
+
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+    assert [r["status"] for r in body["results"]] == ["ok", "error", "ok"]
+    assert [item["text"] for item in table.items] == ["good day", "meh"]
+
+
+def test_batch_rejects_bad_payloads():
+    for texts in ([], ["ok", None], ["x"] * (handler.max_batch_size + 1)):
+        response = handler.handler({"resource": "/analyze/batch", "body": json.dumps({"texts": texts})}, None)
+        assert response["statusCode"] == 400
+
+
+def test_handler_import_time_within_budget():
+    """Profiles `python -X importtime`; no numpy or boto3 at module import."""
+    assert_import_budget("handler", lambda_dir, budget_ms=80, env={"RESULTS_TABLE": "AIHealthcheckResults"})
+
+
+def test_handler_does_not_load_numpy():
+    """Checked on a fresh interpreter; this process may have numpy from other imports."""
+    _, timings = import_time_us("handler", lambda_dir, env={"RESULTS_TABLE": "AIHealthcheckResults"}, runs=1)
+    assert "numpy" not in timings
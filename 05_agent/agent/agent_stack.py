@@ -6,79 +6,301 @@ from aws_cdk import (
     aws_apigateway as apigw,
     aws_dynamodb as ddb,
     aws_iam as iam,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as event_sources,
+    aws_bedrock as bedrock,
+    aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as tasks,
 )
 from constructs import Construct
 
+# (tool name, construct id / function name, handler module in lambda/)
+TOOL_SPECS = [
+    ("get_customer_metrics", "GetMetricsFn", "get_metrics"),
+    ("summarize_metrics", "SummarizeFn", "summarize"),
+    ("send_alert", "SendAlertFn", "send_alert"),
+]
+
+
 class AgentSkeletonStack(Stack):
-    def __init__(self, scope: Construct, id: str, **kwargs):
+    def __init__(self, scope: Construct, id: str, *, all_in_one: bool = False,
+                 local_tools=("summarize_metrics",), engine: str = "prompt", sweep: bool = True,
+                 orchestration: str = "lambda", jobs: bool = True, **kwargs):
+        """
+        all_in_one: run every tool inside the router Lambda (no tool Lambdas).
+        local_tools: tools bound in-process even when all_in_one is off.
+        engine: "prompt" (JSON decisions in model text) or "converse" (native tool use).
+        sweep: add the batch Lambda that runs many agent sessions in one invocation.
+        orchestration: "lambda" (router Lambda runs the loop) or "stepfunctions"
+            (Express state machine calling Bedrock and the tool Lambdas directly).
+        jobs: async sessions ({"async": true}) run from an SQS queue by a worker Lambda.
+        """
         super().__init__(scope, id, **kwargs)
+        if orchestration not in ("lambda", "stepfunctions"):
+            raise ValueError(f"orchestration must be 'lambda' or 'stepfunctions', not {orchestration!r}")
+        if orchestration == "stepfunctions":
+            if all_in_one:
+                raise ValueError("all_in_one needs the router Lambda; use orchestration='lambda'")
+            local_tools = ()  # the state machine can only call tools deployed as Lambdas
 
-        # DynamoDB "memory"
+        # DynamoDB "memory" — one item per session step
         table = ddb.Table(
             self, "AgentMemory",
             partition_key={"name": "session_id", "type": ddb.AttributeType.STRING},
+            sort_key={"name": "step", "type": ddb.AttributeType.NUMBER},
             removal_policy=RemovalPolicy.DESTROY
         )
 
-        # --- Tool Lambdas ---
-        get_metrics = _lambda.Function(
-            self, "GetMetricsFn",
-            function_name="GetMetricsFn",
-            runtime=_lambda.Runtime.PYTHON_3_12,
-            handler="get_metrics.handler",
-            code=_lambda.Code.from_asset("lambda")
+        # Recorded tool sequences per goal template, replayed without the LLM
+        plans = ddb.Table(
+            self, "AgentPlans",
+            partition_key={"name": "template", "type": ddb.AttributeType.STRING},
+            removal_policy=RemovalPolicy.DESTROY
         )
 
-        summarize = _lambda.Function(
-            self, "SummarizeFn",
-            function_name="SummarizeFn",
-            runtime=_lambda.Runtime.PYTHON_3_12,
-            handler="summarize.handler",
-            code=_lambda.Code.from_asset("lambda")
-        )
-        
-        send_alert = _lambda.Function(
-            self, "SendAlertFn",
-            function_name="SendAlertFn",
-            runtime=_lambda.Runtime.PYTHON_3_12,
-            handler="send_alert.handler",
-            code=_lambda.Code.from_asset("lambda")
+        # Results of idempotent tools; DynamoDB TTL removes expired entries
+        tool_cache = ddb.Table(
+            self, "ToolCache",
+            partition_key={"name": "key", "type": ddb.AttributeType.STRING},
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
         )
 
+        # --- Tool Lambdas (or in-process bindings) ---
+        tools, tool_fns, tool_fn_by_name = {}, [], {}
+        for tool_name, fn_id, module in TOOL_SPECS:
+            if all_in_one or tool_name in local_tools:
+                tools[tool_name] = f"local:{module}"
+                continue
+            fn = _lambda.Function(
+                self, fn_id,
+                function_name=fn_id,
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler=f"{module}.handler",
+                code=_lambda.Code.from_asset("lambda"),
+                environment={"LOG_LEVEL": "INFO"}  # send_alert's log line is the alert
+            )
+            tools[tool_name] = fn.function_arn
+            tool_fns.append(fn)
+            tool_fn_by_name[tool_name] = fn
+
        # --- Agent Router Lambda ---
-        router = _lambda.Function(
-            self, "AgentRouterFn",
+        agent_env = {
+            "TABLE_NAME": table.table_name,
+            "PLAN_TABLE": plans.table_name,
+            "TOOL_CACHE_TABLE": tool_cache.table_name,
+            "BEDROCK_MODEL_ID": "anthropic.claude-3-sonnet-20240229-v1:0",
+            # Routine routing steps; Sonnet still writes final answers and fixes bad output
+            "BEDROCK_FAST_MODEL_ID": "anthropic.claude-3-haiku-20240307-v1:0",
+            "BEDROCK_STREAMING": "true",
+            "TOOLS": json.dumps(tools),
+            "AGENT_ENGINE": engine,
+        }
+        agent_fns = []
+        if orchestration == "lambda":
+            router_env = dict(agent_env)
+            if jobs:
+                # Worker runs are not bound by API Gateway's 29 s, so they get longer invocations
+                # Jobs whose worker was killed or kept failing land in the DLQ after 3 receives
+                job_dlq = sqs.Queue(self, "AgentJobsDLQ", retention_period=Duration.days(14))
+                job_queue = sqs.Queue(
+                    self, "AgentJobs",
+                    visibility_timeout=Duration.minutes(30),
+                    dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=job_dlq)
+                )
+                router_env["JOB_QUEUE_URL"] = job_queue.queue_url
+                router_env["JOB_DLQ_ARN"] = job_dlq.queue_arn
+            router = _lambda.Function(
+                self, "AgentRouterFn",
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler="router.handler",
+                code=_lambda.Code.from_asset("lambda"),
+                environment=router_env,
+                timeout=Duration.seconds(30)
+            )
+            agent_fns.append(router)
+
+            # --- Async job worker: same router code, fed by the job queue ---
+            if jobs:
+                worker = _lambda.Function(
+                    self, "AgentWorkerFn",
+                    runtime=_lambda.Runtime.PYTHON_3_12,
+                    handler="router.handler",
+                    code=_lambda.Code.from_asset("lambda"),
+                    environment=router_env,
+                    timeout=Duration.minutes(5)
+                )
+                worker.add_event_source(event_sources.SqsEventSource(job_queue, batch_size=1))
+                # Dead-lettered jobs are consumed too, to mark their sessions failed
+                worker.add_event_source(event_sources.SqsEventSource(job_dlq, batch_size=10))
+                job_queue.grant_send_messages(router)
+                job_queue.grant_send_messages(worker)  # continues sessions stopped at the deadline
+                agent_fns.append(worker)
+
+        # --- Sweep Lambda: many sessions per invocation, sharing pools, rate limit and caches ---
+        if sweep:
+            sweeper = _lambda.Function(
+                self, "AgentSweepFn",
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler="batch.handler",
+                code=_lambda.Code.from_asset("lambda"),
+                environment={
+                    **agent_env,
+                    "SWEEP_CONCURRENCY": "16",
+                    # One limiter for the whole sweep instead of one per concurrent Lambda
+                    "BEDROCK_RPS": "20",
+                    "MAX_TOOL_WORKERS": "32",
+                },
+                memory_size=1024,
+                timeout=Duration.minutes(15)
+            )
+            agent_fns.append(sweeper)
+
+        for fn in agent_fns:
+            table.grant_read_write_data(fn)
+            plans.grant_read_write_data(fn)
+            tool_cache.grant_read_write_data(fn)
+            for tool_fn in tool_fns:
+                tool_fn.grant_invoke(fn)
+
+            # Bedrock invoke permission
+            fn.add_to_role_policy(iam.PolicyStatement(
+                actions=["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
+                resources=["*"]
+            ))
+
+        # API Gateway
+        if orchestration == "stepfunctions":
+            machine = self._express_loop(table, tool_fn_by_name, agent_env["BEDROCK_MODEL_ID"])
+            api = apigw.RestApi(self, "AgentAPI")
+            # StartSyncExecution: API Gateway still cuts the call at 29 s, whatever the
+            # machine's own timeout. Longer sessions belong to the Lambda variant's async jobs.
+            api.root.add_resource("agent").add_method("POST", apigw.StepFunctionsIntegration.start_execution(machine))
+        else:
+            api = apigw.LambdaRestApi(
+                self, "AgentAPI",
+                handler=router,
+                proxy=False
+            )
+            agent = api.root.add_resource("agent")
+            agent.add_method("POST")
+            agent.add_resource("{session_id}").add_method("GET")  # progress: ?since=<step>
+
+    def _express_loop(self, table, tool_fns: dict, model_id: str) -> sfn.StateMachine:
+        """
+        The agent loop as an Express state machine. Bedrock, the tool Lambdas and
+        the session table are called through service integrations, so nothing is
+        billed while a call is in flight; the only Lambda is sfn_steps, which
+        builds prompts and parses decisions.
+        """
+        steps_fn = _lambda.Function(
+            self, "AgentStepsFn",
             runtime=_lambda.Runtime.PYTHON_3_12,
-            handler="router.handler",
+            handler="sfn_steps.handler",
             code=_lambda.Code.from_asset("lambda"),
-            environment={
-                "TABLE_NAME": table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-3-sonnet-20240229-v1:0",
-                "TOOLS": json.dumps({
-                    "get_customer_metrics": get_metrics.function_arn,
-                    "summarize_metrics": summarize.function_arn,
-                    "send_alert": send_alert.function_arn
-                })
+            environment={"BEDROCK_MODEL_ID": model_id},
+            timeout=Duration.seconds(10)
+        )
+
+        def step(state_id: str, task: str):
+            return tasks.LambdaInvoke(
+                self, state_id,
+                lambda_function=steps_fn,
+                payload=sfn.TaskInput.from_object({"task": task, "state": sfn.JsonPath.entire_payload}),
+                payload_response_only=True
+            )
+
+        prepare, decide = step("Prepare", "prepare"), step("Decide", "decide")
+
+        ask_model = tasks.BedrockInvokeModel(
+            self, "AskModel",
+            model=bedrock.FoundationModel.from_foundation_model_id(
+                self, "AgentModel", bedrock.FoundationModelIdentifier(model_id)),
+            body=sfn.TaskInput.from_json_path_at("$.request"),
+            result_selector={"text.$": "$.Body.content[0].text"},
+            result_path="$.model"
+        )
+        ask_model.add_retry(
+            errors=["Bedrock.ThrottlingException", "Bedrock.ServiceUnavailableException",
+                    "Bedrock.ModelTimeoutException"],
+            interval=Duration.seconds(1), backoff_rate=2, max_attempts=3,
+            jitter_strategy=sfn.JitterType.FULL
+        )
+
+        # One branch per deployed tool; rejected calls and tool failures become error results
+        pick_tool = sfn.Choice(self, "PickTool").when(
+            sfn.Condition.is_present("$.error"),
+            sfn.Pass(self, "Rejected", parameters={"error.$": "$.error"})
+        )
+        for tool_name, fn in tool_fns.items():
+            run = tasks.LambdaInvoke(
+                self, f"Run-{tool_name}",
+                lambda_function=fn,
+                input_path="$.arguments",
+                payload_response_only=True
+            )
+            run.add_catch(
+                sfn.Pass(self, f"Failed-{tool_name}", parameters={"error.$": "$.failure.Cause"}),
+                result_path="$.failure"
+            )
+            pick_tool.when(sfn.Condition.string_equals("$.tool", tool_name), run)
+        pick_tool.otherwise(sfn.Pass(self, "NotDeployed", parameters={"error": "Tool is not deployed"}))
+        run_tools = sfn.Map(self, "RunTools", items_path="$.calls", result_path="$.results")
+        run_tools.item_processor(pick_tool)
+
+        # Same items as SessionLog, so the router Lambda can resume these sessions
+        save_steps = sfn.Map(
+            self, "SaveSteps",
+            items_path="$.entries",
+            item_selector={
+                "session_id.$": "$.session_id",
+                "step.$": "$$.Map.Item.Value.step",
+                "entry.$": "$$.Map.Item.Value.entry",
             },
-            timeout=Duration.seconds(30)
+            result_path=sfn.JsonPath.DISCARD
         )
-        table.grant_read_write_data(router)
-        
-        get_metrics.grant_invoke(router)
-        summarize.grant_invoke(router)
-        send_alert.grant_invoke(router)
-        
-
-        # Bedrock invoke permission
-        router.add_to_role_policy(iam.PolicyStatement(
-            actions=["bedrock:InvokeModel"],
-            resources=["*"]
+        save_steps.item_processor(tasks.DynamoPutItem(
+            self, "SaveStep",
+            table=table,
+            item={
+                "session_id": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.session_id")),
+                "step": tasks.DynamoAttributeValue.number_from_string(sfn.JsonPath.string_at("$.step")),
+                "timestamp": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$$.State.EnteredTime")),
+                "entry": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.entry")),
+            }
         ))
+        save_header = tasks.DynamoPutItem(
+            self, "SaveHeader",
+            table=table,
+            item={
+                "session_id": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.session_id")),
+                "step": tasks.DynamoAttributeValue.number_from_string("0"),
+                "timestamp": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$$.State.EnteredTime")),
+                "last_step": tasks.DynamoAttributeValue.number_from_string(sfn.JsonPath.string_at("$.header.last_step")),
+                "digest": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.header.digest")),
+                "goal": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.goal")),
+                "status": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.header.status")),
+            },
+            result_path=sfn.JsonPath.DISCARD
+        )
+        respond = sfn.Pass(self, "Respond", parameters={
+            "session_id.$": "$.session_id",
+            "result.$": "$.result",
+            "conversation.$": "$.history",
+        })
 
-        # API Gateway
-        api = apigw.LambdaRestApi(
-            self, "AgentAPI",
-            handler=router,
-            proxy=False
+        definition = prepare.next(save_steps).next(
+            sfn.Choice(self, "Done?")
+            .when(sfn.Condition.boolean_equals("$.done", True), save_header.next(respond))
+            .otherwise(ask_model.next(decide).next(
+                sfn.Choice(self, "FinalAnswer?")
+                .when(sfn.Condition.boolean_equals("$.final", True), prepare)
+                .otherwise(run_tools.next(prepare))
+            ))
+        )
+        return sfn.StateMachine(
+            self, "AgentLoop",
+            definition_body=sfn.DefinitionBody.from_chainable(definition),
+            state_machine_type=sfn.StateMachineType.EXPRESS,
+            timeout=Duration.minutes(5)  # direct StartExecution callers; API requests stop at 29 s
         )
-        api.root.add_resource("agent").add_method("POST")
@@ -14,7 +14,16 @@ from agent.agent_stack import AgentSkeletonStack
 
 
 app = cdk.App()
+# `cdk deploy -c all_in_one=true` runs every tool inside the router Lambda
+all_in_one = str(app.node.try_get_context("all_in_one")).lower() == "true"
+# `cdk deploy -c engine=converse` uses native Bedrock tool use instead of JSON-in-text
+engine = app.node.try_get_context("engine") or "prompt"
+# `cdk deploy -c orchestration=stepfunctions` runs the loop as an Express state machine
+orchestration = app.node.try_get_context("orchestration") or "lambda"
 AgentSkeletonStack(app, "AgentSkeletonStack",
+    all_in_one=all_in_one,
+    engine=engine,
+    orchestration=orchestration,
     )
 
 app.synth()
@@ -0,0 +1,104 @@
+import json, logging, os, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import router
+from session_store import SessionLog
+
+logger = logging.getLogger()
+
+SWEEP_CONCURRENCY = int(os.environ.get("SWEEP_CONCURRENCY", "16"))  # agent sessions run at once
+DEFAULT_GOAL = "Analyze customer {customer_id} health"
+RESULT_CHARS = 200  # per-session result kept in the sweep record
+
+
+def sweep_goals(event: dict) -> list:
+    """
+    [(key, goal), ...] from either {"goals": [...]} or
+    {"customer_ids": [...], "goal_template": "... {customer_id} ..."}.
+    """
+    if event.get("goals"):
+        return [(str(i), goal) for i, goal in enumerate(event["goals"])]
+    template = event.get("goal_template") or DEFAULT_GOAL
+    return [(str(c), template.format(customer_id=c)) for c in event.get("customer_ids", [])]
+
+
+def session_status(status_code: int, body: dict) -> str:
+    if status_code == 503:
+        return "paused"  # saturated dependency; resume with the session_id
+    if status_code != 200:
+        return "error"
+    if body.get("partial"):
+        return "partial"  # stopped at the deadline; resume with the session_id
+    conversation = body.get("conversation", [])
+    if any(h.get("warning") for h in conversation):
+        return "incomplete"
+    if any((h.get("decision") or {}).get("tool") == "send_alert" for h in conversation):
+        return "alerted"
+    return "ok"
+
+
+def run_session(key: str, goal: str, context=None) -> dict:
+    """Runs one agent session in-process through the router and keeps a compact record."""
+    start = time.perf_counter()
+    try:
+        response = router.handler({"body": json.dumps({"goal": goal})}, context)
+        body = json.loads(response["body"])
+        status = session_status(response["statusCode"], body)
+    except Exception as e:
+        body, status = {"error": str(e)}, "error"
+    return {
+        "key": key,
+        "session_id": body.get("session_id"),
+        "status": status,
+        "result": str(body.get("result") or body.get("error") or "")[:RESULT_CHARS],
+        "steps": sum(1 for h in body.get("conversation", []) if "step" in h),
+        "ms": round((time.perf_counter() - start) * 1000),
+    }
+
+
+def aggregate(sweep_id: str, records: list, elapsed: float) -> dict:
+    by_status = {}
+    for record in records:
+        by_status[record["status"]] = by_status.get(record["status"], 0) + 1
+    durations = sorted(r["ms"] for r in records) or [0]
+    return {
+        "sweep_id": sweep_id,
+        "sessions": len(records),
+        "by_status": by_status,
+        "p50_ms": durations[len(durations) // 2],
+        "max_ms": durations[-1],
+        "elapsed_s": round(elapsed, 1),
+        "alerted": [r["key"] for r in records if r["status"] == "alerted"],
+        "needs_attention": [
+            {"key": r["key"], "status": r["status"], "session_id": r["session_id"]}
+            for r in records if r["status"] in ("error", "paused", "partial", "incomplete")
+        ],
+    }
+
+
+def handler(event, context):
+    """
+    Portfolio sweep: runs many agent sessions concurrently in one invocation.
+    Sessions share the router's connection pools, Bedrock rate limiter,
+    tool result cache and plan cache. The per-session records are written in
+    bulk as one "sweep-<id>" session in the agent table, and a compact
+    aggregate is returned.
+    """
+    sweep_id = event.get("sweep_id") or str(uuid.uuid4())
+    goals = sweep_goals(event)
+    if not goals:
+        return {"sweep_id": sweep_id, "sessions": 0, "error": "no customer_ids or goals given"}
+    logger.info("Sweep %s: %d sessions, concurrency %d", sweep_id, len(goals), SWEEP_CONCURRENCY)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(SWEEP_CONCURRENCY, len(goals))) as pool:
+        records = list(pool.map(lambda kg: run_session(kg[0], kg[1], context), goals))
+
+    log = SessionLog(router.dynamo, router.TABLE, f"sweep-{sweep_id}", goal=f"sweep of {len(records)} sessions")
+    for record in records:
+        log.append(record)
+    log.close()
+
+    report = aggregate(sweep_id, records, time.perf_counter() - start)
+    logger.info("Sweep %s done: %s", sweep_id, report["by_status"])
+    return report
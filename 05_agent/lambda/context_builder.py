@@ -0,0 +1,80 @@
+import json
+
+from session_store import summarize_entry
+
+CHARS_PER_TOKEN = 4  # rough estimate; good enough to keep prompts bounded
+RECENT_STEPS = 3  # newest steps sent in full, older ones only as digest lines
+MAX_STRING_CHARS = 300
+MAX_LIST_ITEMS = 10
+# Fields tools return that the model never needs to decide the next step
+DROP_FIELDS = {"ResponseMetadata", "trace", "logs", "raw", "debug"}
+
+INSTRUCTIONS = (
+    "If you already have enough data, return a final_answer. "
+    "If uptime < 95% or NPS < 50, send an alert before final_answer. "
+    "If you do not have enough data, select the next most logical tool."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def prune(value, max_string: int = MAX_STRING_CHARS):
+    """Drops unneeded fields and caps long strings and lists in tool results."""
+    if isinstance(value, dict):
+        return {
+            k: prune(v, max_string)
+            for k, v in value.items()
+            if k not in DROP_FIELDS and v is not None
+        }
+    if isinstance(value, list):
+        items = [prune(v, max_string) for v in value[:MAX_LIST_ITEMS]]
+        if len(value) > MAX_LIST_ITEMS:
+            items.append(f"... +{len(value) - MAX_LIST_ITEMS} more")
+        return items
+    if isinstance(value, str) and len(value) > max_string:
+        return value[:max_string] + "..."
+    return value
+
+
+def compact(value, max_string: int = MAX_STRING_CHARS) -> str:
+    return json.dumps(prune(value, max_string), separators=(",", ":"), default=str)
+
+
+def build_context(goal: str, tools: list, history: list, earlier: list, budget: int) -> str:
+    """
+    Builds the per-step prompt within `budget` tokens.
+    The newest steps go in full (pruned, compact JSON). Older steps and the
+    resumed-session summary become a rolling digest. The digest is trimmed
+    oldest-first, then recent steps are demoted to digest lines, until the
+    prompt fits.
+    """
+    header = (
+        f"User goal: {goal}\n"
+        f"Available tools: {compact(list(tools))}\n"
+        f"{INSTRUCTIONS}"
+    )
+    recent = history[-RECENT_STEPS:]
+    older = history[:len(history) - len(recent)]
+    digest = list(earlier) + [summarize_entry(h) for h in older]
+    max_string = MAX_STRING_CHARS
+
+    while True:
+        parts = [header]
+        if digest:
+            parts.append("Earlier steps:\n" + "\n".join(digest))
+        if recent:
+            parts.append("Recent steps:\n" + "\n".join(compact(h, max_string) for h in recent))
+        text = "\n\n".join(parts)
+        if estimate_tokens(text) <= budget:
+            return text
+
+        if len(digest) > 1:
+            digest.pop(0)
+        elif len(recent) > 1:
+            digest = digest + [summarize_entry(recent.pop(0))]
+        elif max_string > 40:
+            max_string //= 2
+        else:
+            return text
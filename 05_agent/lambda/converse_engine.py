@@ -0,0 +1,68 @@
+import json
+
+from context_builder import prune
+
+# Shorter than the prompt engine's: no output-format rules, the API carries the structure
+CONVERSE_SYSTEM_PROMPT = (
+    "You are a reasoning agent working towards the user's goal with the provided tools. "
+    "Call a tool when you need data or an action; independent calls may go in one turn. "
+    "When you have enough information, reply with the final answer as plain text "
+    "(the final_answer is your reply, not a tool)."
+)
+
+
+def decision_from_message(message: dict):
+    """Maps a Converse output message to (decision, toolUseIds) in the router's decision format."""
+    content = message.get("content", [])
+    uses = [block["toolUse"] for block in content if "toolUse" in block]
+    if not uses:
+        text = "".join(block.get("text", "") for block in content).strip()
+        return {"tool": "final_answer", "result": text}, []
+    calls = [{"tool": use["name"], "arguments": use.get("input") or {}} for use in uses]
+    decision = calls[0] if len(calls) == 1 else {"tools": calls}
+    return decision, [use["toolUseId"] for use in uses]
+
+
+def tool_result_block(tool_use_id: str, result):
+    result = prune(result)
+    if isinstance(result, dict):
+        content = [{"json": result}]
+    else:
+        content = [{"text": result if isinstance(result, str) else json.dumps(result, default=str)}]
+    status = "error" if isinstance(result, dict) and "error" in result else "success"
+    return {"toolResult": {"toolUseId": tool_use_id, "content": content, "status": status}}
+
+
+class ConverseSession:
+    """
+    Multi-turn Converse messages for one agent session. Model tool calls
+    come back as toolUse blocks and their results go back as toolResult
+    blocks, so nothing has to be parsed out of free text.
+    """
+
+    def __init__(self, prompt: str):
+        self.messages = [{"role": "user", "content": [{"text": prompt}]}]
+        self._pending = []  # toolUseIds of the last model turn
+
+    def accept(self, message: dict) -> dict:
+        """Takes the model's output message and returns the next decision."""
+        decision, ids = decision_from_message(message)
+        if ids:
+            self.messages.append({"role": "assistant", "content": message.get("content", [])})
+            self._pending = ids
+        return decision
+
+    def observe(self, calls: list, results: list):
+        """Adds a step's results; steps that did not come from the model are added as if it had asked."""
+        ids = self._pending
+        if len(ids) != len(calls):
+            turn = len(self.messages)
+            ids = [f"step-{turn}-{i}" for i in range(len(calls))]
+            self.messages.append({"role": "assistant", "content": [
+                {"toolUse": {"toolUseId": tool_use_id, "name": call["tool"], "input": call["arguments"]}}
+                for tool_use_id, call in zip(ids, calls)
+            ]})
+        self.messages.append({"role": "user", "content": [
+            tool_result_block(tool_use_id, result) for tool_use_id, result in zip(ids, results)
+        ]})
+        self._pending = []
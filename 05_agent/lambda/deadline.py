@@ -0,0 +1,54 @@
+import time
+
+from hedging import LatencyWindow
+
+# Step durations across sessions in this container, for sessions that have
+# not finished a step of their own yet.
+step_window = LatencyWindow()
+
+
+class Deadline:
+    """
+    Decides whether another agent step fits in the invocation's remaining time.
+    The next step is assumed to cost as much as the slowest of the session's
+    recent steps (the container's p90 step, or `default_step_ms`, before the
+    first one), plus `margin_ms` kept for the checkpoint and the response.
+    Without a `remaining_ms` callable every step is allowed.
+    """
+
+    def __init__(self, remaining_ms=None, margin_ms: float = 2000, default_step_ms: float = 5000,
+                 window: LatencyWindow = None, recent: int = 3, clock=time.perf_counter):
+        self.remaining_ms = remaining_ms
+        self.margin_ms = margin_ms
+        self.default_step_ms = default_step_ms
+        self.window = window or step_window
+        self.recent = recent
+        self.clock = clock
+        self._durations = []
+        self._started = None
+
+    @classmethod
+    def from_context(cls, context, **kwargs):
+        """Uses the Lambda context's remaining time; local and test callers pass None."""
+        return cls(getattr(context, "get_remaining_time_in_millis", None), **kwargs)
+
+    def start_step(self):
+        self._started = self.clock()
+
+    def end_step(self):
+        if self._started is None:
+            return
+        ms = (self.clock() - self._started) * 1000
+        self._durations.append(ms)
+        self.window.add(ms)
+        self._started = None
+
+    def estimate_ms(self) -> float:
+        if self._durations:
+            return max(self._durations[-self.recent:])
+        return self.window.percentile(90) or self.default_step_ms
+
+    def allows_step(self) -> bool:
+        if self.remaining_ms is None:
+            return True
+        return self.remaining_ms() - self.margin_ms >= self.estimate_ms()
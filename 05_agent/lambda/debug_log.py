@@ -0,0 +1,69 @@
+import json, logging, os, random, zlib
+from collections import deque
+
+logger = logging.getLogger()
+
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))  # share of sessions that log full payloads
+LOG_PAYLOAD_CHARS = int(os.environ.get("LOG_PAYLOAD_CHARS", "2000"))  # cap per logged payload
+LOG_CAPTURE_ENTRIES = int(os.environ.get("LOG_CAPTURE_ENTRIES", "32"))  # payloads kept for a failure dump
+
+
+class Capped:
+    """
+    Log argument that serializes its payload only when the line is emitted,
+    capped at `limit` characters. Use with %-style logging calls.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = LOG_PAYLOAD_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text)} chars]"
+
+
+def sampled(session_id: str, rate: float) -> bool:
+    """Stable per-session decision, so a resumed session keeps its sampling."""
+    if not session_id:
+        return random.random() < rate
+    return zlib.crc32(session_id.encode()) / 2 ** 32 < rate
+
+
+class SessionDebug:
+    """
+    Per-session payload logging. Sampled sessions log payloads as they happen.
+    Other sessions keep references to their last few payloads (nothing is
+    formatted) and write them only if the session fails.
+    """
+
+    def __init__(self, session_id: str = None, rate: float = None):
+        rate = LOG_SAMPLE_RATE if rate is None else rate
+        self.session_id = session_id
+        self.sampled = sampled(session_id, rate) if rate > 0 else False
+        self.failed = None
+        self._captured = deque(maxlen=LOG_CAPTURE_ENTRIES)
+
+    def payload(self, label: str, value):
+        if self.sampled:
+            logger.info("[DEBUG] %s %s: %s", self.session_id, label, Capped(value))
+        else:
+            self._captured.append((label, value))
+
+    def fail(self, reason: str):
+        """Marks the session failed; the first reason wins."""
+        if self.failed is None:
+            self.failed = reason
+
+    def finish(self):
+        """Dumps captured payloads for a failed, unsampled session."""
+        if self.failed is None or self.sampled:
+            return
+        logger.warning("[DEBUG] %s failed (%s); last %d payloads follow",
+                       self.session_id, self.failed, len(self._captured))
+        for label, value in self._captured:
+            logger.warning("[DEBUG] %s %s: %s", self.session_id, label, Capped(value))
+        self._captured.clear()
@@ -0,0 +1,106 @@
+import threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError, wait
+
+from metrics import metrics
+
+MIN_SAMPLES = 20  # below this the fixed delay is used instead of the percentile
+
+HEDGE_WORKERS = 4
+# Only hedges run here. Losing requests cannot be cancelled (boto3 is blocking),
+# so they finish in the background; when every worker is busy a call is simply
+# not hedged, rather than queueing behind requests that already lost.
+hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS)
+hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+class LatencyWindow:
+    """Sliding window of recent call latencies (ms) for percentile lookups."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self._lock:
+            self._samples.append(ms)
+
+    def percentile(self, pct: float):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class Hedger:
+    """
+    Request hedging: if the primary call has not answered within the
+    `percentile` latency of recent calls (or `min_delay_ms`, whichever is
+    larger), a second request is sent and the first success wins.
+    A percentile of 0 disables hedging; calls then run inline.
+    """
+
+    def __init__(self, percentile: float = 0, min_delay_ms: float = 2000, window: LatencyWindow = None,
+                 pool: ThreadPoolExecutor = None, slots: threading.Semaphore = None):
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.window = window or LatencyWindow()
+        self.pool = pool or hedge_pool
+        self.slots = slots or hedge_slots
+        self.counters = {"hedges": 0, "hedge_wins": 0, "hedges_skipped": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile > 0
+
+    def delay_ms(self) -> float:
+        observed = self.window.percentile(self.percentile)
+        return max(self.min_delay_ms, observed or 0)
+
+    def call(self, primary, hedge):
+        if not self.enabled:
+            return primary()
+
+        # The primary gets its own thread, never a shared pool, so it cannot
+        # queue behind other sessions' calls; the caller waits on it below.
+        start, first = time.perf_counter(), Future()
+
+        def run_primary():
+            try:
+                result = primary()
+            except BaseException as e:
+                first.set_exception(e)
+            else:
+                first.set_result(result)
+            finally:
+                # Every primary latency feeds the window, including ones that lost a race
+                self.window.add((time.perf_counter() - start) * 1000)
+
+        threading.Thread(target=run_primary, daemon=True).start()
+        try:
+            return first.result(timeout=self.delay_ms() / 1000)
+        except TimeoutError:
+            pass
+
+        if not self.slots.acquire(blocking=False):
+            self._count("hedges_skipped", "HedgesSkipped")
+            return first.result()
+        self._count("hedges", "Hedges")
+        second = self.pool.submit(hedge)
+        second.add_done_callback(lambda _: self.slots.release())
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count("hedge_wins", "HedgeWins")
+                    return future.result()
+        return first.result()  # both failed: surface the primary's error
+
+    def _count(self, counter: str, metric: str):
+        with self._lock:
+            self.counters[counter] += 1
+        metrics.put(metric, 1, "Count")
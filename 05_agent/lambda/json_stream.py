@@ -0,0 +1,68 @@
+import json
+
+
+class JsonObjectScanner:
+    """
+    Incrementally finds the first complete top-level JSON object in a text stream.
+    Tracks brace depth outside of string literals, so it can stop as soon as
+    the closing brace arrives instead of waiting for the whole response.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str):
+        """Consumes more text. Returns the first complete JSON object, or None."""
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            self._pos += 1
+
+            if self._start is None:
+                if ch == "{":
+                    self._start, self._depth = self._pos - 1, 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = text[self._start:self._pos]
+                    try:
+                        obj = json.loads(candidate)
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        return obj
+                    # Not a valid object: resume scanning after its opening brace
+                    self._pos, self._start = self._start + 1, None
+        return None
+
+
+def stream_chunk_text(chunk: dict) -> str:
+    """Extracts generated text from one decoded Bedrock stream chunk (Claude 3 or Titan)."""
+    if chunk.get("type") == "content_block_delta":
+        return chunk.get("delta", {}).get("text", "")
+    if "outputText" in chunk:
+        return chunk.get("outputText") or ""
+    if "completion" in chunk:
+        return chunk.get("completion") or ""
+    return ""
@@ -0,0 +1,215 @@
+import json, logging, re, threading
+from collections import OrderedDict
+
+from tool_registry import ToolRegistry
+
+logger = logging.getLogger()
+
+# Numbers and ID-like tokens ("123", "cust-42") become goal parameters
+PARAM_PATTERN = re.compile(r"\b\d[\w-]*\b")
+
+
+def goal_template(goal: str):
+    """Normalizes a goal into (template, params): "Analyze customer 123" -> ("analyze customer {0}", ["123"])."""
+    params = []
+
+    def repl(match):
+        params.append(match.group(0))
+        return "{%d}" % (len(params) - 1)
+
+    template = PARAM_PATTERN.sub(repl, " ".join(goal.split()))
+    return template.lower(), params
+
+
+# ---- Value templating --------------------------------------------------------
+# Recorded values swap goal parameters for {"$param": i} and values that came
+# from an earlier tool result for {"$result": [step, call]}.
+
+def _templatize(value, params, results=(), numbers=False, text=False):
+    for s, step_results in enumerate(results):
+        for c, result in enumerate(step_results):
+            if value == result and isinstance(value, (dict, list)):
+                return {"$result": [s, c]}
+    if isinstance(value, dict):
+        return {k: _templatize(v, params, results, numbers, text) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_templatize(v, params, results, numbers, text) for v in value]
+    if isinstance(value, str) and value in params:
+        return {"$param": params.index(value)}
+    # Results are only compared, so free text may embed parameters too
+    if text and isinstance(value, str):
+        return _template_text(value, params)
+    # Arguments may carry a goal ID as a number ({"customer_id": 123})
+    if numbers and isinstance(value, int) and not isinstance(value, bool) and str(value) in params:
+        return {"$param": params.index(str(value)), "as": "int"}
+    return value
+
+
+def _resolve(value, params, results):
+    if isinstance(value, dict):
+        if "$param" in value and set(value) <= {"$param", "as"}:
+            param = params[value["$param"]]
+            return int(param) if value.get("as") == "int" else param
+        if set(value) == {"$result"}:
+            s, c = value["$result"]
+            return results[s][c]
+        return {k: _resolve(v, params, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, params, results) for v in value]
+    return value
+
+
+def _shape(value):
+    """Structure of a value (keys and types) without its contents."""
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shape(v) for v in value]
+    return type(value).__name__
+
+
+def _fill_text(text: str, params: list) -> str:
+    return re.sub(r"\{\{(\d+)\}\}", lambda m: params[int(m.group(1))], text)
+
+
+def _template_text(text: str, params: list) -> str:
+    for i, param in enumerate(params):
+        # Whole tokens only: "1" must not match inside "99.1" or "cust-1"
+        text = re.sub(rf"(?<![\w.-]){re.escape(param)}(?![\w-]|\.\d)", "{{%d}}" % i, text)
+    return text
+
+
+# ==============================================================================
+#                            RECORDING + REPLAY
+# ==============================================================================
+def build_plan(params: list, steps: list, final_result: str):
+    """
+    Turns a finished session into a replayable plan.
+    `steps` is [(calls, results), ...] in execution order.
+    """
+    plan_steps, seen_results = [], []
+    for calls, results in steps:
+        plan_steps.append({
+            "calls": [
+                {"tool": c["tool"], "arguments": _templatize(c["arguments"], params, seen_results, numbers=True)}
+                for c in calls
+            ],
+            "results": [_templatize(r, params, text=True) for r in results],
+        })
+        seen_results.append(results)
+    return {"steps": plan_steps, "final": _template_text(str(final_result), params)}
+
+
+class PlanReplay:
+    """
+    Replays a recorded plan with new parameters, one step per iteration.
+    Steps without side effects replay while each result keeps the recorded
+    structure. Side-effecting steps and the final answer replay only while
+    every result so far matched exactly. Once the path diverges the replay
+    stops and the router asks Bedrock again.
+    """
+
+    def __init__(self, plan: dict, params: list):
+        self.plan = plan
+        self.params = params
+        self.results = []
+        self.active = True
+        self.exact = True
+
+    @property
+    def completed(self) -> bool:
+        return self.active and len(self.results) == len(self.plan["steps"])
+
+    def next_decision(self):
+        if not self.active:
+            return None
+        index = len(self.results)
+        if index == len(self.plan["steps"]):
+            if self.exact:
+                return {"tool": "final_answer", "result": _fill_text(self.plan["final"], self.params)}
+            self.active = False
+            return None
+
+        step = self.plan["steps"][index]
+        if not self.exact and any(ToolRegistry.has_side_effects(c["tool"]) for c in step["calls"]):
+            self.active = False
+            return None
+        try:
+            calls = [
+                {"tool": c["tool"], "arguments": _resolve(c["arguments"], self.params, self.results)}
+                for c in step["calls"]
+            ]
+        except (IndexError, KeyError, TypeError, ValueError):
+            self.active = False
+            return None
+        if len(calls) == 1:
+            return calls[0]
+        return {"tools": calls}
+
+    def observe(self, results: list):
+        """Checks the results of a replayed step against the recorded ones."""
+        if not self.active:
+            return
+        recorded = self.plan["steps"][len(self.results)]["results"]
+        actual = [_templatize(r, self.params, text=True) for r in results]
+        self.results.append(results)
+        if actual != recorded:
+            self.exact = False
+            if _shape(actual) != _shape(recorded) or any(isinstance(r, dict) and "error" in r for r in results):
+                logger.info("Plan replay left the recorded path; falling back to Bedrock")
+                self.active = False
+
+
+class PlanCache:
+    """Warm-container LRU of plans by goal template, persisted to DynamoDB."""
+
+    def __init__(self, dynamo, table: str, size: int = 128):
+        self.dynamo = dynamo
+        self.table = table
+        self.size = size
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()  # shared by concurrent sessions (sweep, tool threads)
+
+    def get(self, template: str):
+        with self._lock:
+            plan = self._plans.get(template)
+            if plan is not None:
+                self._plans.move_to_end(template)
+                return plan
+        if not self.table:
+            return None
+        try:
+            item = self.dynamo.get_item(TableName=self.table, Key={"template": {"S": template}}).get("Item")
+        except Exception as e:
+            logger.warning(f"Plan lookup failed: {e}")
+            return None
+        if not item:
+            return None
+        plan = json.loads(item["plan"]["S"])
+        self._remember(template, plan)
+        return plan
+
+    def put(self, template: str, plan: dict):
+        self._remember(template, plan)
+        if not self.table:
+            return
+        try:
+            self.dynamo.put_item(
+                TableName=self.table,
+                Item={"template": {"S": template}, "plan": {"S": json.dumps(plan)}},
+            )
+        except Exception as e:
+            logger.warning(f"Plan write failed: {e}")
+
+    def start(self, goal: str):
+        """Returns (template, params, PlanReplay or None) for a new session goal."""
+        template, params = goal_template(goal)
+        plan = self.get(template)
+        return template, params, PlanReplay(plan, params) if plan else None
+
+    def _remember(self, template: str, plan: dict):
+        with self._lock:
+            self._plans[template] = plan
+            self._plans.move_to_end(template)
+            while len(self._plans) > self.size:
+                self._plans.popitem(last=False)
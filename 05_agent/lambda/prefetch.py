@@ -0,0 +1,55 @@
+import logging, re
+
+from metrics import metrics
+from tool_registry import ToolRegistry
+
+logger = logging.getLogger()
+
+CUSTOMER_PATTERN = re.compile(r"\bcustomer\s+([\w-]*\d[\w-]*)", re.IGNORECASE)
+
+
+def predict_call(goal: str, history: list):
+    """
+    Guesses the model's next call from the goal and the last step:
+    no tool step yet and a customer in the goal -> get_customer_metrics,
+    fresh metrics -> summarize_metrics. None when there is no confident guess.
+    """
+    steps = [h for h in history if "step" in h]
+    if not steps:
+        match = CUSTOMER_PATTERN.search(goal)
+        if match:
+            return {"tool": "get_customer_metrics", "arguments": {"customer_id": match.group(1)}}
+        return None
+    last = steps[-1]
+    result = last.get("result")
+    if last["decision"].get("tool") == "get_customer_metrics" and isinstance(result, dict) and "error" not in result:
+        return {"tool": "summarize_metrics", "arguments": {"metrics": result}}
+    return None
+
+
+class Speculation:
+    """
+    A predicted tool call started on `pool` while the model is still deciding.
+    Its result is used only if the model picks exactly that call.
+    """
+
+    def __init__(self, call: dict, future):
+        self.call = call
+        self.future = future
+
+    @classmethod
+    def start(cls, goal: str, history: list, pool, invoke, known):
+        call = predict_call(goal, history)
+        if call is None or call["tool"] not in known or ToolRegistry.has_side_effects(call["tool"]):
+            return None
+        metrics.put("PrefetchStarted", 1, "Count", Tool=call["tool"])
+        return cls(call, pool.submit(invoke, call["tool"], call["arguments"]))
+
+    def claim(self, calls: list):
+        """Returns [result] if `calls` is the predicted call, else None (the guess is discarded)."""
+        if calls != [self.call]:
+            metrics.put("PrefetchMisses", 1, "Count", Tool=self.call["tool"])
+            return None
+        metrics.put("PrefetchHits", 1, "Count", Tool=self.call["tool"])
+        logger.info("Using prefetched %s result", self.call["tool"])
+        return [self.future.result()]
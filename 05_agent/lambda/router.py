@@ -1,29 +1,104 @@
-import boto3, json, os, uuid, logging, traceback, re
-from datetime import datetime
+import json, os, time, uuid, logging, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import Lazy, client
+from metrics import metrics
+from json_stream import JsonObjectScanner, stream_chunk_text
+from session_store import SessionLog, summarize_entry
+from context_builder import build_context
+from tool_registry import TOOL_SCHEMAS, ToolRegistry
+from plan_cache import PlanCache, build_plan
+from tracing import SessionTrace
+from debug_log import Capped, SessionDebug
+from resilience import CircuitBreaker, Resilient, TokenBucket, Unavailable
+from hedging import Hedger
+from converse_engine import CONVERSE_SYSTEM_PROMPT, ConverseSession
+from validation import validate_call
+from tool_cache import ToolResultCache
+from prefetch import Speculation
+from deadline import Deadline
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-# ---- AWS Clients -------------------------------------------------------------
-bedrock = boto3.client("bedrock-runtime")
-dynamo = boto3.client("dynamodb")
-lambda_client = boto3.client("lambda")
+# ---- AWS Clients (built on first use, reused while warm) -------------------
+bedrock = Lazy(lambda: client("bedrock-runtime"))
+dynamo = Lazy(lambda: client("dynamodb"))
+lambda_client = Lazy(lambda: client("lambda"))
+sqs = Lazy(lambda: client("sqs"))
+hedge_bedrock = Lazy(lambda: client("bedrock-runtime", HEDGE_REGION))
 
 # ---- Environment -------------------------------------------------------------
 TABLE = os.environ.get("TABLE_NAME")
 MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
-TOOLS = json.loads(os.environ.get("TOOLS", "{}"))  # e.g. {"get_customer_metrics": "arn:aws:lambda:...", ...}
+FAST_MODEL_ID = os.environ.get("BEDROCK_FAST_MODEL_ID")  # e.g. Claude 3 Haiku or Titan Lite for routine steps
+TOOL_CACHE_TABLE = os.environ.get("TOOL_CACHE_TABLE")
+TOOL_CACHE_TTLS = json.loads(os.environ.get("TOOL_CACHE_TTLS", "null"))  # {"tool": seconds}; unset: defaults, {}: off
+PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "false").lower() == "true"  # predicted tool runs during the model call
+ENGINE = os.environ.get("AGENT_ENGINE", "prompt")  # prompt: JSON decisions in text | converse: native tool use
+TOOLS = json.loads(os.environ.get("TOOLS", "{}"))  # e.g. {"get_customer_metrics": "arn:aws:lambda:...", "summarize_metrics": "local:summarize"}
+MAX_TOOL_WORKERS = int(os.environ.get("MAX_TOOL_WORKERS", "8"))
+STREAMING = os.environ.get("BEDROCK_STREAMING", "false").lower() == "true"
+RESUME_STEPS = int(os.environ.get("RESUME_STEPS", "6"))  # recent steps loaded when resuming
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1200"))
+MAX_ITERATIONS = int(os.environ.get("MAX_ITERATIONS", "8"))  # safety stop per invocation
+DEADLINE_MARGIN_MS = float(os.environ.get("DEADLINE_MARGIN_MS", "2000"))  # kept free for checkpoint + response
+STEP_ESTIMATE_MS = float(os.environ.get("STEP_ESTIMATE_MS", "5000"))  # assumed step cost before any is observed
+JOB_QUEUE_URL = os.environ.get("JOB_QUEUE_URL")  # async sessions; unset disables {"async": true}
+JOB_DLQ_ARN = os.environ.get("JOB_DLQ_ARN")  # records from here mark their session failed
+MAX_JOB_RUNS = int(os.environ.get("MAX_JOB_RUNS", "10"))  # invocations one async session may span
+CONTINUED_STATUSES = {"partial", "incomplete", "paused"}  # async sessions queued again after these
+PROGRESS_PAGE = int(os.environ.get("PROGRESS_PAGE", "50"))  # steps per GET /agent/{session_id}
+PLAN_TABLE = os.environ.get("PLAN_TABLE")
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "128"))
+TRACE_MODE = os.environ.get("TRACE_MODE", "off")  # off | record | replay
+TRACE_DIR = os.environ.get("TRACE_DIR", "/tmp/traces")  # where "record" writes <session_id>.json
+TRACE_FILE = os.environ.get("TRACE_FILE")  # trace to feed back in "replay" mode
+BEDROCK_RPS = float(os.environ.get("BEDROCK_RPS", "10"))  # client-side limit per container; 0 disables
+BEDROCK_RETRIES = int(os.environ.get("BEDROCK_RETRIES", "3"))
+HEDGE_PERCENTILE = float(os.environ.get("BEDROCK_HEDGE_PERCENTILE", "0"))  # e.g. 95; 0 disables hedging
+HEDGE_MIN_MS = float(os.environ.get("BEDROCK_HEDGE_MIN_MS", "2000"))  # never hedge sooner than this
+HEDGE_MODEL_ID = os.environ.get("BEDROCK_HEDGE_MODEL_ID")  # defaults to MODEL_ID
+HEDGE_REGION = os.environ.get("BEDROCK_HEDGE_REGION")  # defaults to the function's Region
+
+SYSTEM_PROMPT = """You are a reasoning agent that decides which tool to call next.
+You must ALWAYS reply in a single line of valid JSON. No code fences, markdown or commentary.
+Valid response formats only:
+{"tool": "<tool_name>", "arguments": {...}}
+or, for several independent calls that do not need each other's results:
+{"tools": [{"tool": "<tool_name>", "arguments": {...}}, ...]}
+or
+{"tool": "final_answer", "result": "<summary>"}"""
+
+# Shared across warm invocations; boto3 clients are thread-safe.
+tool_pool = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS)
+registry = ToolRegistry.from_config(TOOLS, lambda_client)
+plans = PlanCache(dynamo, PLAN_TABLE, PLAN_CACHE_SIZE)
+tool_cache = ToolResultCache(dynamo, TOOL_CACHE_TABLE, TOOL_CACHE_TTLS)
+# One guard per dependency, shared by every session in this container
+bedrock_guard = Resilient(
+    "bedrock",
+    retries=BEDROCK_RETRIES,
+    bucket=TokenBucket(BEDROCK_RPS, 2 * BEDROCK_RPS) if BEDROCK_RPS > 0 else None,
+    breaker=CircuitBreaker(threshold=5, reset_after=10.0),
+)
+# Hedges are opportunistic: no retries, and their own breaker so a fallback
+# Region is not blocked by the primary one being saturated.
+hedge_guard = Resilient("bedrock-hedge", retries=0)
+hedger = Hedger(HEDGE_PERCENTILE, HEDGE_MIN_MS)
+tool_guards = {}
 
 # ==============================================================================
 #                            TOOL INVOCATION LAYER
 # ==============================================================================
 def invoke_tool(tool_name: str, args: dict):
     """
-    Invokes the correct Lambda tool dynamically.
-    Falls back to mock behavior if ARN missing.
+    Invokes the tool through the registry, in-process or as a Lambda.
+    Idempotent tools are served from the result cache while fresh.
+    Falls back to mock behavior if the tool is not configured.
     """
-    if tool_name not in TOOLS:
-        logger.warning(f"No ARN for tool {tool_name}, using mock fallback.")
+    if tool_name not in registry:
+        logger.warning("No binding for tool %s, using mock fallback.", tool_name)
         # ---- Mock fallback for local testing ----
         if tool_name == "get_customer_metrics":
             return {"customer_id": args.get("customer_id", "123"), "uptime": 99.8, "tickets": 2, "nps": 87}
@@ -34,47 +109,70 @@ def invoke_tool(tool_name: str, args: dict):
             return f"Alert sent for customer {args.get('customer_id','123')}."
         return f"Unknown tool {tool_name}"
 
-    target_arn = TOOLS[tool_name]
-    logger.info(f"Invoking Lambda tool {tool_name} ({target_arn}) with args={args}")
     try:
-        response = lambda_client.invoke(
-            FunctionName=target_arn,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(args),
-        )
-        payload = response["Payload"].read()
-        result = json.loads(payload)
-        logger.info(f"Tool {tool_name} result: {result}")
+        hit, result = tool_cache.get(tool_name, args)
+        if hit:
+            return result
+        with metrics.timer("ToolLatency", Tool=tool_name):
+            result = tool_guard(tool_name).call(registry.invoke, tool_name, args)
+        tool_cache.put(tool_name, args, result)
+        logger.debug("Tool %s result: %s", tool_name, Capped(result))
         return result
+    except Unavailable:
+        raise  # saturated tool: the handler pauses the session (503) instead of spending another step
     except Exception as e:
-        logger.error(f"Error invoking tool {tool_name}: {e}", exc_info=True)
+        logger.error("Error invoking tool %s: %s", tool_name, e, exc_info=True)
         return {"error": str(e)}
 
 
-# ==============================================================================
-#                            DYNAMO STATE STORAGE
-# ==============================================================================
-def save_state(session_id, history):
-    if not TABLE:
-        return
-    try:
-        dynamo.put_item(
-            TableName=TABLE,
-            Item={
-                "session_id": {"S": session_id},
-                "timestamp": {"S": datetime.utcnow().isoformat()},
-                "conversation": {"S": json.dumps(history)},
-            },
+def tool_guard(tool_name: str) -> Resilient:
+    """Per-tool guard; timeouts are only retried for tools without side effects."""
+    guard = tool_guards.get(tool_name)
+    if guard is None:
+        guard = tool_guards.setdefault(
+            tool_name,
+            Resilient(f"tool:{tool_name}", retries=2, retry_timeouts=not ToolRegistry.has_side_effects(tool_name)),
         )
-    except Exception as e:
-        logger.warning(f"Dynamo write failed: {e}")
+    return guard
+
+
+def tool_calls(decision: dict):
+    """
+    Normalizes a decision into a list of {"tool", "arguments"} calls.
+    Accepts the single-call form or {"tools": [{...}, ...]} for independent calls.
+    An empty batch becomes one call without a tool, which validation rejects,
+    so the step records an error the model sees instead of doing nothing.
+    """
+    if isinstance(decision.get("tools"), list):
+        calls = decision["tools"] or [{}]
+    else:
+        calls = [decision]
+    return [
+        {"tool": c.get("tool"), "arguments": c.get("arguments") or {}}
+        for c in calls
+        if isinstance(c, dict)
+    ]
+
+
+def invoke_tools(calls: list):
+    """
+    Runs independent tool calls in parallel on the shared pool.
+    Results are returned in the same order as `calls`.
+    """
+    if len(calls) == 1:
+        return [invoke_tool(calls[0]["tool"], calls[0]["arguments"])]
+    futures = [tool_pool.submit(invoke_tool, c["tool"], c["arguments"]) for c in calls]
+    return [f.result() for f in futures]
 
 
 # ==============================================================================
 #                            BEDROCK INVOCATION
 # ==============================================================================
-def call_bedrock(prompt: str, model_id: str, system_prompt: str):
-    """Claude 3 + Titan compatible Bedrock invocation with debug logs."""
+def build_request_body(prompt: str, model_id: str, system_prompt: str):
+    """
+    Claude 3 + Titan compatible request body.
+    Claude gets the system prompt in its own field; other models get it inline.
+    """
     if model_id.startswith("anthropic.claude-3"):
         body = {
             "anthropic_version": "bedrock-2023-05-31",
@@ -87,7 +185,7 @@ def call_bedrock(prompt: str, model_id: str, system_prompt: str):
         }
     elif model_id.startswith("amazon.titan-text"):
         body = {
-            "inputText": prompt,
+            "inputText": f"{system_prompt}\n{prompt}",
             "textGenerationConfig": {
                 "maxTokenCount": 500,
                 "temperature": 0.1,
@@ -95,19 +193,69 @@ def call_bedrock(prompt: str, model_id: str, system_prompt: str):
             },
         }
     else:
-        body = {"inputText": prompt}
+        body = {"inputText": f"{system_prompt}\n{prompt}"}
+    return body
 
-    logger.info(f"[DEBUG] Invoking Bedrock model={model_id}")
-    logger.info(f"[DEBUG] Request body: {json.dumps(body)[:1500]}")
 
-    response = bedrock.invoke_model(
-        modelId=model_id,
-        accept="application/json",
-        contentType="application/json",
-        body=json.dumps(body),
+def token_usage(data: dict, headers: dict = None):
+    """(input_tokens, output_tokens) from Bedrock response headers or a Claude/Titan body."""
+    headers = headers or {}
+    usage = data.get("usage") or data.get("message", {}).get("usage") or {}
+    invocation = data.get("amazon-bedrock-invocationMetrics") or {}
+    tokens_in = (
+        headers.get("x-amzn-bedrock-input-token-count")
+        or usage.get("input_tokens")
+        or usage.get("inputTokens")  # Converse
+        or invocation.get("inputTokenCount")
+        or data.get("inputTextTokenCount")
+    )
+    tokens_out = (
+        headers.get("x-amzn-bedrock-output-token-count")
+        or usage.get("output_tokens")
+        or usage.get("outputTokens")
+        or invocation.get("outputTokenCount")
+        or sum(r.get("tokenCount", 0) for r in data.get("results") or []) or None
+    )
+    return tokens_in, tokens_out
+
+
+def record_tokens(model_id: str, tokens_in, tokens_out):
+    if tokens_in:
+        metrics.put("InputTokens", int(tokens_in), "Count", Model=model_id)
+    if tokens_out:
+        metrics.put("OutputTokens", int(tokens_out), "Count", Model=model_id)
+
+
+def hedge_model(model_id: str) -> str:
+    return HEDGE_MODEL_ID or model_id
+
+
+def call_bedrock(prompt: str, model_id: str, system_prompt: str, debug: SessionDebug = None):
+    """Claude 3 + Titan compatible Bedrock invocation, hedged when enabled."""
+    debug = debug or SessionDebug(rate=0)
+    return hedger.call(
+        lambda: invoke_text(bedrock, bedrock_guard, prompt, model_id, system_prompt, debug),
+        lambda: invoke_text(hedge_bedrock, hedge_guard, prompt, hedge_model(model_id), system_prompt, debug),
     )
-    data = json.loads(response["body"].read())
-    logger.info(f"[DEBUG] Raw Bedrock response: {json.dumps(data)[:2000]}")
+
+
+def invoke_text(runtime, guard: Resilient, prompt: str, model_id: str, system_prompt: str, debug: SessionDebug):
+    """One invoke_model call; payloads go to the session's debug log."""
+    body = build_request_body(prompt, model_id, system_prompt)
+    logger.debug("Invoking Bedrock model=%s", model_id)
+    debug.payload("Request body", body)
+
+    with metrics.timer("BedrockLatency", Model=model_id):
+        response = guard.call(
+            runtime.invoke_model,
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json",
+            body=json.dumps(body),
+        )
+        data = json.loads(response["body"].read())
+    record_tokens(model_id, *token_usage(data, response.get("ResponseMetadata", {}).get("HTTPHeaders")))
+    debug.payload("Raw Bedrock response", data)
 
     try:
         if "content" in data and isinstance(data["content"], list):
@@ -124,102 +272,488 @@ def call_bedrock(prompt: str, model_id: str, system_prompt: str):
         else:
             text_out = json.dumps(data)
     except Exception as e:
-        logger.error(f"[DEBUG] Failed to extract text: {e}")
+        logger.error("Failed to extract model text: %s", e)
         text_out = ""
 
-    logger.info(f"[DEBUG] Extracted model text: {text_out.strip()[:500]}")
     return text_out.strip()
 
 
-# ==============================================================================
-#                            MAIN AGENT HANDLER
-# ==============================================================================
-def handler(event, context):
+def call_bedrock_stream(prompt: str, model_id: str, system_prompt: str, debug: SessionDebug = None):
+    """
+    Streams the model output and stops at the first complete JSON object.
+    Returns (decision, raw_text); decision is None if the stream ended without one.
+    Hedged like call_bedrock: the race is to the first complete decision.
+    """
+    debug = debug or SessionDebug(rate=0)
+    return hedger.call(
+        lambda: invoke_stream(bedrock, bedrock_guard, prompt, model_id, system_prompt, debug),
+        lambda: invoke_stream(hedge_bedrock, hedge_guard, prompt, hedge_model(model_id), system_prompt, debug),
+    )
+
+
+def invoke_stream(runtime, guard: Resilient, prompt: str, model_id: str, system_prompt: str, debug: SessionDebug):
+    body = build_request_body(prompt, model_id, system_prompt)
+    logger.debug("Streaming Bedrock model=%s", model_id)
+    debug.payload("Request body", body)
+
+    start = time.perf_counter()
+    response = guard.call(
+        runtime.invoke_model_with_response_stream,
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+        body=json.dumps(body),
+    )
+    stream = response["body"]
+    scanner, parts = JsonObjectScanner(), []
+    tokens_in = tokens_out = None
     try:
-        body = json.loads(event.get("body", "{}"))
-        goal = body.get("goal", "Analyze customer 123 health")
-        session_id = str(uuid.uuid4())
-        logger.info(f"Session {session_id} start goal={goal}")
+        for event in stream:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            data = json.loads(chunk["bytes"])
+            chunk_in, chunk_out = token_usage(data)
+            tokens_in, tokens_out = chunk_in or tokens_in, chunk_out or tokens_out
+            text = stream_chunk_text(data)
+            parts.append(text)
+            decision = scanner.feed(text)
+            if decision is not None:
+                # Drop the rest of the stream; we already have the decision.
+                return decision, "".join(parts).strip()
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+        # Latency to the decision; output tokens are only known if the stream ran to the end
+        metrics.put("BedrockLatency", round((time.perf_counter() - start) * 1000, 3), Model=model_id)
+        record_tokens(model_id, tokens_in, tokens_out)
+    return None, "".join(parts).strip()
 
-        system_prompt = """
-            You are a reasoning agent that decides which tool to call next.
 
-            You must ALWAYS reply in a single line of valid JSON.
-            Do not include any code fences, text, or explanations before or after.
-            No markdown, no commentary.
+def call_converse(messages: list, model_id: str, debug: SessionDebug = None):
+    """Converse with the registry's tools as toolConfig, hedged like call_bedrock."""
+    debug = debug or SessionDebug(rate=0)
+    return hedger.call(
+        lambda: invoke_converse(bedrock, bedrock_guard, messages, model_id, debug),
+        lambda: invoke_converse(hedge_bedrock, hedge_guard, messages, hedge_model(model_id), debug),
+    )
 
-            Valid response formats only:
-            {"tool": "<tool_name>", "arguments": {...}}
-            or
-            {"tool": "final_answer", "result": "<summary>"}
-            """
 
-        history, iteration, last_result, last_tool = [], 0, None, None
+def invoke_converse(runtime, guard: Resilient, messages: list, model_id: str, debug: SessionDebug):
+    logger.debug("Conversing with model=%s turns=%d", model_id, len(messages))
+    debug.payload("Converse turn", messages[-1])
+    with metrics.timer("BedrockLatency", Model=model_id):
+        response = guard.call(
+            runtime.converse,
+            modelId=model_id,
+            system=[{"text": CONVERSE_SYSTEM_PROMPT}],
+            messages=messages,
+            toolConfig=registry.tool_config(),
+            inferenceConfig={"maxTokens": 500, "temperature": 0.1},
+        )
+    record_tokens(model_id, *token_usage(response))
+    return response
 
-        while True:
-            iteration += 1
 
-            context_snippet = f"""
-                User goal: {goal}
+def converse_decision(conversation: ConverseSession, trace: SessionTrace, debug: SessionDebug):
+    """Next decision from the Converse engine; traces record the output message."""
+    if trace.replaying:
+        output = json.loads(trace.replay_model())
+    else:
+        with trace.phase("model_ms"):
+            response = call_converse(conversation.messages, MODEL_ID, debug)
+        output = {"message": response["output"]["message"], "stopReason": response.get("stopReason")}
+        trace.record_model(json.dumps(output))
+        debug.payload("Converse output", output)
+    if "message" not in output:
+        return output  # recorded cached-plan step
+    with trace.phase("parse_ms"):
+        return conversation.accept(output["message"])
+
+
+def parse_decision(raw_text: str, debug: SessionDebug = None):
+    """Extracts the first JSON object from model text, falling back to a final_answer."""
+    decision = JsonObjectScanner().feed(raw_text)
+    if decision is None:
+        logger.error("JSON parsing failed: no complete JSON object in model output")
+        metrics.put("ParseFailures", 1, "Count")
+        if debug:
+            debug.fail("unparseable model output")
+        return {"tool": "final_answer", "result": f"Bad JSON: {raw_text}"}
+    return decision
+
 
-                Available tools:
-                {json.dumps(list(TOOLS.keys()), indent=2)}
+def is_parse_failure(decision: dict) -> bool:
+    return decision.get("tool") == "final_answer" and str(decision.get("result", "")).startswith("Bad JSON")
 
-                Last tool used: {last_tool or 'None'}
-                Last result: {json.dumps(last_result) if last_result else 'None'}
 
-                Recent conversation:
-                {json.dumps(history[-3:], indent=2)}
+def escalation_reason(decision: dict):
+    """Why a fast-model decision must be redone by the strong model, or None to keep it."""
+    if is_parse_failure(decision):
+        return "parse_failure"
+    if decision.get("tool") == "final_answer":
+        return "final_answer"
+    if not any(c["tool"] for c in tool_calls(decision)):
+        return "no_tool"
+    return None
 
-                If you already have enough data, return a final_answer.
-                If uptime < 95% or NPS < 50, send an alert before final_answer.”
-                If you do not have enough data, select the next most logical tool.
-                """
-            prompt = f"{system_prompt}\n{context_snippet}\nDecide next tool."
 
-            raw_text = call_bedrock(prompt, MODEL_ID, system_prompt).strip()
-            logger.info(f"[DEBUG] Raw model output:\n{raw_text}")
+def next_decision(prompt: str, system_prompt: str, trace: SessionTrace = None, debug: SessionDebug = None):
+    """
+    Asks for the next decision. With FAST_MODEL_ID set, routine routing steps
+    go to the fast model; the strong MODEL_ID redoes the step when the fast
+    output does not parse or when the final answer is being composed.
+    """
+    trace = trace or SessionTrace()
+    debug = debug or SessionDebug(rate=0)
+    if FAST_MODEL_ID and FAST_MODEL_ID != MODEL_ID:
+        decision = ask_model(prompt, FAST_MODEL_ID, system_prompt, trace, debug, strict=False)
+        reason = escalation_reason(decision)
+        if reason is None:
+            return decision
+        logger.info("Escalating step to %s: %s", MODEL_ID, reason)
+        metrics.put("Escalations", 1, "Count", Reason=reason)
+    return ask_model(prompt, MODEL_ID, system_prompt, trace, debug)
+
+
+def ask_model(prompt: str, model_id: str, system_prompt: str, trace: SessionTrace, debug: SessionDebug,
+              strict: bool = True):
+    """
+    One model decision, streaming when enabled. A replaying trace supplies the
+    recorded model text instead of Bedrock. `strict` marks the session failed
+    on unparseable output; off for fast-model attempts that can still escalate.
+    """
+    if trace.replaying:
+        raw_text = trace.replay_model()
+    elif STREAMING:
+        with trace.phase("model_ms"):
+            decision, raw_text = call_bedrock_stream(prompt, model_id, system_prompt, debug)
+        trace.record_model(raw_text)
+        debug.payload("Raw model output", raw_text)
+        if decision is not None:
+            return decision
+    else:
+        with trace.phase("model_ms"):
+            raw_text = call_bedrock(prompt, model_id, system_prompt, debug).strip()
+        trace.record_model(raw_text)
+        debug.payload("Raw model output", raw_text)
+
+    with trace.phase("parse_ms"):
+        return parse_decision(raw_text, debug if strict else None)
+
+
+def start_trace() -> SessionTrace:
+    """Per-session trace for TRACE_MODE; replay loads TRACE_FILE."""
+    if TRACE_MODE == "replay":
+        return SessionTrace.load(TRACE_FILE)
+    return SessionTrace(TRACE_MODE)
+
+
+def check_calls(calls: list, debug: SessionDebug = None):
+    """
+    Validates each call before dispatch and repairs what it can locally.
+    Returns (calls, errors); errors[i] is set for calls that must not run.
+    """
+    known = registry.names() or list(TOOL_SCHEMAS)
+    checked, errors = [], []
+    for call in calls:
+        fixed, notes, error = validate_call(call, known)
+        if notes:
+            metrics.put("DecisionRepairs", len(notes), "Count")
+            logger.info("Repaired %s call: %s", fixed.get("tool"), "; ".join(notes))
+        if error:
+            metrics.put("InvalidDecisions", 1, "Count")
+            logger.warning("Rejected call %s: %s", call.get("tool"), error)
+            if debug:
+                debug.payload("Rejected call", call)
+        checked.append(fixed)
+        errors.append(error)
+    return checked, errors
+
+
+def run_calls(calls: list, trace: SessionTrace, debug: SessionDebug = None, speculation: Speculation = None):
+    """Checks, then dispatches the valid calls; invalid ones get a targeted error result."""
+    calls, errors = check_calls(calls, debug)
+    results = iter(dispatch([c for c, e in zip(calls, errors) if e is None], trace, speculation))
+    return calls, [{"error": e} if e else next(results) for e in errors]
+
+
+def dispatch(calls: list, trace: SessionTrace, speculation: Speculation = None):
+    """
+    Runs the calls, or hands back the recorded results when replaying.
+    A matching speculative prefetch supplies the result instead of a new call.
+    """
+    if trace.replaying:
+        return trace.replay_tools(calls)
+    results = speculation.claim(calls) if speculation else None
+    if results is None:
+        results = invoke_tools(calls)
+    trace.record_tools(calls, results)
+    return results
+
+
+def partial_answer(history: list) -> str:
+    """Final-answer text built from the steps so far, for sessions stopped by the deadline."""
+    steps = [summarize_entry(h) for h in history if "step" in h]
+    if not steps:
+        return "Stopped before any step completed; resume the session to continue."
+    return f"Partial result after {len(steps)} step(s), resume the session to continue: " + "; ".join(steps[-3:])
+
+
+def successful(steps: list, decision: dict) -> bool:
+    """True when a session is worth caching as a plan: no tool errors, no parse fallback."""
+    if is_parse_failure(decision):
+        return False
+    return not any(
+        isinstance(r, dict) and "error" in r
+        for _, results in steps
+        for r in results
+    )
+
+
+# ==============================================================================
+#                            MAIN AGENT HANDLER
+# ==============================================================================
+@metrics.flushed
+def handler(event, context):
+    if "Records" in event:
+        return run_jobs(event["Records"], context)
+    if event.get("httpMethod") == "GET":
+        return progress(event)
+
+    trace, debug, session_id, goal, log = SessionTrace(), SessionDebug(), None, None, None
+    try:
+        trace = start_trace()
+        body = json.loads(event.get("body") or "{}")
+        if body.get("async"):
+            return enqueue(body)
+        history, earlier, iteration, first_step = [], [], 0, 0
+        steps, template, replay, conversation = [], None, None, None
+
+        # ---- Resume an existing session, or start a new one ----
+        session_id = None if trace.replaying else body.get("session_id")
+        if session_id:
+            resumed = SessionLog.resume(dynamo, TABLE, session_id, RESUME_STEPS) if TABLE else None
+            if resumed is None:
+                return {"statusCode": 404, "body": json.dumps({"error": f"Unknown session {session_id}"})}
+            log, history, earlier = resumed
+            first_step = log.next_step - 1  # step numbers continue after the stored ones
+            goal = body.get("goal") or log.goal or "Analyze customer 123 health"
+            if body.get("job"):
+                log.set_status("running")
+                if log.next_step == 1:  # queued new session: same plan cache as a synchronous one
+                    template, params, replay = plans.start(goal)
+            logger.info("Session %s resumed at step %d goal=%s", session_id, log.next_step, goal)
+        else:
+            session_id = str(uuid.uuid4())
+            goal = body.get("goal", "Analyze customer 123 health")
+            # Replays stay offline: no DynamoDB writes and no cached plans
+            log = SessionLog(dynamo, None if trace.replaying else TABLE, session_id)
+            if not trace.replaying:
+                template, params, replay = plans.start(goal)
+            logger.info("Session %s start goal=%s plan_cached=%s", session_id, goal, replay is not None)
+        log.goal = goal
+        debug = SessionDebug(session_id)
+        deadline = Deadline.from_context(context, margin_ms=DEADLINE_MARGIN_MS, default_step_ms=STEP_ESTIMATE_MS)
+
+        while True:
+            # ---- Deadline: checkpoint with a partial answer instead of timing out ----
+            if not deadline.allows_step():
+                logger.warning("Session %s checkpointed after %d iteration(s); next step needs ~%.0fms",
+                               session_id, iteration, deadline.estimate_ms())
+                metrics.put("DeadlineStops", 1, "Count")
+                metrics.put("Iterations", iteration, "Count")
+                log.status = "partial"
+                log.close()  # steps and header are persisted, so the session resumes from here
+                return respond(trace, {
+                    "session_id": session_id,
+                    "result": partial_answer(history),
+                    "partial": True,
+                    "status": log.status,
+                    "conversation": history,
+                })
 
-            # ---- Extract JSON decision ----
-            json_match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-            candidate = json_match.group(0) if json_match else raw_text
-            try:
-                decision = json.loads(candidate)
-                logger.info(f"[DEBUG] Parsed JSON decision: {decision}")
-            except Exception as parse_err:
-                logger.error(f"[DEBUG] JSON parsing failed: {parse_err}")
-                decision = {"tool": "final_answer", "result": f"Bad JSON: {raw_text}"}
+            iteration += 1
+            trace.begin_iteration(iteration)
+            deadline.start_step()
+
+            # ---- Replay a known plan, or ask the model ----
+            decision = replay.next_decision() if replay else None
+            speculation = None
+            if decision is None and PREFETCH and not trace.replaying:
+                speculation = Speculation.start(goal, history, tool_pool, invoke_tool, registry)
+            if decision is None and ENGINE == "converse":
+                if conversation is None:
+                    with trace.phase("prompt_ms"):
+                        conversation = ConverseSession(
+                            build_context(goal, registry.names(), history, earlier, PROMPT_TOKEN_BUDGET)
+                        )
+                decision = converse_decision(conversation, trace, debug)
+            elif decision is None:
+                with trace.phase("prompt_ms"):
+                    prompt = build_context(goal, registry.names(), history, earlier, PROMPT_TOKEN_BUDGET)
+                    prompt += "\nDecide next tool."
+                decision = next_decision(prompt, SYSTEM_PROMPT, trace, debug)
+            else:
+                debug.payload("Cached plan step", decision)
+                trace.record_model(json.dumps(decision))
 
             # ---- Stop condition ----
             if decision.get("tool") == "final_answer":
                 history.append({"decision": decision, "result": decision.get("result")})
-                save_state(session_id, history)
-                return {
-                    "statusCode": 200,
-                    "body": json.dumps(
-                        {"session_id": session_id, "result": decision.get("result"), "conversation": history}
-                    ),
-                }
-
-            # ---- Run chosen tool ----
-            tool_name = decision.get("tool")
-            args = decision.get("arguments", {})
-            result = invoke_tool(tool_name, args)
-            history.append({"step": iteration, "decision": decision, "result": result})
-            last_tool, last_result = tool_name, result
+                with trace.phase("persist_ms"):
+                    log.append(history[-1])
+                    log.status = "done"
+                    log.close()
+                    if template is not None and not (replay and replay.completed) and successful(steps, decision):
+                        plans.put(template, build_plan(params, steps, decision.get("result")))
+                metrics.put("Iterations", iteration, "Count")
+                return respond(trace, {
+                    "session_id": session_id,
+                    "result": decision.get("result"),
+                    "status": log.status,
+                    "conversation": history,
+                })
+
+            # ---- Run chosen tool(s) ----
+            with trace.phase("dispatch_ms"):
+                calls, results = run_calls(tool_calls(decision), trace, debug, speculation)
+            steps.append((calls, results))
+            if replay:
+                replay.observe(results)
+            if conversation:
+                conversation.observe(calls, results)
+            with trace.phase("persist_ms"):
+                for call, result in zip(calls, results):
+                    history.append({"step": first_step + iteration, "decision": call, "result": result})
+                    log.append(history[-1])
+                    debug.payload("Step", history[-1])
+                    if isinstance(result, dict) and "error" in result:
+                        debug.fail(f"tool {call['tool']} failed")
+                log.flush()
+            deadline.end_step()
 
             # ---- Safety stop ----
-            if iteration >= 8:
+            if iteration >= MAX_ITERATIONS:
+                debug.fail("max iterations reached")
                 history.append({"warning": "max iterations reached"})
-                save_state(session_id, history)
-                return {
-                    "statusCode": 200,
-                    "body": json.dumps({"session_id": session_id, "conversation": history}),
-                }
+                log.append(history[-1])
+                log.status = "incomplete"
+                log.close()
+                metrics.put("Iterations", iteration, "Count")
+                return respond(trace, {"session_id": session_id, "status": log.status, "conversation": history})
 
+    except Unavailable as e:
+        # Saturated dependency: fail fast and let the client resume the session later
+        logger.warning("Session %s paused: %s", session_id, e)
+        debug.fail(f"unavailable: {e}")
+        if log is not None:
+            log.status = "paused"
+            log.close()
+        return {
+            "statusCode": 503,
+            "headers": {"Retry-After": "10"},
+            "body": json.dumps({"error": str(e), "session_id": session_id if log is not None else None, "status": "paused"}),
+        }
     except Exception as e:
         logger.error("Unhandled exception", exc_info=True)
+        debug.fail(f"unhandled {type(e).__name__}")
+        if log is not None:
+            log.status = "failed"
+            log.close()
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e), "trace": traceback.format_exc()}),
         }
+    finally:
+        trace.save(TRACE_DIR, session_id, goal)
+        debug.finish()
+
+
+# ==============================================================================
+#                            ASYNC JOBS AND PROGRESS
+# ==============================================================================
+def enqueue(body: dict):
+    """
+    {"async": true}: records the session as queued, hands it to the job queue
+    and answers 202 right away. Progress is read with GET /agent/{session_id}.
+    """
+    if not (JOB_QUEUE_URL and TABLE):
+        return {"statusCode": 400, "body": json.dumps({"error": "async sessions are not configured"})}
+    session_id = body.get("session_id")
+    if session_id:
+        resumed = SessionLog.resume(dynamo, TABLE, session_id, 0)
+        if resumed is None:
+            return {"statusCode": 404, "body": json.dumps({"error": f"Unknown session {session_id}"})}
+        log = resumed[0]
+        if not log.claim("queued"):
+            # Already queued or running: a second worker would collide on its step items
+            error = f"Session {session_id} is already {log.status or 'queued or running'}"
+            return {"statusCode": 409, "body": json.dumps({"error": error, "session_id": session_id})}
+    else:
+        session_id = str(uuid.uuid4())
+        log = SessionLog(dynamo, TABLE, session_id, goal=body.get("goal", "Analyze customer 123 health"), status="queued")
+        log.close()
+    sqs.send_message(QueueUrl=JOB_QUEUE_URL, MessageBody=json.dumps({"session_id": session_id, "runs": 0}))
+    logger.info("Session %s queued", session_id)
+    return {
+        "statusCode": 202,
+        "body": json.dumps({"session_id": session_id, "status": "queued", "progress": f"/agent/{session_id}?since=0"}),
+    }
+
+
+def run_jobs(records: list, context):
+    """
+    SQS consumer: runs each queued session in this invocation. Sessions that
+    stop at the deadline, reach MAX_ITERATIONS or pause on a saturated
+    dependency are queued again to continue, up to MAX_JOB_RUNS invocations;
+    after that, and for jobs redriven to the dead-letter queue (a worker that
+    was killed or kept failing), the session is marked failed.
+    """
+    for record in records:
+        job = json.loads(record["body"])
+        if JOB_DLQ_ARN and record.get("eventSourceARN") == JOB_DLQ_ARN:
+            logger.error("Session %s dead-lettered", job["session_id"])
+            SessionLog(dynamo, TABLE, job["session_id"]).set_status("failed")
+            continue
+        response = handler({"body": json.dumps({"session_id": job["session_id"], "job": True})}, context)
+        status = json.loads(response["body"]).get("status")
+        if status not in CONTINUED_STATUSES:
+            continue
+        if job["runs"] + 1 >= MAX_JOB_RUNS:
+            logger.warning("Session %s still %s after %d runs", job["session_id"], status, job["runs"] + 1)
+            SessionLog(dynamo, TABLE, job["session_id"]).set_status("failed")
+            continue
+        sqs.send_message(
+            QueueUrl=JOB_QUEUE_URL,
+            MessageBody=json.dumps({"session_id": job["session_id"], "runs": job["runs"] + 1}),
+            DelaySeconds=10 if status == "paused" else 0,
+        )
+    return {"processed": len(records)}
+
+
+def progress(event):
+    """GET /agent/{session_id}?since=N: session status plus the steps after N."""
+    session_id = (event.get("pathParameters") or {}).get("session_id")
+    try:
+        since = int((event.get("queryStringParameters") or {}).get("since", 0))
+    except ValueError:
+        return {"statusCode": 400, "body": json.dumps({"error": "since must be a step number"})}
+    found = SessionLog.read_since(dynamo, TABLE, session_id, since, PROGRESS_PAGE) if TABLE and session_id else None
+    if found is None:
+        return {"statusCode": 404, "body": json.dumps({"error": f"Unknown session {session_id}"})}
+    header, entries = found
+    return {"statusCode": 200, "body": json.dumps({
+        "session_id": session_id,
+        **header,
+        "steps": [{"step": step, "entry": entry} for step, entry in entries],
+        "next": entries[-1][0] if entries else since,  # pass back as ?since= to poll for newer steps
+    })}
+
+
+def respond(trace: SessionTrace, payload: dict):
+    """200 response; traced sessions also carry their per-iteration profile."""
+    if trace.enabled:
+        payload["profile"] = trace.report()
+    return {"statusCode": 200, "body": json.dumps(payload)}
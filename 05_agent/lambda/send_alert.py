@@ -1,15 +1,15 @@
-import json
-import logging
+import logging, os
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# Same variable and default as the router, so binding the tool in-process keeps its level
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 def handler(event, context):
     """
     Sends an alert (mocked for now).
     Expected input: {"customer_id": "123"}
     """
-    logger.info(f"Received event: {json.dumps(event)}")
+    logger.debug("Received event: %s", event)
 
     customer_id = event.get("customer_id", "unknown")
     message = f"🚨 Alert triggered for customer {customer_id} due to health risk."
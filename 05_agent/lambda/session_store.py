@@ -0,0 +1,224 @@
+import json, logging, os, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from metrics import metrics
+
+logger = logging.getLogger()
+
+BATCH_LIMIT = 25  # DynamoDB BatchWriteItem maximum
+MAX_RETRIES = 5
+META_STEP = 0  # step 0 holds the session header: goal, last step and digest
+DIGEST_STEPS = 40  # older steps kept as one-line summaries in the header
+SUMMARY_CHARS = 160
+# One writer per concurrently running session; a sweep runs SWEEP_CONCURRENCY of them
+WRITER_THREADS = int(os.environ.get("SESSION_WRITER_THREADS") or os.environ.get("SWEEP_CONCURRENCY") or "2")
+
+# Background writer shared across warm invocations, so step writes overlap
+# with the next Bedrock call instead of blocking the loop.
+writer_pool = ThreadPoolExecutor(max_workers=max(2, WRITER_THREADS))
+
+
+def summarize_entry(entry: dict, limit: int = SUMMARY_CHARS) -> str:
+    """One-line summary of a history entry, used for the rolling digest."""
+    decision = entry.get("decision") or {}
+    tool = decision.get("tool")
+    if tool is None:
+        text = json.dumps(entry, separators=(",", ":"), default=str)
+    elif tool == "final_answer":
+        text = f"final_answer: {entry.get('result')}"
+    else:
+        args = json.dumps(decision.get("arguments", {}), separators=(",", ":"), default=str)
+        result = json.dumps(entry.get("result"), separators=(",", ":"), default=str)
+        text = f"{tool}({args}) -> {result}"
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+class SessionLog:
+    """
+    Append-only session log: one small DynamoDB item per history entry,
+    keyed on (session_id, step). Write cost stays constant per step and
+    no single item grows with the session.
+    """
+
+    def __init__(self, dynamo, table: str, session_id: str, next_step: int = 1,
+                 goal: str = None, digest: list = None, status: str = None):
+        self.dynamo = dynamo
+        self.table = table
+        self.session_id = session_id
+        self.next_step = next_step
+        self.goal = goal
+        self.digest = digest or []  # [[step, summary], ...] for the most recent steps
+        self.status = status  # queued | running | done | partial | incomplete | paused | failed
+        self._pending = []
+        self._futures = []
+
+    @classmethod
+    def resume(cls, dynamo, table: str, session_id: str, recent: int):
+        """
+        Loads the header and only the most recent `recent` steps of a session.
+        Returns (log, recent_entries, earlier_summaries), or None if unknown.
+        """
+        meta = dynamo.get_item(
+            TableName=table,
+            Key={"session_id": {"S": session_id}, "step": {"N": str(META_STEP)}},
+        ).get("Item")
+        response = dynamo.query(
+            TableName=table,
+            KeyConditionExpression="session_id = :s AND #step > :meta",
+            ExpressionAttributeNames={"#step": "step"},
+            ExpressionAttributeValues={":s": {"S": session_id}, ":meta": {"N": str(META_STEP)}},
+            ScanIndexForward=False,
+            Limit=max(recent, 1),
+        )
+        items = list(reversed(response.get("Items", [])))
+        if not meta and not items:
+            return None
+
+        entries = [json.loads(item["entry"]["S"]) for item in items][-recent:] if recent else []
+        last_step = int(items[-1]["step"]["N"]) if items else 0
+        goal, digest, status = None, [], None
+        if meta:
+            goal = meta.get("goal", {}).get("S")
+            digest = json.loads(meta.get("digest", {}).get("S", "[]"))
+            status = meta.get("status", {}).get("S")
+            last_step = max(last_step, int(meta["last_step"]["N"]))
+
+        first_loaded = last_step - len(entries)
+        earlier = [summary for step, summary in digest if step <= first_loaded]
+        log = cls(dynamo, table, session_id, next_step=last_step + 1, goal=goal, digest=digest, status=status)
+        return log, entries, earlier
+
+    @staticmethod
+    def read_since(dynamo, table: str, session_id: str, since: int, limit: int):
+        """
+        Progress view for pollers: header fields plus up to `limit` steps after
+        `since`, oldest first. Returns (header, [(step, entry), ...]), or None if unknown.
+        """
+        meta = dynamo.get_item(
+            TableName=table,
+            Key={"session_id": {"S": session_id}, "step": {"N": str(META_STEP)}},
+        ).get("Item")
+        response = dynamo.query(
+            TableName=table,
+            KeyConditionExpression="session_id = :s AND #step > :since",
+            ExpressionAttributeNames={"#step": "step"},
+            ExpressionAttributeValues={":s": {"S": session_id}, ":since": {"N": str(max(since, META_STEP))}},
+            ScanIndexForward=True,
+            Limit=max(limit, 1),
+        )
+        items = response.get("Items", [])
+        if not meta and not items:
+            return None
+        header = {}
+        if meta:
+            header = {
+                "status": meta.get("status", {}).get("S"),
+                "goal": meta.get("goal", {}).get("S"),
+                "last_step": int(meta["last_step"]["N"]),
+            }
+        return header, [(int(item["step"]["N"]), json.loads(item["entry"]["S"])) for item in items]
+
+    def append(self, entry: dict):
+        """Buffers one history entry as the next step item."""
+        self._pending.append({
+            "session_id": {"S": self.session_id},
+            "step": {"N": str(self.next_step)},
+            "timestamp": {"S": datetime.utcnow().isoformat()},
+            "entry": {"S": json.dumps(entry)},
+        })
+        self.digest = (self.digest + [[self.next_step, summarize_entry(entry)]])[-DIGEST_STEPS:]
+        self.next_step += 1
+
+    def flush(self):
+        """Writes buffered steps in the background."""
+        if not self.table or not self._pending:
+            self._pending = []
+            return
+        items, self._pending = self._pending, []
+        self._futures.append(writer_pool.submit(self._write, items))
+
+    def close(self):
+        """Flushes, updates the session header and waits for every outstanding write."""
+        self.flush()
+        if self.table:
+            self._futures.append(writer_pool.submit(self._write_meta))
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def set_status(self, status: str):
+        """Updates only the header's status, so pollers see it before the session closes."""
+        self.status = status
+        if not self.table:
+            return
+        try:
+            self.dynamo.update_item(
+                TableName=self.table,
+                Key={"session_id": {"S": self.session_id}, "step": {"N": str(META_STEP)}},
+                UpdateExpression="SET #status = :status",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":status": {"S": status}},
+            )
+        except Exception as e:
+            logger.warning(f"Dynamo status update failed: {e}")
+
+    def claim(self, status: str, busy=("queued", "running")) -> bool:
+        """
+        Sets the header's status unless it is one of `busy`, in one conditional
+        update, so two callers cannot both hand the session to a worker.
+        False if the session is already taken.
+        """
+        values = {f":busy{i}": {"S": b} for i, b in enumerate(busy)}
+        condition = " AND ".join(f"#status <> {key}" for key in values)
+        try:
+            self.dynamo.update_item(
+                TableName=self.table,
+                Key={"session_id": {"S": self.session_id}, "step": {"N": str(META_STEP)}},
+                UpdateExpression="SET #status = :status",
+                ConditionExpression=f"attribute_not_exists(#status) OR ({condition})",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":status": {"S": status}, **values},
+            )
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                return False
+            raise
+        self.status = status
+        return True
+
+    def _write_meta(self):
+        item = {
+            "session_id": {"S": self.session_id},
+            "step": {"N": str(META_STEP)},
+            "timestamp": {"S": datetime.utcnow().isoformat()},
+            "last_step": {"N": str(self.next_step - 1)},
+            "digest": {"S": json.dumps(self.digest)},
+        }
+        if self.goal:
+            item["goal"] = {"S": self.goal}
+        if self.status:
+            item["status"] = {"S": self.status}
+        try:
+            with metrics.timer("DynamoWriteLatency", Operation="PutItem"):
+                self.dynamo.put_item(TableName=self.table, Item=item)
+        except Exception as e:
+            logger.warning(f"Dynamo header write failed: {e}")
+
+    def _write(self, items: list):
+        for i in range(0, len(items), BATCH_LIMIT):
+            requests = [{"PutRequest": {"Item": item}} for item in items[i:i + BATCH_LIMIT]]
+            try:
+                self._batch_write(requests)
+            except Exception as e:
+                logger.warning(f"Dynamo write failed: {e}")
+
+    def _batch_write(self, requests: list):
+        for attempt in range(MAX_RETRIES):
+            with metrics.timer("DynamoWriteLatency", Operation="BatchWriteItem"):
+                response = self.dynamo.batch_write_item(RequestItems={self.table: requests})
+            requests = response.get("UnprocessedItems", {}).get(self.table, [])
+            if not requests:
+                return
+            time.sleep(0.05 * 2 ** attempt)
+        logger.warning(f"Dynamo write left {len(requests)} unprocessed steps for {self.session_id}")
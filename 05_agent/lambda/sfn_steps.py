@@ -0,0 +1,115 @@
+import json, logging, uuid
+
+from metrics import metrics
+from context_builder import build_context
+from session_store import DIGEST_STEPS, summarize_entry
+from tool_registry import TOOL_SCHEMAS
+import router
+
+logger = logging.getLogger()
+
+# ==============================================================================
+#   Pure tasks for the Step Functions variant of the agent loop.
+#   The state machine calls Bedrock, the tool Lambdas and DynamoDB itself;
+#   these tasks only turn execution state into the next request and parse
+#   the model output into validated calls. No AWS calls happen here.
+# ==============================================================================
+
+
+def start(body: dict) -> dict:
+    """
+    Always a new session: these tasks never read the table, so a stored
+    session would have its steps and header overwritten. Sessions are
+    resumed through the router Lambda instead.
+    """
+    if body.get("session_id"):
+        logger.warning("Ignoring session_id %s: the state machine only starts new sessions", body["session_id"])
+    return {
+        "session_id": str(uuid.uuid4()),
+        "goal": body.get("goal", "Analyze customer 123 health"),
+        "iteration": 0,
+        "next_step": 1,
+        "history": [],
+        "digest": [],
+    }
+
+
+def observe(state: dict, entry: dict) -> dict:
+    """Appends a history entry and returns its session log item fields (strings, as DynamoDB takes them)."""
+    step = state["next_step"]
+    state["history"].append(entry)
+    state["digest"] = (state["digest"] + [[step, summarize_entry(entry)]])[-DIGEST_STEPS:]
+    state["next_step"] = step + 1
+    return {"step": str(step), "entry": json.dumps(entry, default=str)}
+
+
+def prepare(state: dict) -> dict:
+    """
+    Folds the last decision and tool results into the history, then either
+    builds the next Bedrock request or marks the session done. `entries` are
+    the new step items for the state machine to write; `header` is the
+    session's step-0 item, so the Lambda router can resume the session.
+    """
+    state = start(state.get("body") or {}) if "history" not in state else dict(state)
+    decision = state.pop("decision", None)
+    calls, results = state.pop("calls", None), state.pop("results", None)
+    state.pop("model", None)
+    entries, done = [], False
+
+    if decision and decision.get("tool") == "final_answer":
+        entries.append(observe(state, {"decision": decision, "result": decision.get("result")}))
+        state["result"], done = decision.get("result"), True
+    elif calls is not None:
+        for call, result in zip(calls, results):
+            entries.append(observe(state, {
+                "step": state["iteration"],
+                "decision": {"tool": call["tool"], "arguments": call["arguments"]},
+                "result": result,
+            }))
+
+    if not done and state["iteration"] >= router.MAX_ITERATIONS:
+        entries.append(observe(state, {"warning": "max iterations reached"}))
+        done = True
+
+    state.update(entries=entries, done=done, header={
+        "last_step": str(state["next_step"] - 1),
+        "digest": json.dumps(state["digest"]),
+        # Same statuses as the router's, for GET /agent/{session_id} pollers
+        "status": "done" if "result" in state else "incomplete",
+    })
+    if done:
+        state.pop("request", None)
+        state.setdefault("result", None)
+        metrics.put("Iterations", state["iteration"], "Count")
+        return state
+
+    state["iteration"] += 1
+    prompt = build_context(state["goal"], list(TOOL_SCHEMAS), state["history"], [], router.PROMPT_TOKEN_BUDGET)
+    state["request"] = router.build_request_body(prompt + "\nDecide next tool.", router.MODEL_ID, router.SYSTEM_PROMPT)
+    return state
+
+
+def decide(state: dict) -> dict:
+    """
+    Parses model text into a decision and validates its calls. Calls that
+    cannot be repaired carry an "error" the state machine returns as their
+    result instead of invoking a tool.
+    """
+    state = dict(state)
+    decision = router.parse_decision(state.pop("model")["text"])
+    state["decision"] = decision
+    state["final"] = decision.get("tool") == "final_answer"
+    if state["final"]:
+        return state
+    calls, errors = router.check_calls(router.tool_calls(decision))
+    state["calls"] = [dict(call, error=error) if error else call for call, error in zip(calls, errors)]
+    return state
+
+
+TASKS = {"prepare": prepare, "decide": decide}
+
+
+@metrics.flushed
+def handler(event, context):
+    """Step task entry point: {"task": "prepare" | "decide", "state": {...}}."""
+    return TASKS[event["task"]](event["state"])
@@ -1,15 +1,15 @@
-import json
-import logging
+import logging, os
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# Same variable and default as the router, so binding the tool in-process keeps its level
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 def handler(event, context):
     """
     Summarizes customer metrics into a short natural-language statement.
     Expected input: {"metrics": {...}} or {"metrics_json": {...}}
     """
-    logger.info(f"Received event: {json.dumps(event)}")
+    logger.debug("Received event: %s", event)
 
     m = event.get("metrics") or event.get("metrics_json", {})
     customer_id = m.get("customer_id", "unknown")
@@ -22,5 +22,5 @@ def handler(event, context):
         f"{tickets} open tickets, and NPS {nps}."
     )
 
-    logger.info(f"Summary result: {summary}")
+    logger.debug("Summary result: %s", summary)
     return {"summary": summary}
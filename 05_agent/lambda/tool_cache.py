@@ -0,0 +1,94 @@
+import json, logging, threading, time
+from collections import OrderedDict
+
+from metrics import metrics
+from tool_registry import ToolRegistry
+
+logger = logging.getLogger()
+
+# Seconds a result stays fresh, per tool. Tools not listed are never cached.
+DEFAULT_TTLS = {"get_customer_metrics": 300, "summarize_metrics": 3600}
+
+
+def cache_key(tool: str, args: dict) -> str:
+    """Tool name plus canonical JSON arguments, so key order does not matter."""
+    return f"{tool}#{json.dumps(args, sort_keys=True, separators=(',', ':'), default=str)}"
+
+
+class ToolResultCache:
+    """
+    Results of idempotent tools: a warm-container LRU in front of a DynamoDB
+    table whose `expires_at` attribute is the table's TTL. Side-effecting tools
+    and error results are never stored.
+    """
+
+    def __init__(self, dynamo, table: str, ttls: dict = None, size: int = 256, clock=time.time):
+        self.dynamo = dynamo
+        self.table = table
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.size = size
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+    def cacheable(self, tool: str) -> bool:
+        return self.ttls.get(tool, 0) > 0 and not ToolRegistry.has_side_effects(tool)
+
+    def get(self, tool: str, args: dict):
+        """Returns (hit, result)."""
+        if not self.cacheable(tool):
+            return False, None
+        key, now = cache_key(tool, args), self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.put("ToolCacheHits", 1, "Count", Tool=tool, Tier="memory")
+                return True, entry[1]
+            self._entries.pop(key, None)
+
+        item = self._load(key)
+        # TTL deletion is lazy, so expired items can still be returned by DynamoDB
+        if item and int(item["expires_at"]["N"]) > now:
+            result = json.loads(item["result"]["S"])
+            self._remember(key, int(item["expires_at"]["N"]), result)
+            metrics.put("ToolCacheHits", 1, "Count", Tool=tool, Tier="dynamo")
+            return True, result
+        metrics.put("ToolCacheMisses", 1, "Count", Tool=tool)
+        return False, None
+
+    def put(self, tool: str, args: dict, result):
+        if not self.cacheable(tool) or (isinstance(result, dict) and "error" in result):
+            return
+        key = cache_key(tool, args)
+        expires_at = int(self.clock()) + self.ttls[tool]
+        self._remember(key, expires_at, result)
+        if not self.table:
+            return
+        try:
+            self.dynamo.put_item(
+                TableName=self.table,
+                Item={
+                    "key": {"S": key},
+                    "result": {"S": json.dumps(result, default=str)},
+                    "expires_at": {"N": str(expires_at)},
+                },
+            )
+        except Exception as e:
+            logger.warning("Tool cache write failed: %s", e)
+
+    def _load(self, key: str):
+        if not self.table:
+            return None
+        try:
+            return self.dynamo.get_item(TableName=self.table, Key={"key": {"S": key}}).get("Item")
+        except Exception as e:
+            logger.warning("Tool cache lookup failed: %s", e)
+            return None
+
+    def _remember(self, key: str, expires_at: int, result):
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,97 @@
+import importlib, json, logging
+
+logger = logging.getLogger()
+
+LOCAL_PREFIX = "local:"
+# Tools that change the outside world; callers must not repeat them blindly
+SIDE_EFFECT_TOOLS = {"send_alert"}
+CUSTOMER_ID = {"type": "object", "properties": {"customer_id": {"type": "string"}}, "required": ["customer_id"]}
+# Descriptions and JSON input schemas for native tool use (Converse toolConfig)
+TOOL_SCHEMAS = {
+    "get_customer_metrics": ("Returns health metrics (uptime, tickets, NPS) for one customer.", CUSTOMER_ID),
+    "summarize_metrics": (
+        "Summarizes customer metrics into one sentence.",
+        {
+            "type": "object",
+            "properties": {"metrics": {"type": "object", "description": "Output of get_customer_metrics."}},
+            "required": ["metrics"],
+        },
+    ),
+    "send_alert": ("Sends a health alert for a customer. Has side effects: call at most once.", CUSTOMER_ID),
+}
+
+
+class ToolRegistry:
+    """
+    Maps tool names to either a local Python callable or a remote Lambda ARN.
+    Co-located tools (same asset as the router) skip the cross-Lambda hop.
+    """
+
+    def __init__(self, lambda_client=None):
+        self.lambda_client = lambda_client
+        self._local = {}
+        self._remote = {}
+
+    @classmethod
+    def from_config(cls, config: dict, lambda_client=None):
+        """
+        Builds a registry from the TOOLS mapping. Values are either a Lambda ARN
+        or "local:<module>" for a handler shipped next to the router.
+        """
+        registry = cls(lambda_client)
+        for name, target in config.items():
+            if target.startswith(LOCAL_PREFIX):
+                module = importlib.import_module(target[len(LOCAL_PREFIX):])
+                registry.bind_local(name, module.handler)
+            else:
+                registry.bind_remote(name, target)
+        return registry
+
+    def bind_local(self, name: str, fn):
+        self._remote.pop(name, None)
+        self._local[name] = fn
+
+    def bind_remote(self, name: str, arn: str):
+        self._local.pop(name, None)
+        self._remote[name] = arn
+
+    def names(self):
+        return list(self._local) + list(self._remote)
+
+    def __contains__(self, name):
+        return name in self._local or name in self._remote
+
+    def is_local(self, name: str) -> bool:
+        return name in self._local
+
+    def tool_config(self) -> dict:
+        """Converse toolConfig for the bound tools (all known tools when none are bound)."""
+        tools = []
+        for name in self.names() or list(TOOL_SCHEMAS):
+            description, schema = TOOL_SCHEMAS.get(name, (f"Tool {name}.", {"type": "object"}))
+            tools.append({"toolSpec": {"name": name, "description": description, "inputSchema": {"json": schema}}})
+        return {"tools": tools}
+
+    @staticmethod
+    def has_side_effects(name: str) -> bool:
+        return name in SIDE_EFFECT_TOOLS
+
+    def invoke(self, name: str, args: dict):
+        """Runs the tool in-process or through a RequestResponse Lambda invoke."""
+        if name in self._local:
+            logger.debug("Invoking local tool %s with args=%s", name, args)
+            return self._local[name](args, None)
+
+        target_arn = self._remote[name]
+        logger.debug("Invoking Lambda tool %s (%s) with args=%s", name, target_arn, args)
+        response = self.lambda_client.invoke(
+            FunctionName=target_arn,
+            InvocationType="RequestResponse",
+            Payload=json.dumps(args),
+        )
+        payload = json.loads(response["Payload"].read())
+        if response.get("FunctionError"):
+            # The tool raised: report it like any other tool error so it is never cached as a result
+            logger.warning("Lambda tool %s failed: %s", name, payload)
+            return {"error": f"{payload.get('errorType', 'Error')}: {payload.get('errorMessage', '')}"}
+        return payload
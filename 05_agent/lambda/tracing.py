@@ -0,0 +1,101 @@
+import json, logging, os, time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# Per-iteration cost buckets reported by a trace
+PHASES = ("prompt_ms", "model_ms", "parse_ms", "dispatch_ms", "persist_ms")
+
+
+class TraceExhausted(Exception):
+    """Replay asked for more model outputs or tool results than were recorded."""
+
+
+class SessionTrace:
+    """
+    Captures one session's model outputs and tool results ("record"), or feeds
+    them back to the loop offline ("replay"). Both modes time every iteration
+    by phase. With mode "off" every hook is a cheap no-op.
+    """
+
+    def __init__(self, mode: str = "off", recorded: dict = None):
+        self.mode = mode
+        self.events = []
+        self.iterations = []
+        self.divergences = 0
+        self._recorded = (recorded or {}).get("events", [])
+        self._cursor = 0
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            return cls("replay", json.load(f))
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    # ---- Profiling ---------------------------------------------------------
+    def begin_iteration(self, iteration: int):
+        if self.enabled:
+            self.iterations.append({"iteration": iteration, **{p: 0.0 for p in PHASES}})
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.iterations:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.iterations[-1][name] += (time.perf_counter() - start) * 1000
+
+    def report(self) -> dict:
+        iterations = [{k: round(v, 3) if isinstance(v, float) else v for k, v in it.items()} for it in self.iterations]
+        totals = {p: round(sum(it[p] for it in self.iterations), 3) for p in PHASES}
+        return {"mode": self.mode, "iterations": iterations, "totals": totals, "divergences": self.divergences}
+
+    # ---- Model outputs -----------------------------------------------------
+    def record_model(self, raw_text: str):
+        if self.mode == "record":
+            self.events.append({"kind": "model", "raw": raw_text})
+
+    def replay_model(self) -> str:
+        return self._next("model")["raw"]
+
+    # ---- Tool results ------------------------------------------------------
+    def record_tools(self, calls: list, results: list):
+        if self.mode == "record":
+            self.events.append({"kind": "tools", "calls": calls, "results": results})
+
+    def replay_tools(self, calls: list) -> list:
+        event = self._next("tools")
+        if event["calls"] != calls:
+            self.divergences += 1
+            logger.warning(f"Trace divergence: recorded {event['calls']} but loop asked for {calls}")
+        return event["results"]
+
+    def _next(self, kind: str) -> dict:
+        while self._cursor < len(self._recorded):
+            event = self._recorded[self._cursor]
+            self._cursor += 1
+            if event["kind"] == kind:
+                return event
+        raise TraceExhausted(f"No recorded {kind} event left")
+
+    # ---- Persistence -------------------------------------------------------
+    def save(self, directory: str, session_id: str, goal: str):
+        """Writes a recorded trace to <directory>/<session_id>.json (Lambda: under /tmp)."""
+        if self.mode != "record" or not self.events:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{session_id}.json")
+        with open(path, "w") as f:
+            json.dump({"session_id": session_id, "goal": goal, "events": self.events, "profile": self.report()}, f)
+        logger.info(f"Trace written to {path}")
+        return path
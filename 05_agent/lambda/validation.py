@@ -0,0 +1,107 @@
+import difflib, json, re
+
+from tool_registry import TOOL_SCHEMAS
+
+# Argument names models commonly use instead of the schema's
+ARG_ALIASES = {
+    "metrics_json": "metrics",
+    "metrics_data": "metrics",
+    "data": "metrics",
+    "customerid": "customer_id",
+    "customer": "customer_id",
+    "cust_id": "customer_id",
+    "id": "customer_id",
+}
+NAME_CUTOFF = 0.75  # difflib similarity needed to accept a nearest tool or argument name
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", str(name).strip().lower()).strip("_")
+
+
+def repair_tool_name(name, known: list):
+    """Returns (tool name, note) or (None, error) when no known tool is close enough."""
+    if name in known:
+        return name, None
+    normalized = _normalize(name or "")
+    for tool in known:
+        if _normalize(tool) == normalized:
+            return tool, f"tool {name!r} -> {tool!r}"
+    match = difflib.get_close_matches(normalized, known, n=1, cutoff=NAME_CUTOFF)
+    if match:
+        return match[0], f"tool {name!r} -> {match[0]!r}"
+    return None, f"Unknown tool {name!r}. Available tools: {', '.join(known)}"
+
+
+def _coerce(value, expected: str):
+    """Converts simple type mismatches; returns the value unchanged if it cannot."""
+    if expected == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if expected in ("object", "array") and isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            return value
+        return parsed if isinstance(parsed, dict if expected == "object" else list) else value
+    if expected in ("integer", "number") and isinstance(value, str):
+        try:
+            return int(value) if expected == "integer" else float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(value, expected: str) -> bool:
+    types = {"string": str, "object": dict, "array": list, "integer": int, "number": (int, float), "boolean": bool}
+    return expected not in types or isinstance(value, types[expected])
+
+
+def validate_call(call: dict, known: list):
+    """
+    Checks one {"tool", "arguments"} call against the tool's input schema and
+    repairs what it can: tool name typos, argument aliases and simple type
+    mismatches. Returns (call, notes, error); error is set only when the call
+    cannot be fixed and must not be dispatched.
+    """
+    tool, error = repair_tool_name(call.get("tool"), known)
+    if tool is None:
+        return call, [], error
+    notes = [error] if error else []
+
+    args = call.get("arguments")
+    if isinstance(args, str):
+        args = _coerce(args, "object")
+        if isinstance(args, dict):
+            notes.append("arguments parsed from a JSON string")
+    if not isinstance(args, dict):
+        return call, notes, f"Arguments for {tool} must be a JSON object"
+
+    _, schema = TOOL_SCHEMAS.get(tool, (None, {}))
+    properties = schema.get("properties", {})
+    if properties:
+        repaired = {}
+        for key, value in args.items():
+            target = key
+            if key not in properties:
+                alias = ARG_ALIASES.get(_normalize(key))
+                close = difflib.get_close_matches(_normalize(key), list(properties), n=1, cutoff=NAME_CUTOFF)
+                target = alias if alias in properties else (close[0] if close else key)
+                if target in args and target != key:
+                    target = key  # never overwrite an argument the model did name correctly
+                if target != key:
+                    notes.append(f"argument {key!r} -> {target!r}")
+            repaired[target] = value
+        args = repaired
+
+        for key, spec in properties.items():
+            if key in args and not _matches(args[key], spec.get("type")):
+                coerced = _coerce(args[key], spec.get("type"))
+                if not _matches(coerced, spec.get("type")):
+                    return call, notes, f"Argument {key!r} of {tool} must be of type {spec.get('type')}"
+                notes.append(f"argument {key!r} coerced to {spec.get('type')}")
+                args[key] = coerced
+
+    missing = [key for key in schema.get("required", []) if key not in args]
+    if missing:
+        return call, notes, f"Missing required argument(s) for {tool}: {', '.join(missing)}"
+    return {"tool": tool, "arguments": args}, notes, None
@@ -0,0 +1,255 @@
+import sys, os, json, re
+from pathlib import Path
+
+import pytest
+
+# Get repo root and current blueprint dir
+current_dir = Path(__file__).resolve().parent
+blueprint_dir = current_dir.parent
+repo_root = blueprint_dir.parent
+
+# Add both blueprint folder and repo root to sys.path
+sys.path.append(str(blueprint_dir))
+sys.path.append(str(repo_root))
+sys.path.append(str(blueprint_dir / "lambda"))  # state machine tasks run locally below
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from agent.agent_stack import AgentSkeletonStack
+
+def test_resources_created():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    # summarize_metrics runs in-process by default, so no SummarizeFn; plus router, job worker and sweep
+    template.resource_count_is("AWS::Lambda::Function", 5)
+    template.resource_count_is("AWS::DynamoDB::Table", 3)
+    template.resource_count_is("AWS::ApiGateway::RestApi", 1)
+
+def test_memory_table_keyed_per_step():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [
+            {"AttributeName": "session_id", "KeyType": "HASH"},
+            {"AttributeName": "step", "KeyType": "RANGE"},
+        ]
+    })
+
+def test_all_in_one_variant_has_only_the_router():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack", all_in_one=True, sweep=False, jobs=False)
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::Lambda::Function", 1)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": {"TOOLS": assertions.Match.string_like_regexp('"summarize_metrics": "local:summarize"')}}
+    })
+
+def test_tool_lambdas_log_at_info():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "send_alert.handler",
+        "Environment": {"Variables": {"LOG_LEVEL": "INFO"}},
+    })
+
+def test_router_routes_routine_steps_to_the_fast_model():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "router.handler",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "BEDROCK_MODEL_ID": "anthropic.claude-3-sonnet-20240229-v1:0",
+            "BEDROCK_FAST_MODEL_ID": "anthropic.claude-3-haiku-20240307-v1:0",
+        })},
+    })
+
+def test_tool_cache_table_expires_entries():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [{"AttributeName": "key", "KeyType": "HASH"}],
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+    })
+
+def test_sweep_lambda_runs_long_with_a_shared_rate_limit():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "batch.handler",
+        "Timeout": 900,
+        "Environment": {"Variables": assertions.Match.object_like({"SWEEP_CONCURRENCY": "16", "BEDROCK_RPS": "20"})},
+    })
+
+def test_async_jobs_run_from_a_queue_with_a_progress_route():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack")
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::SQS::Queue", 2)
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "RedrivePolicy": assertions.Match.object_like({"maxReceiveCount": 3}),
+    })
+    template.resource_count_is("AWS::Lambda::EventSourceMapping", 2)
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {"BatchSize": 1})
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "router.handler",
+        "Timeout": 300,
+        "Environment": {"Variables": assertions.Match.object_like({"JOB_QUEUE_URL": assertions.Match.any_value()})},
+    })
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "{session_id}"})
+    template.has_resource_properties("AWS::ApiGateway::Method", {"HttpMethod": "GET"})
+
+def test_stepfunctions_variant_runs_the_loop_in_an_express_machine():
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack", orchestration="stepfunctions")
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::StepFunctions::StateMachine", {"StateMachineType": "EXPRESS"})
+    # Every tool is a Lambda, the router is replaced by the parsing task; plus the sweep
+    template.resource_count_is("AWS::Lambda::Function", 5)
+    template.has_resource_properties("AWS::Lambda::Function", {"Handler": "sfn_steps.handler"})
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "POST",
+        "Integration": assertions.Match.object_like({"Type": "AWS"}),  # StartSyncExecution
+    })
+    definition = asl_definition(template)
+    assert definition["States"]["AskModel"]["Resource"].endswith(":bedrock:invokeModel")
+    assert "Catch" in definition["States"]["RunTools"]["ItemProcessor"]["States"]["Run-send_alert"]
+
+
+# ---- Local stand-in for the Express state machine -------------------------
+# Walks the synthesized ASL (the JSONPath subset the stack uses) and calls
+# local handlers in place of Bedrock, DynamoDB and the Lambdas.
+def asl_definition(template):
+    """The state machine's ASL with CloudFormation tokens replaced by logical ids."""
+    (machine,) = template.find_resources("AWS::StepFunctions::StateMachine").values()
+    parts = machine["Properties"]["DefinitionString"]["Fn::Join"][1]
+    return json.loads("".join(p if isinstance(p, str) else p.get("Ref") or p["Fn::GetAtt"][0] for p in parts))
+
+
+def json_path(data, path, context):
+    value, rest = (context, path[3:]) if path.startswith("$$.") else (data, path[2:])
+    for key in re.findall(r"[^.\[\]]+", rest):
+        value = value[int(key)] if isinstance(value, list) else value[key]
+    return value
+
+
+def fill(template, data, context):
+    if not isinstance(template, dict):
+        return template
+    return {
+        k[:-2] if k.endswith(".$") else k: json_path(data, v, context) if k.endswith(".$") else fill(v, data, context)
+        for k, v in template.items()
+    }
+
+
+def put_result(data, path, result):
+    if path is None:
+        return data
+    if path == "$":
+        return result
+    data = dict(data)
+    data[path[2:]] = result
+    return data
+
+
+def choose(rule, data):
+    try:
+        value = json_path(data, rule["Variable"], {})
+    except (KeyError, IndexError, TypeError):
+        return rule.get("IsPresent") is False
+    if "IsPresent" in rule:
+        return rule["IsPresent"]
+    if "BooleanEquals" in rule:
+        return value is rule["BooleanEquals"]
+    return value == rule["StringEquals"]
+
+
+def run_asl(machine, data, call, context=None, max_transitions=200):
+    name = machine["StartAt"]
+    for _ in range(max_transitions):
+        state = machine["States"][name]
+        context = dict(context or {}, State={"EnteredTime": "2024-01-01T00:00:00Z"})
+        if state["Type"] == "Choice":
+            name = next((c["Next"] for c in state["Choices"] if choose(c, data)), state.get("Default"))
+            continue
+        if state["Type"] == "Succeed":
+            return data
+        effective = json_path(data, state.get("InputPath", "$"), context)
+        if state["Type"] == "Map":
+            result = []
+            for item in json_path(effective, state["ItemsPath"], context):
+                item_context = dict(context, Map={"Item": {"Value": item}})
+                item_input = fill(state["ItemSelector"], effective, item_context) if "ItemSelector" in state else item
+                result.append(run_asl(state["ItemProcessor"], item_input, call, item_context))
+        elif state["Type"] == "Task":
+            try:
+                result = call(state["Resource"], fill(state.get("Parameters", {}), effective, context) or effective)
+            except Exception as e:
+                catch = state["Catch"][0]
+                data, name = put_result(data, catch["ResultPath"], {"Error": type(e).__name__, "Cause": str(e)}), catch["Next"]
+                continue
+            if "ResultSelector" in state:
+                result = fill(state["ResultSelector"], result, context)
+        else:
+            result = fill(state["Parameters"], effective, context) if "Parameters" in state else effective
+        data = put_result(data, state.get("ResultPath", "$"), result)
+        if state.get("End"):
+            return data
+        name = state["Next"]
+    raise AssertionError("state machine did not finish")
+
+
+def test_express_loop_runs_end_to_end_on_a_local_stand_in():
+    import sfn_steps, get_metrics, send_alert
+
+    app = core.App()
+    stack = AgentSkeletonStack(app, "TestAgentSkeletonStack", orchestration="stepfunctions")
+    definition = asl_definition(assertions.Template.from_stack(stack))
+
+    replies = iter([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": 42}}',
+        '{"tool": "send_alert", "arguments": {"customer": "42"}}',  # repaired by the decide task
+        '{"tool": "final_answer", "result": "Customer 42 alerted"}',
+    ])
+    lambdas = {"AgentStepsFn": sfn_steps.handler, "GetMetricsFn": get_metrics.handler, "SendAlertFn": send_alert.handler}
+    items, prompts = [], []
+
+    def call(resource, payload):
+        if resource.endswith(":bedrock:invokeModel"):
+            prompts.append(payload["Body"]["messages"][0]["content"][0]["text"])
+            return {"Body": {"content": [{"text": next(replies)}]}}
+        if resource.endswith(":dynamodb:putItem"):
+            items.append(payload["Item"])
+            return {}
+        (handler,) = [h for prefix, h in lambdas.items() if resource.startswith(prefix)]
+        return handler(payload, None)
+
+    output = run_asl(definition, {"body": {"goal": "Check customer 42"}}, call)
+
+    assert output["result"] == "Customer 42 alerted"
+    tools = [h["decision"]["tool"] for h in output["conversation"]]
+    assert tools == ["get_customer_metrics", "send_alert", "final_answer"]
+    assert output["conversation"][0]["result"]["uptime"] == 90.8
+    assert output["conversation"][1]["result"]["status"] == "alert_sent"
+    assert "90.8" in prompts[1]  # tool results reach the next prompt
+    # Same items SessionLog writes: steps 1..3 plus the step-0 header
+    assert [i["step"]["N"] for i in items] == ["1", "2", "3", "0"]
+    assert items[-1]["last_step"]["N"] == "3" and items[-1]["goal"]["S"] == "Check customer 42"
+    assert items[-1]["status"]["S"] == "done"
+
+    # A caller-supplied session_id never overwrites a stored session
+    replies = iter(['{"tool": "final_answer", "result": "ok"}'])
+    rerun = run_asl(definition, {"body": {"goal": "Check customer 42", "session_id": output["session_id"]}}, call)
+    assert rerun["session_id"] != output["session_id"]
+
+
+def test_unknown_orchestration_is_rejected():
+    with pytest.raises(ValueError, match="orchestration"):
+        AgentSkeletonStack(core.App(), "TestAgentSkeletonStack", orchestration="ecs")
@@ -0,0 +1,25 @@
+import sys, json, subprocess
+from pathlib import Path
+
+import pytest
+
+repo_root = Path(__file__).resolve().parent.parent.parent
+
+
+def run_bench(target, requests=10):
+    """Runs bench/loadtest.py with instant fakes and returns its JSON report."""
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.loadtest", "--target", target, "--synthetic", str(requests),
+         "--concurrency", "4", "--bedrock-latency", "0", "--dynamo-latency", "0", "--lambda-latency", "0"],
+        cwd=repo_root, capture_output=True, text=True, check=True, timeout=300,
+    )
+    return json.loads(proc.stdout)
+
+
+@pytest.mark.parametrize("target", ["02", "05"])
+def test_loadtest_harness_smoke(target):
+    report = run_bench(target)
+    assert (report["requests"], report["errors"]) == (10, 0)
+    assert report["alloc_peak_kib_per_request"] > 0
+    # Counts cover the measured run only: one result write (02) or session header (05) per request
+    assert report["fake_calls"]["dynamo" if target == "05" else "table"]["PutItem"] == 10
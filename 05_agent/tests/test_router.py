@@ -0,0 +1,848 @@
+import sys, os, io, json, subprocess, threading, time
+from pathlib import Path
+
+import pytest
+
+# Make the Lambda asset folder importable
+current_dir = Path(__file__).resolve().parent
+lambda_dir = current_dir.parent / "lambda"
+sys.path.append(str(lambda_dir))
+sys.path.append(str(current_dir.parent.parent))  # repo root, for utils
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import router
+from json_stream import JsonObjectScanner
+from session_store import SessionLog
+from context_builder import build_context, estimate_tokens
+from tool_registry import ToolRegistry
+from plan_cache import PlanCache, PlanReplay, build_plan, goal_template
+import debug_log
+from hedging import Hedger, LatencyWindow
+from tracing import SessionTrace
+from validation import validate_call
+from tool_cache import ToolResultCache
+from prefetch import predict_call
+from resilience import CircuitBreaker, CircuitOpen, RateLimited, Resilient, TokenBucket, Unavailable
+from debug_log import Capped
+from utils.importtime import assert_import_budget
+from deadline import Deadline
+
+
+def test_tool_calls_accepts_single_and_batch_decisions():
+    single = router.tool_calls({"tool": "get_customer_metrics", "arguments": {"customer_id": "1"}})
+    assert single == [{"tool": "get_customer_metrics", "arguments": {"customer_id": "1"}}]
+
+    batch = router.tool_calls({"tools": [
+        {"tool": "get_customer_metrics", "arguments": {"customer_id": "1"}},
+        {"tool": "get_customer_metrics"},
+    ]})
+    assert [c["tool"] for c in batch] == ["get_customer_metrics", "get_customer_metrics"]
+    assert batch[1]["arguments"] == {}
+
+
+def test_invoke_tools_runs_in_parallel_and_keeps_order(monkeypatch):
+    def slow_tool(tool_name, args):
+        time.sleep(0.2 if args["customer_id"] == "1" else 0.01)
+        return {"customer_id": args["customer_id"]}
+
+    monkeypatch.setattr(router, "invoke_tool", slow_tool)
+    calls = [{"tool": "get_customer_metrics", "arguments": {"customer_id": str(i)}} for i in range(1, 6)]
+
+    start = time.perf_counter()
+    results = router.invoke_tools(calls)
+    elapsed = time.perf_counter() - start
+
+    assert [r["customer_id"] for r in results] == ["1", "2", "3", "4", "5"]
+    assert elapsed < 0.4
+
+
+class FakeStream:
+    """Stands in for the Bedrock EventStream; records how far it was consumed."""
+
+    def __init__(self, texts):
+        self.events = [
+            {"chunk": {"bytes": json.dumps({"type": "content_block_delta", "delta": {"type": "text_delta", "text": t}}).encode()}}
+            for t in texts
+        ]
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            self.consumed += 1
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrock:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return {"body": self.stream}
+
+
+def test_json_scanner_handles_split_chunks_and_braces_in_strings():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('Sure: {"tool": "final_answer", "result": "use {') is None
+    assert scanner.feed('braces} ok"}') == {"tool": "final_answer", "result": "use {braces} ok"}
+
+
+def test_json_scanner_skips_invalid_objects():
+    assert JsonObjectScanner().feed('{not json} {"tool": "x"}') == {"tool": "x"}
+
+
+def test_call_bedrock_stream_stops_at_first_complete_decision(monkeypatch):
+    stream = FakeStream(['{"tool": "get_customer_metrics", ', '"arguments": {"customer_id": "7"}}', "\nExtra", " commentary"])
+    monkeypatch.setattr(router, "bedrock", FakeBedrock(stream))
+
+    decision, _ = router.call_bedrock_stream("prompt", router.MODEL_ID, "system")
+
+    assert decision == {"tool": "get_customer_metrics", "arguments": {"customer_id": "7"}}
+    assert stream.consumed == 2
+    assert stream.closed
+
+
+def test_parse_decision_falls_back_to_final_answer():
+    decision = router.parse_decision("no json here")
+    assert decision["tool"] == "final_answer"
+    assert decision["result"].startswith("Bad JSON")
+
+
+class FakeDynamo:
+    def __init__(self, unprocessed_once=False):
+        self.calls = []
+        self.items = {}
+        self.unprocessed_once = unprocessed_once
+
+    def batch_write_item(self, RequestItems):
+        self.calls.append(RequestItems)
+        if self.unprocessed_once:
+            self.unprocessed_once = False
+            table, requests = next(iter(RequestItems.items()))
+            return {"UnprocessedItems": {table: requests[:1]}}
+        for requests in RequestItems.values():
+            for r in requests:
+                self.put_item(TableName=None, Item=r["PutRequest"]["Item"])
+        return {}
+
+    def put_item(self, TableName, Item):
+        self.items[(Item["session_id"]["S"], int(Item["step"]["N"]))] = Item
+
+    def get_item(self, TableName, Key):
+        item = self.items.get((Key["session_id"]["S"], int(Key["step"]["N"])))
+        return {"Item": item} if item else {}
+
+    def update_item(self, TableName, Key, ExpressionAttributeValues, ConditionExpression=None, **kwargs):
+        item = self.items.setdefault((Key["session_id"]["S"], int(Key["step"]["N"])), dict(Key))
+        busy = [v for k, v in ExpressionAttributeValues.items() if k.startswith(":busy")]
+        if ConditionExpression and item.get("status") in busy:
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+        item["status"] = ExpressionAttributeValues[":status"]
+
+    def query(self, ExpressionAttributeValues, ScanIndexForward, Limit, **kwargs):
+        session_id = ExpressionAttributeValues[":s"]["S"]
+        after = int((ExpressionAttributeValues.get(":since") or ExpressionAttributeValues[":meta"])["N"])
+        steps = sorted((k[1] for k in self.items if k[0] == session_id and k[1] > after), reverse=not ScanIndexForward)
+        return {"Items": [self.items[(session_id, step)] for step in steps[:Limit]]}
+
+
+def test_session_log_writes_one_item_per_step_in_batches():
+    dynamo = FakeDynamo(unprocessed_once=True)
+    log = SessionLog(dynamo, "AgentMemory", "s-1")
+    for i in range(30):
+        log.append({"step": i, "result": "ok"})
+    log.close()
+
+    written = [r["PutRequest"]["Item"] for call in dynamo.calls for r in call["AgentMemory"]]
+    assert [len(call["AgentMemory"]) for call in dynamo.calls] == [25, 1, 5]
+    assert sorted({int(item["step"]["N"]) for item in written}) == list(range(1, 31))
+    assert log.next_step == 31
+
+
+def test_session_log_resume_loads_recent_steps_and_older_summaries():
+    dynamo = FakeDynamo()
+    log = SessionLog(dynamo, "AgentMemory", "s-2", goal="Analyze customer 9 health")
+    for i in range(1, 11):
+        log.append({"step": i, "decision": {"tool": "get_customer_metrics", "arguments": {"customer_id": str(i)}}, "result": {"nps": i}})
+    log.close()
+
+    resumed, entries, earlier = SessionLog.resume(dynamo, "AgentMemory", "s-2", recent=3)
+
+    assert [e["step"] for e in entries] == [8, 9, 10]
+    assert len(earlier) == 7 and earlier[0].startswith('get_customer_metrics({"customer_id":"1"})')
+    assert resumed.next_step == 11
+    assert resumed.goal == "Analyze customer 9 health"
+    assert SessionLog.resume(dynamo, "AgentMemory", "missing", recent=3) is None
+
+
+def test_context_stays_within_budget_as_history_grows():
+    big_result = {"customer_id": "1", "notes": "x" * 5000, "ResponseMetadata": {"RequestId": "r"}}
+    history = [
+        {"step": i, "decision": {"tool": "get_customer_metrics", "arguments": {"customer_id": str(i)}}, "result": big_result}
+        for i in range(1, 40)
+    ]
+    short = build_context("Analyze customer 1 health", ["get_customer_metrics"], history[:2], [], 400)
+    long = build_context("Analyze customer 1 health", ["get_customer_metrics"], history, ["older summary"], 400)
+
+    assert estimate_tokens(long) <= 400
+    assert "ResponseMetadata" not in short
+    assert '"customer_id":"39"' in long
+
+
+def test_registry_binds_local_and_remote_tools():
+    class FakeLambda:
+        def __init__(self):
+            self.invoked = []
+
+        def invoke(self, FunctionName, InvocationType, Payload):
+            self.invoked.append(FunctionName)
+            return {"Payload": io.BytesIO(json.dumps({"status": "alert_sent"}).encode())}
+
+    fake_lambda = FakeLambda()
+    registry = ToolRegistry.from_config(
+        {"summarize_metrics": "local:summarize", "send_alert": "arn:aws:lambda:us-east-1:1:function:SendAlertFn"},
+        fake_lambda,
+    )
+
+    summary = registry.invoke("summarize_metrics", {"metrics": {"customer_id": "5", "uptime": 99, "tickets": 1, "nps": 70}})
+    assert summary["summary"].startswith("Customer 5 has 99% uptime")
+    assert registry.invoke("send_alert", {"customer_id": "5"}) == {"status": "alert_sent"}
+    assert fake_lambda.invoked == ["arn:aws:lambda:us-east-1:1:function:SendAlertFn"]
+    assert registry.is_local("summarize_metrics") and not registry.is_local("send_alert")
+
+
+def run_plan(plan, goal, metrics):
+    """Drives a PlanReplay like the router does; `metrics` plays get_customer_metrics."""
+    _, params = goal_template(goal)
+    replay, decisions = PlanReplay(plan, params), []
+    while True:
+        decision = replay.next_decision()
+        if decision is None or decision["tool"] == "final_answer":
+            return decisions, decision
+        decisions.append(decision)
+        replay.observe([metrics if decision["tool"] == "get_customer_metrics" else {"summary": "s"}])
+
+
+def test_plan_cache_replays_recorded_sequence_with_new_arguments():
+    metrics = {"customer_id": "123", "uptime": 99.8, "nps": 87}
+    steps = [
+        ([{"tool": "get_customer_metrics", "arguments": {"customer_id": "123"}}], [metrics]),
+        ([{"tool": "summarize_metrics", "arguments": {"metrics": metrics}}], [{"summary": "s"}]),
+    ]
+    template, params = goal_template("Analyze customer 123 health")
+    plan = build_plan(params, steps, "Customer 123 is healthy.")
+    assert template == "analyze customer {0} health"
+
+    # Same results: the whole session replays, final answer included
+    decisions, final = run_plan(plan, "Analyze  customer 456 health", dict(metrics, customer_id="456"))
+    assert decisions[0]["arguments"] == {"customer_id": "456"}
+    assert decisions[1]["arguments"]["metrics"]["customer_id"] == "456"
+    assert final == {"tool": "final_answer", "result": "Customer 456 is healthy."}
+
+    # Different values: tool steps replay, but the final answer goes back to the model
+    decisions, final = run_plan(plan, "Analyze customer 789 health", dict(metrics, customer_id="789", uptime=80.0))
+    assert [d["tool"] for d in decisions] == ["get_customer_metrics", "summarize_metrics"]
+    assert final is None
+
+
+def test_plan_replay_never_repeats_side_effects_off_the_recorded_path():
+    metrics = {"customer_id": "1", "uptime": 90.0}
+    steps = [
+        ([{"tool": "get_customer_metrics", "arguments": {"customer_id": "1"}}], [metrics]),
+        ([{"tool": "send_alert", "arguments": {"customer_id": "1"}}], [{"status": "alert_sent"}]),
+    ]
+    _, params = goal_template("Analyze customer 1 health")
+    plan = build_plan(params, steps, "Alerted.")
+
+    decisions, final = run_plan(plan, "Analyze customer 2 health", {"customer_id": "2", "uptime": 99.9})
+    assert [d["tool"] for d in decisions] == ["get_customer_metrics"]
+    assert final is None
+
+
+def test_trace_records_session_and_replays_it_offline(monkeypatch, tmp_path):
+    replies = iter([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": "31"}}',
+        '{"tool": "final_answer", "result": "Customer 31 is fine."}',
+    ])
+    monkeypatch.setattr(router, "call_bedrock", lambda *a: next(replies))
+    monkeypatch.setattr(router, "invoke_tool", lambda name, args: {"customer_id": "31", "uptime": 99.9})
+    monkeypatch.setattr(router, "TRACE_MODE", "record")
+    monkeypatch.setattr(router, "TRACE_DIR", str(tmp_path))
+    event = {"body": json.dumps({"goal": "Trace customer 31"})}
+    recorded = json.loads(router.handler(event, None)["body"])
+    trace_file = tmp_path / f"{recorded['session_id']}.json"
+    assert [e["kind"] for e in json.loads(trace_file.read_text())["events"]] == ["model", "tools", "model"]
+
+    # Replay: no Bedrock, no tools, same answer, one profile row per iteration
+    def offline(*args):
+        raise AssertionError("replay must stay offline")
+    monkeypatch.setattr(router, "call_bedrock", offline)
+    monkeypatch.setattr(router, "invoke_tool", offline)
+    monkeypatch.setattr(router, "TRACE_MODE", "replay")
+    monkeypatch.setattr(router, "TRACE_FILE", str(trace_file))
+    replayed = json.loads(router.handler(event, None)["body"])
+    assert replayed["result"] == recorded["result"] == "Customer 31 is fine."
+    profile = replayed["profile"]
+    assert [it["iteration"] for it in profile["iterations"]] == [1, 2]
+    assert set(profile["totals"]) == {"prompt_ms", "model_ms", "parse_ms", "dispatch_ms", "persist_ms"}
+    assert profile["divergences"] == 0
+
+
+class FakeInvokeBedrock:
+    def __init__(self, texts):
+        self.texts = iter(texts)
+
+    def invoke_model(self, **kwargs):
+        body = {"content": [{"text": next(self.texts)}], "usage": {"input_tokens": 120, "output_tokens": 18}}
+        return {"body": io.BytesIO(json.dumps(body).encode())}
+
+
+def test_handler_flushes_emf_metrics_once_per_invocation(monkeypatch):
+    out = io.StringIO()
+    monkeypatch.setattr(router.metrics, "out", out)
+    monkeypatch.setattr(router, "bedrock", FakeInvokeBedrock([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": "77"}}',
+        "not json",
+    ]))
+    router.handler({"body": json.dumps({"goal": "Meter customer 77"})}, None)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    values = {k: v for r in records for k, v in r.items() if k not in ("_aws", "Service", "Model")}
+    assert len(values["BedrockLatency"]) == 2
+    assert values["InputTokens"] == [120, 120] and values["OutputTokens"] == [18, 18]
+    assert values["ParseFailures"] == 1 and values["Iterations"] == 2
+    model_record = next(r for r in records if "BedrockLatency" in r)
+    directive = model_record["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["Service", "Model"]]
+    assert {"Name": "BedrockLatency", "Unit": "Milliseconds"} in directive["Metrics"]
+    assert router.metrics.flush() == []
+
+
+def test_debug_payloads_logged_only_for_sampled_or_failed_sessions(monkeypatch, caplog):
+    replies = {"ok": '{"tool": "final_answer", "result": "fine"}', "bad": "no json here"}
+    monkeypatch.setattr(router, "call_bedrock", lambda prompt, *a: replies["bad" if "broken" in prompt else "ok"])
+    caplog.set_level("INFO")
+
+    monkeypatch.setattr(debug_log, "LOG_SAMPLE_RATE", 0.0)
+    router.handler({"body": json.dumps({"goal": "Quiet customer 5"})}, None)
+    assert not [r for r in caplog.records if "[DEBUG]" in r.getMessage()]
+
+    router.handler({"body": json.dumps({"goal": "Quiet broken customer 6"})}, None)
+    dumped = [r.getMessage() for r in caplog.records if "[DEBUG]" in r.getMessage()]
+    assert "failed (unparseable model output)" in dumped[0]
+    assert any("Raw model output: no json here" in line for line in dumped)
+
+    caplog.clear()
+    monkeypatch.setattr(debug_log, "LOG_SAMPLE_RATE", 1.0)
+    router.handler({"body": json.dumps({"goal": "Sampled customer 7"})}, None)
+    assert any("Raw model output:" in r.getMessage() for r in caplog.records)
+
+
+def test_capped_payload_formats_lazily_and_truncates():
+    value = {"text": "x" * 50}
+    payload = Capped(value, limit=20)
+    assert payload.value is value  # nothing serialized until the line is emitted
+    assert str(payload) == '{"text": "xxxxxxxxxx... [62 chars]'
+
+
+def throttle():
+    from botocore.exceptions import ClientError
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "InvokeModel")
+
+
+def test_resilient_retries_throttles_then_trips_and_fails_fast():
+    now, sleeps = [0.0], []
+    breaker = CircuitBreaker(threshold=3, reset_after=10.0, clock=lambda: now[0])
+    guard = Resilient("bedrock", retries=3, breaker=breaker, sleep=sleeps.append)
+
+    outcomes = iter([throttle(), throttle(), "ok"])
+    def flaky():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    assert guard.call(flaky) == "ok"
+    assert guard.counters["retries"] == 2 and len(sleeps) == 2
+    assert all(0 <= s <= guard.max_delay for s in sleeps)
+
+    # Saturated: the third consecutive throttle opens the circuit, later calls never reach Bedrock
+    calls = []
+    def saturated():
+        calls.append(1)
+        raise throttle()
+    with pytest.raises(Unavailable):
+        guard.call(saturated)
+    assert breaker.state == "open" and guard.counters["trips"] == 1 and len(calls) == 3
+    with pytest.raises(CircuitOpen):
+        guard.call(saturated)
+    assert len(calls) == 3
+
+    # After reset_after one probe goes through and closes the circuit again
+    now[0] += 10.0
+    assert guard.call(lambda: "back") == "back" and breaker.state == "closed"
+
+    # Errors that are not throttles are never retried
+    with pytest.raises(ValueError):
+        guard.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+
+
+def test_resilient_counters_survive_concurrent_calls():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, so unguarded increments would be lost
+    try:
+        guard = Resilient("shared")
+        threads = [threading.Thread(target=lambda: [guard.call(lambda: None) for _ in range(2000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert guard.counters["calls"] == 16000
+
+
+def test_token_bucket_limits_rate_and_rejects_long_waits():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+    guard = Resilient("bedrock", bucket=bucket, max_wait=0.75, sleep=lambda s: None)
+    with pytest.raises(RateLimited):
+        guard.call(lambda: "never")
+    assert guard.counters["rate_limited"] == 1
+
+
+def test_handler_returns_503_when_bedrock_circuit_is_open(monkeypatch):
+    breaker = CircuitBreaker(threshold=1)
+    breaker.failure()
+    monkeypatch.setattr(router, "bedrock_guard", Resilient("bedrock", breaker=breaker))
+    response = router.handler({"body": json.dumps({"goal": "Busy customer 9"})}, None)
+    assert response["statusCode"] == 503
+    assert json.loads(response["body"])["session_id"]
+
+
+def test_handler_returns_503_when_a_tool_keeps_throttling(monkeypatch):
+    class ThrottledLambda:
+        calls = 0
+
+        def invoke(self, **kwargs):
+            self.calls += 1
+            raise throttle()
+
+    client = ThrottledLambda()
+    tools = ToolRegistry(client)
+    tools.bind_remote("get_customer_metrics", "arn:aws:lambda:us-east-1:1:function:GetMetricsFn")
+    monkeypatch.setattr(router, "registry", tools)
+    monkeypatch.setattr(router, "tool_guards", {
+        "get_customer_metrics": Resilient("tool:get_customer_metrics", retries=2, sleep=lambda s: None),
+    })
+    monkeypatch.setattr(router, "call_bedrock",
+                        lambda *a: '{"tool": "get_customer_metrics", "arguments": {"customer_id": "4"}}')
+
+    response = router.handler({"body": json.dumps({"goal": "Check customer 4"})}, None)
+    assert response["statusCode"] == 503
+    assert json.loads(response["body"])["session_id"] and client.calls == 3
+
+
+def test_hedger_sends_second_request_only_when_primary_is_slow():
+    hedger = Hedger(percentile=95, min_delay_ms=20)
+    assert hedger.call(lambda: "fast", lambda: "hedge") == "fast"
+    assert hedger.counters["hedges"] == 0
+
+    release = threading.Event()
+    def slow():
+        release.wait(2)
+        return "slow"
+    assert hedger.call(slow, lambda: "hedge") == "hedge"
+    assert hedger.counters == {"hedges": 1, "hedge_wins": 1, "hedges_skipped": 0}
+    release.set()
+
+    # No free hedge slot: the call waits for its primary instead of queueing a hedge
+    full = Hedger(percentile=95, min_delay_ms=20, slots=threading.BoundedSemaphore(1))
+    full.slots.acquire()
+    assert full.call(lambda: time.sleep(0.05) or "primary", lambda: "hedge") == "primary"
+    assert full.counters == {"hedges": 0, "hedge_wins": 0, "hedges_skipped": 1}
+
+    # Once enough samples exist the delay follows the observed percentile
+    window = LatencyWindow()
+    for ms in range(1, 101):
+        window.add(float(ms))
+    assert window.percentile(95) == 96.0
+    assert Hedger(95, min_delay_ms=10, window=window).delay_ms() == 96.0
+    assert Hedger(0).call(lambda: threading.current_thread(), None) is threading.current_thread()
+
+
+def test_fast_model_handles_routine_steps_and_escalates_the_rest(monkeypatch):
+    monkeypatch.setattr(router, "FAST_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+    fast = iter([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": "41"}}',
+        "Sure! Next I would call",
+        '{"tool": "final_answer", "result": "draft"}',
+    ])
+    strong = iter([
+        '{"tool": "summarize_metrics", "arguments": {"metrics": {"customer_id": "41"}}}',
+        '{"tool": "final_answer", "result": "Customer 41 is healthy."}',
+    ])
+    models = []
+    def call_bedrock(prompt, model_id, *args):
+        models.append("fast" if "haiku" in model_id else "strong")
+        return next(fast if "haiku" in model_id else strong)
+    monkeypatch.setattr(router, "call_bedrock", call_bedrock)
+
+    body = json.loads(router.handler({"body": json.dumps({"goal": "Route customer 41"})}, None)["body"])
+    assert models == ["fast", "fast", "strong", "fast", "strong"]
+    assert [h["decision"]["tool"] for h in body["conversation"]] == [
+        "get_customer_metrics", "summarize_metrics", "final_answer"]
+    assert body["result"] == "Customer 41 is healthy."
+
+
+class FakeConverse:
+    """Scripted Converse replies; keeps every request for inspection."""
+
+    def __init__(self, replies):
+        self.replies, self.requests = iter(replies), []
+
+    def converse(self, **request):
+        self.requests.append(json.loads(json.dumps(request)))
+        content, stop = next(self.replies)
+        return {"output": {"message": {"role": "assistant", "content": content}}, "stopReason": stop,
+                "usage": {"inputTokens": 300, "outputTokens": 40}}
+
+
+def test_converse_engine_uses_tool_use_blocks_as_multi_turn_messages(monkeypatch):
+    fake = FakeConverse([
+        ([{"toolUse": {"toolUseId": "t1", "name": "get_customer_metrics", "input": {"customer_id": "88"}}}], "tool_use"),
+        ([{"text": "Checking uptime."},
+          {"toolUse": {"toolUseId": "t2", "name": "summarize_metrics", "input": {"metrics": {"uptime": 99.8}}}}], "tool_use"),
+        ([{"text": "Customer 88 is healthy."}], "end_turn"),
+    ])
+    monkeypatch.setattr(router, "ENGINE", "converse")
+    monkeypatch.setattr(router, "bedrock", fake)
+    body = json.loads(router.handler({"body": json.dumps({"goal": "Converse customer 88"})}, None)["body"])
+
+    assert body["result"] == "Customer 88 is healthy."
+    assert [h["decision"]["tool"] for h in body["conversation"]] == [
+        "get_customer_metrics", "summarize_metrics", "final_answer"]
+    specs = {t["toolSpec"]["name"]: t["toolSpec"] for t in fake.requests[0]["toolConfig"]["tools"]}
+    assert specs["get_customer_metrics"]["inputSchema"]["json"]["required"] == ["customer_id"]
+    assert "JSON" not in fake.requests[0]["system"][0]["text"]
+
+    last = fake.requests[-1]["messages"]
+    assert [m["role"] for m in last] == ["user", "assistant", "user", "assistant", "user"]
+    result = last[2]["content"][0]["toolResult"]
+    assert result["toolUseId"] == "t1" and result["status"] == "success"
+    assert result["content"][0]["json"]["customer_id"] == "88"
+    assert last[4]["content"][0]["toolResult"]["toolUseId"] == "t2"
+
+
+def test_validation_repairs_simple_mistakes_and_rejects_the_rest():
+    known = ["get_customer_metrics", "summarize_metrics", "send_alert"]
+    call, notes, error = validate_call(
+        {"tool": "Summarize-Metrics", "arguments": {"metrics_json": '{"uptime": 99.1}'}}, known)
+    assert error is None and call == {"tool": "summarize_metrics", "arguments": {"metrics": {"uptime": 99.1}}}
+    assert len(notes) == 3
+
+    call, _, error = validate_call({"tool": "get_customer_metric", "arguments": {"customerId": 42}}, known)
+    assert error is None and call == {"tool": "get_customer_metrics", "arguments": {"customer_id": "42"}}
+
+    assert validate_call({"tool": "delete_customer", "arguments": {}}, known)[2].startswith("Unknown tool")
+    _, notes, error = validate_call({"tool": "send_alert", "arguments": "not json"}, known)
+    assert error.endswith("must be a JSON object") and notes == []
+    _, notes, error = validate_call({"tool": "send_alert", "arguments": '{"customer_id": "5"}'}, known)
+    assert error is None and notes == ["arguments parsed from a JSON string"]
+    assert "customer_id" in validate_call({"tool": "send_alert", "arguments": {}}, known)[2]
+
+
+def test_invalid_calls_get_a_targeted_error_without_dispatch(monkeypatch):
+    dispatched = []
+    monkeypatch.setattr(router, "invoke_tool", lambda name, args: dispatched.append(name) or {"ok": True})
+    calls, results = router.run_calls([
+        {"tool": "reboot_everything", "arguments": {}},
+        {"tool": "get_customer_metrics", "arguments": {"customer": "7"}},
+    ], SessionTrace())
+    assert dispatched == ["get_customer_metrics"]
+    assert calls[1]["arguments"] == {"customer_id": "7"}
+    assert results[0]["error"].startswith("Unknown tool 'reboot_everything'")
+    assert results[1] == {"ok": True}
+
+    # An empty batch is an error step, not an iteration that does nothing
+    _, results = router.run_calls(router.tool_calls({"tools": []}), SessionTrace())
+    assert dispatched == ["get_customer_metrics"] and results[0]["error"].startswith("Unknown tool None")
+
+
+class FakeCacheTable:
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, TableName, Item):
+        self.items[Item["key"]["S"]] = Item
+
+    def get_item(self, TableName, Key):
+        return {"Item": self.items.get(Key["key"]["S"])}
+
+
+def test_failed_lambda_tool_result_is_not_cached(monkeypatch):
+    class FailingLambda:
+        def invoke(self, **kwargs):
+            return {
+                "FunctionError": "Unhandled",
+                "Payload": io.BytesIO(b'{"errorMessage": "boom", "errorType": "KeyError"}'),
+            }
+
+    tools = ToolRegistry(FailingLambda())
+    tools.bind_remote("get_customer_metrics", "arn:aws:lambda:us-east-1:1:function:GetMetricsFn")
+    cache = ToolResultCache(FakeCacheTable(), "ToolCache")
+    monkeypatch.setattr(router, "registry", tools)
+    monkeypatch.setattr(router, "tool_cache", cache)
+
+    assert router.invoke_tool("get_customer_metrics", {"customer_id": "2"}) == {"error": "KeyError: boom"}
+    assert cache.get("get_customer_metrics", {"customer_id": "2"}) == (False, None)
+
+
+def test_tool_cache_serves_fresh_results_and_never_side_effects():
+    dynamo, now = FakeCacheTable(), [1000.0]
+    cache = ToolResultCache(dynamo, "ToolCache", {"get_customer_metrics": 60, "send_alert": 60}, clock=lambda: now[0])
+
+    metrics = {"customer_id": "5", "uptime": 99.0}
+    assert cache.get("get_customer_metrics", {"customer_id": "5"}) == (False, None)
+    cache.put("get_customer_metrics", {"customer_id": "5"}, metrics)
+    assert cache.get("get_customer_metrics", {"customer_id": "5"}) == (True, metrics)
+
+    # A cold container finds it in DynamoDB, until the TTL passes
+    cold = ToolResultCache(dynamo, "ToolCache", cache.ttls, clock=lambda: now[0])
+    assert cold.get("get_customer_metrics", {"customer_id": "5"}) == (True, metrics)
+    now[0] += 61
+    assert cold.get("get_customer_metrics", {"customer_id": "5"}) == (False, None)
+
+    cache.put("send_alert", {"customer_id": "5"}, {"status": "alert_sent"})
+    cache.put("get_customer_metrics", {"customer_id": "6"}, {"error": "boom"})
+    assert cache.get("send_alert", {"customer_id": "5"}) == (False, None)
+    assert cache.get("get_customer_metrics", {"customer_id": "6"}) == (False, None)
+    assert list(dynamo.items) == ['get_customer_metrics#{"customer_id":"5"}']
+
+
+def test_empty_tool_cache_ttls_turn_caching_off():
+    script = "import router; print(router.tool_cache.ttls)"
+    for value, expected in [("{}", "{}"), (None, "{'get_customer_metrics': 300, 'summarize_metrics': 3600}")]:
+        env = dict(os.environ)
+        env.pop("TOOL_CACHE_TTLS", None)
+        if value is not None:
+            env["TOOL_CACHE_TTLS"] = value
+        proc = subprocess.run([sys.executable, "-c", script], cwd=lambda_dir, env=env, capture_output=True, text=True, check=True)
+        assert proc.stdout.strip() == expected
+
+
+def test_prefetch_runs_predicted_tool_during_model_call(monkeypatch):
+    started, calls = threading.Event(), []
+    def metrics_tool(args, context):
+        calls.append(("metrics", args))
+        started.set()
+        return {"customer_id": args["customer_id"], "uptime": 99.5, "nps": 70}
+    def summarize_tool(args, context):
+        calls.append(("summarize", args))
+        return {"summary": "ok"}
+    registry = ToolRegistry()
+    registry.bind_local("get_customer_metrics", metrics_tool)
+    registry.bind_local("summarize_metrics", summarize_tool)
+
+    replies = iter([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": "c-901"}}',
+        '{"tool": "summarize_metrics", "arguments": {"metrics": {"customer_id": "other"}}}',
+        '{"tool": "final_answer", "result": "done"}',
+    ])
+    def call_bedrock(*args):
+        started.wait(2)
+        return next(replies)
+    monkeypatch.setattr(router, "registry", registry)
+    monkeypatch.setattr(router, "call_bedrock", call_bedrock)
+    monkeypatch.setattr(router, "PREFETCH", True)
+    monkeypatch.setattr(router, "tool_cache", ToolResultCache(None, None, {}))
+
+    router.handler({"body": json.dumps({"goal": "Prefetch customer c-901"})}, None)
+    # Step 1 used the prefetched metrics; step 2's guess had other arguments, so the model's call ran too
+    assert [c[0] for c in calls].count("metrics") == 1
+    assert ("summarize", {"metrics": {"customer_id": "other"}}) in calls
+    assert predict_call("Notify the team", []) is None
+    assert predict_call("Check customer 12", [])["arguments"] == {"customer_id": "12"}
+
+
+def test_deadline_uses_the_slowest_recent_step():
+    now = [0.0]
+    remaining = [10000]
+    deadline = Deadline(lambda: remaining[0], margin_ms=1000, default_step_ms=3000,
+                        window=LatencyWindow(), clock=lambda: now[0])
+    assert deadline.estimate_ms() == 3000 and deadline.allows_step()
+    for seconds in (2.0, 4.0, 1.0):
+        deadline.start_step()
+        now[0] += seconds
+        deadline.end_step()
+    assert deadline.estimate_ms() == 4000
+    remaining[0] = 4500
+    assert not deadline.allows_step()
+    assert Deadline.from_context(None).allows_step()
+
+
+def test_router_checkpoints_with_a_partial_answer_near_the_deadline(monkeypatch):
+    class Context:
+        remaining = iter([30000, 30000, 500])
+
+        def get_remaining_time_in_millis(self):
+            return next(self.remaining)
+
+    monkeypatch.setattr(router, "call_bedrock",
+                        lambda *a: '{"tool": "get_customer_metrics", "arguments": {"customer_id": "7"}}')
+    response = router.handler({"body": json.dumps({"goal": "Check customer 7"})}, Context())
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 200 and body["partial"] is True
+    assert body["result"].startswith("Partial result after 2 step(s)")
+    assert len([h for h in body["conversation"] if "step" in h]) == 2
+
+
+def test_async_session_runs_from_the_queue_and_reports_progress(monkeypatch):
+    class FakeSqs:
+        messages = []
+
+        def send_message(self, QueueUrl, MessageBody, **kwargs):
+            self.messages.append(MessageBody)
+
+    dynamo, queue = FakeDynamo(), FakeSqs()
+    monkeypatch.setattr(router, "dynamo", dynamo)
+    monkeypatch.setattr(router, "sqs", queue)
+    monkeypatch.setattr(router, "TABLE", "AgentMemory")
+    monkeypatch.setattr(router, "JOB_QUEUE_URL", "https://sqs/jobs")
+    replies = iter([
+        '{"tool": "get_customer_metrics", "arguments": {"customer_id": "8"}}',
+        '{"tool": "final_answer", "result": "healthy"}',
+    ])
+    monkeypatch.setattr(router, "call_bedrock", lambda *a: next(replies))
+
+    def poll(session_id, since):
+        response = router.handler({"httpMethod": "GET", "pathParameters": {"session_id": session_id},
+                                   "queryStringParameters": {"since": str(since)}}, None)
+        return json.loads(response["body"])
+
+    accepted = router.handler({"body": json.dumps({"goal": "Check customer 8", "async": True})}, None)
+    session_id = json.loads(accepted["body"])["session_id"]
+    assert accepted["statusCode"] == 202
+    assert poll(session_id, 0)["status"] == "queued" and len(queue.messages) == 1
+    again = {"body": json.dumps({"session_id": session_id, "async": True})}
+    assert router.handler(again, None)["statusCode"] == 409 and len(queue.messages) == 1
+
+    router.handler({"Records": [{"body": queue.messages[0]}]}, None)
+
+    progress = poll(session_id, 0)
+    assert progress["status"] == "done" and progress["goal"] == "Check customer 8"
+    assert [s["entry"]["decision"]["tool"] for s in progress["steps"]] == ["get_customer_metrics", "final_answer"]
+    assert poll(session_id, progress["next"])["steps"] == []
+    assert poll(session_id, 1)["steps"][0]["entry"]["result"] == "healthy"
+    assert router.handler({"httpMethod": "GET", "pathParameters": {"session_id": "nope"}}, None)["statusCode"] == 404
+    assert router.handler(again, None)["statusCode"] == 202 and len(queue.messages) == 2  # finished: may run again
+
+
+def test_async_jobs_continue_past_max_iterations_then_fail(monkeypatch):
+    sent = []
+    dynamo = FakeDynamo()
+    monkeypatch.setattr(router, "dynamo", dynamo)
+    monkeypatch.setattr(router, "sqs", type("Sqs", (), {"send_message": lambda self, **kw: sent.append(kw)})())
+    monkeypatch.setattr(router, "TABLE", "AgentMemory")
+    monkeypatch.setattr(router, "JOB_QUEUE_URL", "https://sqs/jobs")
+    monkeypatch.setattr(router, "JOB_DLQ_ARN", "arn:aws:sqs:us-east-1:1:AgentJobsDLQ")
+    monkeypatch.setattr(router, "MAX_ITERATIONS", 2)
+    monkeypatch.setattr(router, "MAX_JOB_RUNS", 2)
+    monkeypatch.setattr(router, "call_bedrock",
+                        lambda *a: '{"tool": "get_customer_metrics", "arguments": {"customer_id": "6"}}')
+    status = lambda sid: dynamo.items[(sid, 0)]["status"]["S"]
+
+    session_id = json.loads(router.handler({"body": json.dumps({"goal": "Dig into customer 6", "async": True})}, None)["body"])["session_id"]
+    router.handler({"Records": [{"body": sent[-1]["MessageBody"]}]}, None)
+    assert status(session_id) == "incomplete" and json.loads(sent[-1]["MessageBody"])["runs"] == 1
+
+    router.handler({"Records": [{"body": sent[-1]["MessageBody"]}]}, None)
+    assert status(session_id) == "failed" and len(sent) == 2  # MAX_JOB_RUNS reached
+    assert dynamo.items[(session_id, 0)]["last_step"]["N"] == "6"  # both runs kept their steps
+    # The resumed run numbers its steps after the stored ones: 1, 2, warning, then 4, 5, warning
+    entries = {step: json.loads(dynamo.items[(session_id, step)]["entry"]["S"]) for step in range(1, 7)}
+    assert [entries[step].get("step") for step in range(1, 7)] == [1, 2, None, 4, 5, None]
+
+    other = json.loads(router.handler({"body": json.dumps({"goal": "Check customer 7", "async": True})}, None)["body"])["session_id"]
+    router.handler({"Records": [{"body": sent[-1]["MessageBody"], "eventSourceARN": router.JOB_DLQ_ARN}]}, None)
+    assert status(other) == "failed"
+
+
+def test_plan_cache_survives_concurrent_sessions():
+    cache = PlanCache(None, None, size=4)
+    errors = []
+
+    def session(n):
+        try:
+            for i in range(2000):
+                cache.put(f"goal {(n + i) % 8}", {"steps": []})
+                cache.get(f"goal {(n + i + 1) % 8}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and len(cache._plans) <= 4
+
+
+def test_sweep_runs_sessions_concurrently_and_aggregates(monkeypatch):
+    import batch
+
+    def call_bedrock(prompt, *args):
+        goal = prompt.split("\n")[0]
+        if "Recent steps:" not in prompt:
+            customer = goal.split()[-2]
+            return json.dumps({"tool": "get_customer_metrics", "arguments": {"customer_id": customer}})
+        if "sick" in goal and "send_alert" not in prompt:
+            return json.dumps({"tool": "send_alert", "arguments": {"customer_id": goal.split()[-2]}})
+        return '{"tool": "final_answer", "result": "checked"}'
+    monkeypatch.setattr(router, "call_bedrock", call_bedrock)
+
+    report = batch.handler({"customer_ids": ["s1", "s2", "sick-3"], "goal_template": "Sweep customer {customer_id} now"}, None)
+    assert report["sessions"] == 3
+    assert report["by_status"] == {"ok": 2, "alerted": 1}
+    assert report["alerted"] == ["sick-3"] and report["needs_attention"] == []
+    assert batch.sweep_goals({"goals": ["a", "b"]}) == [("0", "a"), ("1", "b")]
+
+
+def test_session_writers_scale_with_sweep_concurrency():
+    env = dict(os.environ, SWEEP_CONCURRENCY="16")
+    env.pop("SESSION_WRITER_THREADS", None)
+    proc = subprocess.run(
+        [sys.executable, "-c", "import session_store; print(session_store.writer_pool._max_workers)"],
+        cwd=lambda_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    assert proc.stdout.strip() == "16"
+
+
+def test_local_tools_keep_the_routers_log_level():
+    """Tools bound in-process are imported after the router applied LOG_LEVEL."""
+    env = dict(os.environ, LOG_LEVEL="WARNING", TOOLS=json.dumps({"summarize_metrics": "local:summarize"}))
+    proc = subprocess.run(
+        [sys.executable, "-c", "import logging, router; print(logging.getLevelName(logging.getLogger().level))"],
+        cwd=lambda_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    assert proc.stdout.strip() == "WARNING"
+
+
+def test_alert_is_logged_by_a_deployed_tool_lambda():
+    env = dict(os.environ)
+    env.pop("LOG_LEVEL", None)
+    proc = subprocess.run(
+        [sys.executable, "-c", "import logging, send_alert; logging.basicConfig(); send_alert.handler({'customer_id': '9'}, None)"],
+        cwd=lambda_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    assert "Alert triggered for customer 9" in proc.stderr
+
+
+def test_router_import_time_within_budget():
+    """Profiles `python -X importtime`; boto3 must stay out of module import."""
+    assert_import_budget("router", lambda_dir, budget_ms=120)
@@ -0,0 +1,253 @@
+"""
+In-process stand-ins for Bedrock, DynamoDB, Lambda and SQS, with configurable
+latency and throttling, so handlers can be load-tested without AWS.
+"""
+import io, json, random, re, threading, time
+
+from botocore.exceptions import ClientError
+
+
+class Latency:
+    """
+    Latency distribution in milliseconds.
+    Spec strings: "0", "fixed:20", "uniform:10:50" or "lognormal:<median>:<p99>".
+    """
+
+    def __init__(self, spec: str = "0", rng: random.Random = None):
+        self.rng = rng or random.Random()
+        kind, *args = str(spec).split(":")
+        if not args:
+            kind, args = "fixed", [kind]
+        self.kind, self.args = kind, [float(a) for a in args]
+
+    def sample_ms(self) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.args)
+        if self.kind == "lognormal":
+            import math
+            median, p99 = self.args
+            sigma = math.log(max(p99, median * 1.0001) / median) / 2.326
+            return self.rng.lognormvariate(math.log(median), sigma)
+        raise ValueError(f"Unknown latency distribution {self.kind}")
+
+    def wait(self):
+        ms = self.sample_ms()
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+
+class FakeService:
+    """Shared latency + throttling behaviour; counts calls per operation."""
+
+    service = "fake"
+
+    def __init__(self, latency: str = "0", throttle_rate: float = 0.0, seed: int = None):
+        self.rng = random.Random(seed)
+        self.latency = Latency(latency, self.rng)
+        self.throttle_rate = throttle_rate
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Clears the call counts, e.g. after a warm-up pass."""
+        with self._lock:
+            self.calls = {}
+
+    def _call(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            throttled = self.rng.random() < self.throttle_rate
+        self.latency.wait()
+        if throttled:
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                operation,
+            )
+
+
+# ==============================================================================
+#                            BEDROCK
+# ==============================================================================
+CUSTOMER_ID = re.compile(r"customer\s+([\w-]+)", re.IGNORECASE)
+
+
+def agent_policy(prompt: str) -> dict:
+    """Scripted model for the agent router: metrics -> summary -> final answer."""
+    goal = prompt.split("\n", 1)[0]
+    match = CUSTOMER_ID.search(goal)
+    customer_id = match.group(1) if match else "123"
+    recent = [
+        json.loads(line)
+        for line in prompt.rsplit("Recent steps:", 1)[-1].splitlines()
+        if "Recent steps:" in prompt and line.startswith("{")
+    ]
+    if not recent:
+        return {"tool": "get_customer_metrics", "arguments": {"customer_id": customer_id}}
+    if recent[-1].get("decision", {}).get("tool") == "get_customer_metrics":
+        return {"tool": "summarize_metrics", "arguments": {"metrics": recent[-1].get("result")}}
+    return {"tool": "final_answer", "result": f"Customer {customer_id} looks healthy."}
+
+
+class FakeBedrock(FakeService):
+    service = "bedrock-runtime"
+
+    def _reply(self, body: dict) -> str:
+        if "messages" in body:
+            prompt = body["messages"][-1]["content"][0]["text"]
+            return json.dumps(agent_policy(prompt))
+        text = body.get("inputText", "")
+        return "positive" if "good" in text.lower() else "neutral"
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._call("InvokeModel")
+        request = json.loads(body)
+        text = self._reply(request)
+        if "messages" in request:
+            payload = {
+                "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": len(json.dumps(request)) // 4, "output_tokens": len(text) // 4},
+            }
+        else:
+            payload = {"results": [{"outputText": text, "tokenCount": len(text) // 4}]}
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self._call("InvokeModelWithResponseStream")
+        request = json.loads(body)
+        text = self._reply(request)
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        if "messages" in request:
+            chunks = [{"type": "content_block_delta", "delta": {"type": "text_delta", "text": p}} for p in pieces]
+        else:
+            chunks = [{"outputText": p} for p in pieces]
+        return {"body": [{"chunk": {"bytes": json.dumps(c).encode()}} for c in chunks]}
+
+
+# ==============================================================================
+#                            DYNAMODB
+# ==============================================================================
+class FakeDynamoClient(FakeService):
+    """
+    Low-level client API used by the agent router. Tables are keyed on
+    (session_id, step) unless `key_schema` maps the table name to its key attributes.
+    """
+
+    service = "dynamodb"
+    SESSION_KEY = ("session_id", "step")
+
+    def __init__(self, *args, key_schema: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key_schema = key_schema or {}
+        self.items = {}
+
+    def _key(self, table: str, item: dict):
+        attributes = self.key_schema.get(table, self.SESSION_KEY)
+        return table, tuple(json.dumps(item.get(name), sort_keys=True) for name in attributes)
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._call("PutItem")
+        self.items[self._key(TableName, Item)] = Item
+        return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._call("GetItem")
+        item = self.items.get(self._key(TableName, Key))
+        return {"Item": item} if item else {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self._call("BatchWriteItem")
+        for table, requests in RequestItems.items():
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                self.items[self._key(table, item)] = item
+        return {"UnprocessedItems": {}}
+
+    def query(self, TableName, ExpressionAttributeValues, ScanIndexForward=True, Limit=None, **kwargs):
+        """Partition key equals the string value; sort key above the numeric value, if any."""
+        self._call("Query")
+        partition, sort = self.key_schema.get(TableName, self.SESSION_KEY)
+        values = ExpressionAttributeValues.values()
+        match = next(v for v in values if "S" in v)
+        lower = next((int(v["N"]) for v in values if "N" in v), float("-inf"))
+        items = [
+            item for (table, _), item in self.items.items()
+            if table == TableName and item.get(partition) == match
+            and int(item.get(sort, {}).get("N", 0)) > lower
+        ]
+        items.sort(key=lambda item: int(item[sort]["N"]), reverse=not ScanIndexForward)
+        return {"Items": items[:Limit] if Limit else items}
+
+
+class FakeBatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for i in range(0, len(self.buffer), 25):
+            self.table._call("BatchWriteItem")
+            for item in self.buffer[i:i + 25]:
+                self.table.items[item["id"]] = item
+        return False
+
+    def put_item(self, Item):
+        self.buffer.append(Item)
+
+
+class FakeTable(FakeService):
+    """boto3 Table resource subset used by the healthcheck handlers."""
+
+    service = "dynamodb"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.items = {}
+
+    def put_item(self, Item, **kwargs):
+        self._call("PutItem")
+        self.items[Item["id"]] = Item
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self._call("GetItem")
+        item = self.items.get(Key["id"])
+        return {"Item": item} if item else {}
+
+    def batch_writer(self):
+        return FakeBatchWriter(self)
+
+
+# ==============================================================================
+#                            LAMBDA + SQS
+# ==============================================================================
+class FakeLambda(FakeService):
+    """Runs tool handlers in-process after the configured network latency."""
+
+    service = "lambda"
+
+    def __init__(self, handlers: dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handlers = handlers  # function ARN/name -> callable(event, context)
+
+    def invoke(self, FunctionName, Payload=b"{}", InvocationType="RequestResponse", **kwargs):
+        self._call("Invoke")
+        result = self.handlers[FunctionName](json.loads(Payload), None)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result).encode())}
+
+
+class FakeSqs(FakeService):
+    service = "sqs"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self._call("SendMessage")
+        self.messages.append(MessageBody)
+        return {"MessageId": str(len(self.messages))}
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the blueprint handlers.
+
+Replays a JSONL request file (or a synthetic stream) against
+01/02/03 `handler.handler` or 05 `router.handler`, with Bedrock, DynamoDB,
+Lambda and SQS replaced by in-process fakes (bench/fakes.py).
+
+    python -m bench.loadtest --target 02 --synthetic 500 --concurrency 16
+    python -m bench.loadtest --target 05 --requests requests.jsonl --save-baseline bench/baselines/05.json
+    python -m bench.loadtest --target 05 --requests requests.jsonl --baseline bench/baselines/05.json
+"""
+import argparse, contextlib, importlib.util, json, os, random, sys, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bench.fakes import FakeBedrock, FakeDynamoClient, FakeLambda, FakeSqs, FakeTable
+
+REPO = Path(__file__).resolve().parent.parent
+
+# target -> (Lambda asset folder, handler module)
+TARGETS = {
+    "01": ("01_ai_healthcheck_api/lambda", "handler"),
+    "02": ("02_ai_healthcheck_bedrock/lambda", "handler"),
+    "03": ("03_bedrock_container/lambda", "handler"),
+    "05": ("05_agent/lambda", "router"),
+}
+
+# Metrics where a higher value is a regression (rps is the opposite)
+LOWER_IS_BETTER = ["p50_ms", "p95_ms", "p99_ms", "cpu_ms_per_request", "alloc_peak_kib_per_request"]
+
+ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EXECUTION_ENV": "bench",  # skip dotenv in 01
+    "RESULTS_TABLE": "AIHealthcheckResults",
+    "USE_MOCK_BEDROCK": "false",
+    "QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/000000000000/bench",
+    "TABLE_NAME": "AgentMemory",
+    "TOOLS": json.dumps({
+        "get_customer_metrics": "GetMetricsFn",
+        "summarize_metrics": "local:summarize",
+        "send_alert": "SendAlertFn",
+    }),
+}
+
+
+# ==============================================================================
+#                            TARGET LOADING
+# ==============================================================================
+def load_target(target: str, args):
+    """Imports the handler module from its asset folder and swaps in the fakes."""
+    folder, module_name = TARGETS[target]
+    path = REPO / folder
+    for key, value in ENV.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, str(path))
+
+    spec = importlib.util.spec_from_file_location(f"bench_{target}_{module_name}", path / f"{module_name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    seed = args.seed
+    bedrock = FakeBedrock(args.bedrock_latency, args.bedrock_throttle, seed)
+    fakes = {"bedrock": bedrock}
+    if target == "05":
+        import get_metrics, send_alert
+        # Cache tables, when enabled through the environment, have their own keys
+        key_schema = {module.PLAN_TABLE: ("template",), module.TOOL_CACHE_TABLE: ("key",)}
+        dynamo = FakeDynamoClient(args.dynamo_latency, 0.0, seed, key_schema=key_schema)
+        lambda_client = FakeLambda(
+            {"GetMetricsFn": get_metrics.handler, "SendAlertFn": send_alert.handler},
+            args.lambda_latency, args.lambda_throttle, seed,
+        )
+        module.bedrock, module.dynamo, module.lambda_client = bedrock, dynamo, lambda_client
+        module.hedge_bedrock = bedrock
+        module.hedger.percentile, module.hedger.min_delay_ms = args.hedge_percentile, args.hedge_min_ms
+        module.registry.lambda_client = lambda_client
+        module.plans.dynamo = dynamo
+        module.STREAMING = args.streaming
+        fakes.update(dynamo=dynamo, lambda_client=lambda_client)
+    else:
+        table = FakeTable(args.dynamo_latency, 0.0, seed)
+        module.table = table
+        if hasattr(module, "bedrock"):
+            module.bedrock = bedrock
+        if hasattr(module, "sqs"):
+            module.sqs = FakeSqs(args.dynamo_latency, 0.0, seed)
+        fakes["table"] = table
+    return module.handler, fakes
+
+
+# ==============================================================================
+#                            REQUEST SOURCES
+# ==============================================================================
+def load_requests(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_requests(count: int, seed: int):
+    rng = random.Random(seed)
+    moods = ["good", "slow", "great and good", "broken", "fine"]
+    return [
+        {
+            "text": f"Support was {rng.choice(moods)} for ticket {rng.randint(1, 10_000)}",
+            "goal": f"Analyze customer {rng.randint(1, 500)} health",
+        }
+        for _ in range(count)
+    ]
+
+
+def to_event(target: str, request: dict) -> dict:
+    """Maps a request line to an API Gateway event; backlog-style lines use title/body."""
+    text = request.get("text") or request.get("body") or request.get("title") or json.dumps(request)
+    if target == "05":
+        goal = request.get("goal") or request.get("title") or text
+        return {"resource": "/agent", "body": json.dumps({"goal": goal})}
+    return {"resource": "/analyze", "body": json.dumps({"text": text})}
+
+
+# ==============================================================================
+#                            RUN + REPORT
+# ==============================================================================
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_load(handler, events: list, concurrency: int) -> dict:
+    def one(event):
+        start = time.perf_counter()
+        try:
+            response = handler(event, None)
+            ok = response.get("statusCode", 200) < 500
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, events))
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    latencies = sorted(seconds * 1000 for seconds, _ in outcomes)
+    return {
+        "requests": len(events),
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "concurrency": concurrency,
+        "rps": round(len(events) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "cpu_ms_per_request": round(cpu * 1000 / max(len(events), 1), 3),
+    }
+
+
+def measure_allocations(handler, events: list, sample: int = 20) -> float:
+    """Mean peak traced memory (KiB) per request, measured sequentially."""
+    events = events[:sample]
+    if not events:
+        return 0.0
+    peaks = []
+    tracemalloc.start()
+    try:
+        for event in events:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            try:
+                handler(event, None)
+            except Exception:
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    return round(sum(peaks) / len(peaks) / 1024, 2)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Returns human-readable regressions beyond `tolerance` (0.1 = 10%)."""
+    regressions = []
+    for metric in LOWER_IS_BETTER:
+        old, new = baseline.get(metric), report.get(metric)
+        if old and new is not None and new > old * (1 + tolerance):
+            regressions.append(f"{metric}: {old} -> {new}")
+    if baseline.get("rps") and report["rps"] < baseline["rps"] * (1 - tolerance):
+        regressions.append(f"rps: {baseline['rps']} -> {report['rps']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=sorted(TARGETS), required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--requests", help="JSONL file, one request per line")
+    source.add_argument("--synthetic", type=int, help="generate N synthetic requests")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the request set N times")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--bedrock-latency", default="lognormal:400:2000", help="ms distribution, e.g. fixed:50")
+    parser.add_argument("--bedrock-throttle", type=float, default=0.0, help="probability of ThrottlingException")
+    parser.add_argument("--dynamo-latency", default="lognormal:8:40")
+    parser.add_argument("--lambda-latency", default="lognormal:30:150")
+    parser.add_argument("--lambda-throttle", type=float, default=0.0)
+    parser.add_argument("--streaming", action="store_true", help="05: use the streaming Bedrock path")
+    parser.add_argument("--hedge-percentile", type=float, default=0.0, help="05: hedge Bedrock calls slower than this")
+    parser.add_argument("--hedge-min-ms", type=float, default=2000.0)
+    parser.add_argument("--save-baseline", help="write the report as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare against a saved baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    handler, fakes = load_target(args.target, args)
+    requests = load_requests(args.requests) if args.requests else synthetic_requests(args.synthetic, args.seed)
+    events = [to_event(args.target, r) for r in requests] * args.repeat
+
+    # Handlers print per request; keep the cost but not the noise
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for fake in fakes.values():
+            fake.reset()
+        report = {"target": args.target, **run_load(handler, events, args.concurrency)}
+        # fake_calls covers the measured run only, not the allocation rerun below
+        report["fake_calls"] = {name: dict(fake.calls) for name, fake in fakes.items()}
+        report["alloc_peak_kib_per_request"] = measure_allocations(handler, events)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
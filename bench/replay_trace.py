@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Replays a recorded 05 agent trace offline and prints the per-iteration cost.
+
+Record a session by deploying (or running) the router with TRACE_MODE=record;
+each session is written to TRACE_DIR/<session_id>.json. Then:
+
+    python -m bench.replay_trace /tmp/traces/<session_id>.json
+    python -m bench.replay_trace trace.json --repeat 50   # average over 50 replays
+"""
+import argparse, contextlib, importlib.util, json, os, sys
+from pathlib import Path
+
+from bench.loadtest import ENV, REPO, TARGETS
+
+
+def load_router(trace_file: str):
+    folder, module_name = TARGETS["05"]
+    path = REPO / folder
+    for key, value in ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.update(TRACE_MODE="replay", TRACE_FILE=trace_file)
+    sys.path.insert(0, str(path))
+    spec = importlib.util.spec_from_file_location("bench_replay_router", path / f"{module_name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="trace JSON written in TRACE_MODE=record")
+    parser.add_argument("--repeat", type=int, default=1, help="replay N times and average the phases")
+    args = parser.parse_args(argv)
+
+    goal = json.loads(Path(args.trace).read_text())["goal"]
+    router = load_router(args.trace)
+    from tracing import PHASES
+    event = {"resource": "/agent", "body": json.dumps({"goal": goal})}
+
+    runs = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(args.repeat):
+            response = router.handler(event, None)
+            body = json.loads(response["body"])
+            if response["statusCode"] != 200:
+                break
+            runs.append(body["profile"])
+    if not runs:
+        print(f"Replay failed: {body.get('error')}")
+        return 1
+
+    print(f"{'iter':>4} " + " ".join(f"{p:>12}" for p in PHASES))
+    for i, it in enumerate(runs[0]["iterations"]):
+        means = [sum(r["iterations"][i][p] for r in runs) / len(runs) for p in PHASES]
+        print(f"{it['iteration']:>4} " + " ".join(f"{m:>12.3f}" for m in means))
+    totals = [sum(r["totals"][p] for r in runs) / len(runs) for p in PHASES]
+    print(f"{'all':>4} " + " ".join(f"{t:>12.3f}" for t in totals))
+    if runs[0]["divergences"]:
+        print(f"WARNING {runs[0]['divergences']} step(s) diverged from the recording")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import os, subprocess, sys
+
+REFERENCE_BOTO3_MS = 200  # `import boto3` on the machine the handler budgets were set on
+
+
+def import_time_us(module: str, cwd, env: dict = None, runs: int = 3):
+    """
+    Best-of-`runs` cumulative `python -X importtime` cost of `module` (microseconds),
+    imported from `cwd` as Lambda would import the handler, with its full timing table.
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", **(env or {}))
+    tables = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, env=env, capture_output=True, text=True, check=True,
+        )
+        tables.append({
+            line.split("|")[2].strip(): int(line.split("|")[1])
+            for line in proc.stderr.splitlines()
+            if line.startswith("import time:") and line.split("|")[1].strip().isdigit()
+        })
+    best = min(tables, key=lambda t: t[module])
+    return best[module], best
+
+
+def assert_import_budget(module: str, cwd, budget_ms: float, env: dict = None):
+    """
+    Handler import stays under its own budget and leaves boto3 to first use.
+    Budgets are for a machine where `import boto3` takes REFERENCE_BOTO3_MS;
+    on a slower or busier runner they are stretched by the same factor, never tightened.
+    """
+    # Interleave with the boto3 reference so both see the same machine load
+    samples = [(import_time_us(module, cwd, env), import_time_us("boto3", cwd)[0]) for _ in range(2)]
+    (module_us, timings), boto3_us = min(samples, key=lambda s: s[0][0] / s[1])
+    allowed_us = budget_ms * 1000 * max(1.0, boto3_us / (REFERENCE_BOTO3_MS * 1000))
+    assert "boto3" not in timings, f"{module} imports boto3 at module load"
+    assert module_us < allowed_us, (
+        f"{module} imports in {module_us / 1000:.1f} ms, budget {allowed_us / 1000:.1f} ms "
+        f"({budget_ms} ms scaled for boto3 at {boto3_us / 1000:.0f} ms)"
+    )